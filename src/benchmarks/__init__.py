@@ -0,0 +1 @@
+from .suite import BENCHMARKS, run_benchmarks, compare_results
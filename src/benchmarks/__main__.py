@@ -0,0 +1,50 @@
+import argparse
+import json
+import platform
+import sys
+import time
+from .suite import BENCHMARKS, run_benchmarks, compare_results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Throughput benchmarks for the dungeon RL pipeline.")
+    parser.add_argument("names", nargs="*", help=f"benchmarks to run (default: all of {', '.join(BENCHMARKS)})")
+    parser.add_argument("--output", help="write results to this JSON file")
+    parser.add_argument("--compare", help="baseline JSON file to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.1, help="allowed slowdown before flagging a regression")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--quick", action="store_true", help="smaller workloads for smoke runs")
+    args = parser.parse_args()
+
+    unknown = set(args.names) - set(BENCHMARKS)
+    if unknown:
+        parser.error(f"unknown benchmarks: {', '.join(sorted(unknown))}")
+
+    results = run_benchmarks(args.names, quick=args.quick, repeat=args.repeat)
+
+    if args.output:
+        report = {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "quick": args.quick,
+            "results": results,
+        }
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Results saved to: {args.output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)["results"]
+        comparison = compare_results(results, baseline, args.tolerance)
+        print(f"\n{'benchmark':28s} {'baseline':>14s} {'current':>14s} {'ratio':>7s}")
+        for name, (baseline_rate, rate, ratio, regressed) in comparison.items():
+            flag = "  REGRESSION" if regressed else ""
+            print(f"{name:28s} {baseline_rate:14,.1f} {rate:14,.1f} {ratio:7.2f}{flag}")
+        if any(regressed for *_, regressed in comparison.values()):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""Episodes, environment steps and wall time until the greedy policy solves the dungeon.
+
+Compares plain Q-learning with the Q(lambda) variants. Run from ``src/``::
+
+    python -m benchmarks.convergence --seeds 0 1 2 --output convergence.json
+"""
+import argparse
+import json
+import time
+import numpy as np
+from core.config import make_config
+
+VARIANTS = {
+    "q_learning": {},
+    "watkins": {"TRACE_MODE": "watkins"},
+    "peng": {"TRACE_MODE": "peng"},
+}
+
+
+def time_to_convergence(overrides, seed=0, max_episodes=20000, max_env_steps=2_000_000, check_interval=250,
+                        max_steps=500):
+    """Trains until a greedy rollout from the start reaches the goal; evaluation time is not counted.
+
+    Gives up after ``max_episodes`` or ``max_env_steps``, whichever comes first.
+    """
+    from core.trainer import Trainer
+    from core.evaluation import evaluate_agent
+
+    config = make_config(MAX_EPISODES=max_episodes, SEED=seed, SAVE_RESULTS=False, GENERATE_PLOTS=False,
+                         **overrides)
+    trainer = Trainer(config, verbose=False)
+    steps = 0
+    wall_time = 0.0
+    for episode in range(max_episodes):
+        start = time.perf_counter()
+        _, _, episode_steps = trainer.run_episode()
+        wall_time += time.perf_counter() - start
+        steps += episode_steps
+
+        if (episode + 1) % check_interval == 0:
+            result = evaluate_agent(trainer.agent, episodes=1, max_steps=max_steps)
+            if result["success_rate"] == 1.0:
+                return {"converged": True, "episodes": episode + 1, "steps": steps, "wall_time": wall_time,
+                        "path_length_ratio": result["path_length_ratio"]}
+        if steps >= max_env_steps:
+            break
+    return {"converged": False, "episodes": episode + 1, "steps": steps, "wall_time": wall_time,
+            "path_length_ratio": None}
+
+
+def run(variants, agent_types, seeds, storage="dense", trace_lambda=0.5, log=print, **kwargs):
+    results = {}
+    for agent_type in agent_types:
+        for variant in variants:
+            overrides = dict(VARIANTS[variant], AGENT_TYPE=agent_type, Q_TABLE_STORAGE=storage)
+            if variant != "q_learning":
+                overrides["TRACE_LAMBDA"] = trace_lambda
+            runs = [time_to_convergence(overrides, seed=seed, **kwargs) for seed in seeds]
+            name = f"{agent_type.lower()}_{variant}"
+            results[name] = {
+                "runs": runs,
+                "converged": sum(r["converged"] for r in runs),
+                "mean_episodes": float(np.mean([r["episodes"] for r in runs])),
+                "mean_steps": float(np.mean([r["steps"] for r in runs])),
+                "mean_wall_time": float(np.mean([r["wall_time"] for r in runs])),
+            }
+            result = results[name]
+            log(f"{name:22s} {result['converged']}/{len(runs)} {result['mean_episodes']:10,.0f} "
+                f"{result['mean_steps']:12,.0f} {result['mean_wall_time']:9.1f}s")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Episodes and wall time to a converged greedy policy.")
+    parser.add_argument("--variants", nargs="+", choices=list(VARIANTS), default=list(VARIANTS))
+    parser.add_argument("--agent-types", nargs="+", choices=["Agent", "AgentV2"], default=["Agent", "AgentV2"])
+    parser.add_argument("--seeds", nargs="+", type=int, default=[0, 1, 2])
+    parser.add_argument("--storage", choices=["dict", "dense"], default="dense")
+    parser.add_argument("--lambda", dest="trace_lambda", type=float, default=0.5)
+    parser.add_argument("--max-episodes", type=int, default=20000)
+    parser.add_argument("--max-env-steps", type=int, default=2_000_000)
+    parser.add_argument("--check-interval", type=int, default=250, help="episodes between greedy evaluations")
+    parser.add_argument("--output", help="write results to this JSON file")
+    args = parser.parse_args()
+
+    print(f"{'variant':22s} {'conv':>3s} {'episodes':>10s} {'env steps':>12s} {'train time':>10s}")
+    results = run(args.variants, args.agent_types, args.seeds, storage=args.storage, trace_lambda=args.trace_lambda,
+                  max_episodes=args.max_episodes, max_env_steps=args.max_env_steps, check_interval=args.check_interval)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"), "seeds": args.seeds, "results": results},
+                      f, indent=2)
+        print(f"Results saved to: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,207 @@
+import os
+import subprocess
+import sys
+import time
+import numpy as np
+from core.config import make_config
+
+BENCHMARKS = {}
+
+
+def benchmark(name, unit):
+    def register(fn):
+        BENCHMARKS[name] = (fn, unit)
+        return fn
+    return register
+
+
+def _best_rate(fn, operations, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return operations / best
+
+
+def _random_actions(count, seed=0):
+    return np.random.default_rng(seed).integers(0, 4, size=count).tolist()
+
+
+def _sample_states(count, seed=0):
+    from core import DungeonEnv
+
+    env = DungeonEnv()
+    state = env.reset()
+    states = []
+    for action in _random_actions(count, seed):
+        next_state, reward, done, terminated, _ = env.step(action)
+        states.append((state, action, reward, next_state, done or terminated))
+        state = env.reset() if done or terminated else next_state
+    return states
+
+
+@benchmark("env_step", "steps/s")
+def bench_env_step(quick=False, repeat=3):
+    from core import DungeonEnv
+
+    env = DungeonEnv()
+    actions = _random_actions(20_000 if quick else 200_000)
+
+    def run():
+        env.reset()
+        for action in actions:
+            _, _, done, terminated, _ = env.step(action)
+            if done or terminated:
+                env.reset()
+
+    return _best_rate(run, len(actions), repeat)
+
+
+@benchmark("env_reset", "resets/s")
+def bench_env_reset(quick=False, repeat=3):
+    from core import DungeonEnv
+
+    env = DungeonEnv()
+    count = 20_000 if quick else 200_000
+
+    def run():
+        for _ in range(count):
+            env.reset()
+
+    return _best_rate(run, count, repeat)
+
+
+def _agent_benchmarks(agent_type, storage):
+    from core.trainer import make_agent
+
+    def get_action(quick=False, repeat=3):
+        transitions = _sample_states(10_000 if quick else 100_000)
+        agent = make_agent(make_config(AGENT_TYPE=agent_type, Q_TABLE_STORAGE=storage))
+        states = [t[0] for t in transitions]
+
+        def run():
+            for state in states:
+                agent.choose_action(state)
+
+        return _best_rate(run, len(states), repeat)
+
+    def update_policy(quick=False, repeat=3):
+        transitions = _sample_states(10_000 if quick else 100_000)
+        agent = make_agent(make_config(AGENT_TYPE=agent_type, Q_TABLE_STORAGE=storage))
+        for state, *_ in transitions:
+            agent.choose_action(state)
+
+        def run():
+            for state, action, reward, next_state, finished in transitions:
+                agent.learn(state, action, reward, next_state, False)
+
+        return _best_rate(run, len(transitions), repeat)
+
+    benchmark(f"{agent_type.lower()}_{storage}_get_action", "ops/s")(get_action)
+    benchmark(f"{agent_type.lower()}_{storage}_update_policy", "ops/s")(update_policy)
+
+
+for _agent_type in ("Agent", "AgentV2"):
+    for _storage in ("dict", "dense"):
+        _agent_benchmarks(_agent_type, _storage)
+
+
+@benchmark("train_loop", "episodes/s")
+def bench_train_loop(quick=False, repeat=3):
+    from core.trainer import Trainer
+
+    episodes = 500 if quick else 3000
+
+    def run():
+        config = make_config(MAX_EPISODES=episodes, SEED=0, SAVE_RESULTS=False, RENDERING_ENABLED=False)
+        Trainer(config, verbose=False).run()
+
+    return _best_rate(run, episodes, repeat)
+
+
+@benchmark("train_loop_fused", "episodes/s")
+def bench_train_loop_fused(quick=False, repeat=3):
+    from core.trainer import Trainer
+
+    episodes = 500 if quick else 3000
+
+    def run():
+        config = make_config(MAX_EPISODES=episodes, SEED=0, SAVE_RESULTS=False, RENDERING_ENABLED=False,
+                             Q_TABLE_STORAGE="dense", FUSED_TRAINING=True)
+        Trainer(config, verbose=False).run()
+
+    return _best_rate(run, episodes, repeat)
+
+
+HEAVY_MODULES = ("pygame", "matplotlib", "seaborn", "gymnasium", "scipy")
+STARTUP_SCRIPT = """
+import sys
+from core import DungeonEnv, Agent, AgentV2, FrozenPolicy
+from core.trainer import Trainer
+from core.sweep import run_trial
+from core.evaluation import evaluate_agent
+print(",".join(sorted({name.split(".")[0] for name in sys.modules} & set(sys.argv[1:]))))
+"""
+
+
+@benchmark("startup_headless", "starts/s")
+def bench_startup_headless(quick=False, repeat=3):
+    # a fresh interpreter per run, like a sweep or evaluation worker
+    src_path = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    command = [sys.executable, "-c", STARTUP_SCRIPT, *HEAVY_MODULES]
+
+    def run():
+        result = subprocess.run(command, cwd=src_path, capture_output=True, text=True, check=True)
+        if result.stdout.strip():
+            raise RuntimeError(f"Headless startup imported {result.stdout.strip()}")
+
+    return _best_rate(run, 1, repeat if quick else 2 * repeat)
+
+
+@benchmark("renderer_draw_grid", "frames/s")
+def bench_renderer_draw_grid(quick=False, repeat=3):
+    os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+    from core import DungeonEnv
+    from core.renderer import Renderer
+
+    env = DungeonEnv()
+    env.reset()
+    grids = []
+    for action in _random_actions(100 if quick else 1000):
+        _, _, done, terminated, _ = env.step(action)
+        grids.append(env.grid)
+        if done or terminated:
+            env.reset()
+
+    renderer = Renderer()
+    renderer.ticks_per_second = 0
+
+    def run():
+        for grid in grids:
+            renderer.draw_grid(grid)
+
+    return _best_rate(run, len(grids), repeat)
+
+
+def run_benchmarks(names=None, quick=False, repeat=3, log=print):
+    results = {}
+    for name, (fn, unit) in BENCHMARKS.items():
+        if names and name not in names:
+            continue
+        rate = fn(quick=quick, repeat=repeat)
+        results[name] = {"rate": rate, "unit": unit}
+        log(f"{name:28s} {rate:14,.1f} {unit}")
+    return results
+
+
+def compare_results(results, baseline, tolerance=0.1):
+    """Returns {name: (baseline_rate, rate, ratio, regressed)} for benchmarks present in both."""
+    comparison = {}
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        baseline_rate = baseline[name]["rate"]
+        ratio = result["rate"] / baseline_rate if baseline_rate else float("inf")
+        comparison[name] = (baseline_rate, result["rate"], ratio, ratio < 1 - tolerance)
+    return comparison
@@ -1,4 +1,26 @@
-from .renderer import Renderer
-from .agent import Agent, AgentV2
-from .dungeon_env import DungeonEnv
-# from .visualizer import visualize_reward_history, PolicyVisualizer
\ No newline at end of file
+import importlib
+
+# name -> submodule; loaded on first access so headless workers never import pygame or matplotlib
+_EXPORTS = {
+    "Renderer": ".renderer",
+    "Agent": ".agent",
+    "AgentV2": ".agent",
+    "load_agent": ".agent",
+    "DungeonEnv": ".dungeon_env",
+    "VecDungeonEnv": ".dungeon_env",
+    "FrozenPolicy": ".frozen_policy",
+}
+
+__all__ = list(_EXPORTS)
+
+
+def __getattr__(name):
+    if name not in _EXPORTS:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(_EXPORTS[name], __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
@@ -1,53 +1,223 @@
 from .policy import Policy
+from .q_table import DenseQTable, QTableStack, StateEncoder
+from .frozen_policy import FrozenPolicy
+from .config import EnvConfig as envcfg
+from .config import LearningConfig as cfg
+from . import qtable_io
+import operator
 import pickle
 
+
+MASK_BITS = tuple(1 << i for i in range(64))
+
+
+def _save_q_table(path, save_format, save_binary, pickled):
+    if save_format not in ("binary", "pickle", "both"):
+        raise ValueError(f"Invalid Q-table format: {save_format}")
+    if save_format in ("binary", "both"):
+        save_binary(f"{path}{qtable_io.EXTENSION}")
+    if save_format in ("pickle", "both"):
+        with open(f"{path}.pkl", 'wb') as f:
+            pickle.dump(pickled(), f)
+
+
 class Agent:
-    def __init__(self, q_table=None):
-        if q_table is not None:
-            self.policy = Policy(q_table=q_table)
-        else:
-            self.policy = Policy()
+    STATE_SHAPE = (*envcfg.GRID_SIZE, 2, 2)
+
+    def __init__(self, q_table=None, storage=None, config=cfg, state_shape=None):
+        self.save_format = config.Q_TABLE_FORMAT
+        self.policy = Policy.from_config(config, q_table=q_table, storage=storage,
+                                         state_shape=state_shape or self.STATE_SHAPE)
+
+    def load_q_table(self, q_table):
+        self.policy.load_q_table(q_table)
 
     def choose_action(self, state):
         return self.policy.get_action(state)
 
+    def greedy_action(self, state):
+        return self.policy.greedy_action(state)
+
     def learn(self, state, action, reward, next_state, update_epsilon):
         self.policy.update_policy(state, action, reward, next_state, update_epsilon)
     
+    def freeze(self):
+        return FrozenPolicy.from_agent(self)
+
     def save(self, experiment_path=None):
         if experiment_path:
-            with open(f"{experiment_path}/q_table.pkl", 'wb') as f:
-                pickle.dump(self.policy.q_table, f)
+            policy = self.policy
+            _save_q_table(f"{experiment_path}/q_table", self.save_format,
+                          lambda path: qtable_io.save_q_table(path, policy.q_table, policy.encoder),
+                          lambda: {"state_shape": policy.encoder.dims, "q_table": policy.q_table_dict()})
 
 
 class AgentV2:
-    def __init__(self, q_table=None):
-        self.policies = [Policy(q_table=q) for q in q_table] if q_table is not None else [Policy() for _ in range(3)]
-
-    def select_policy(self, c1, c2):
-        if not (c1 or c2):
-            return self.policies[0]
-        elif c1 and not c2:
-            return self.policies[1]
-        elif c1 and c2:
-            return self.policies[2]
-        else:
-            raise ValueError("Invalid state: {} {}".format(c1, c2))
+    """One Q-table over positions per carry mask, bit ``i`` set while the i-th key is carried.
+
+    Tables are created the first time their mask is seen, so memory grows
+    with the carry states actually visited. With dense storage they are
+    slots of one ``QTableStack`` indexed by (slot, position, action).
+    """
+    STATE_SHAPE = (*envcfg.GRID_SIZE, 2, 2)
+
+    def __init__(self, q_table=None, storage=None, config=cfg, state_shape=None):
+        self.config = config
+        self.save_format = config.Q_TABLE_FORMAT
+        self.storage = storage or config.Q_TABLE_STORAGE
+        state_shape = state_shape or self.STATE_SHAPE
+        self.position_shape = tuple(state_shape[:2])
+        self.num_keys = len(state_shape) - 2
+        self.initial_epsilon = config.EPSILON if q_table is None else 0.0
+
+        self.stack = None
+        if self.storage == "dense":
+            if isinstance(q_table, QTableStack):
+                # adopted as is, so memory-mapped tables stay mapped
+                self.stack = q_table
+            else:
+                self.stack = QTableStack(StateEncoder(self.position_shape), config.ACTION_SPACE_SIZE,
+                                         dtype=config.Q_TABLE_DTYPE)
+        self.masks = []
+        self.policies = []
+        self._policies = {}
+        self._flag_policies = {}
+        if self.stack is not None:
+            for mask in list(self.stack.masks):
+                self.policy_for_mask(mask)
+        if q_table is not None and q_table is not self.stack:
+            self.load_q_table(q_table)
+        self.policy_for_mask(0)
+
+    def policy_for_mask(self, mask):
+        policy = self._policies.get(mask)
+        if policy is None:
+            policy = self._add_policy(mask)
+        return policy
+
+    def _add_policy(self, mask):
+        mask = int(mask)
+        q_table = None
+        if self.stack is not None:
+            capacity = len(self.stack.values)
+            slot = self.stack.add(mask)
+            if len(self.stack.values) != capacity:
+                # the stack moved to larger arrays
+                for i, other in enumerate(self.policies):
+                    other.q_table = self.stack.table(i)
+            q_table = self.stack.table(slot)
+        policy = Policy.from_config(self.config, q_table=q_table, storage=self.storage,
+                                    state_shape=self.position_shape)
+        policy.epsilon = self.initial_epsilon
+        self.masks.append(mask)
+        self.policies.append(policy)
+        self._policies[mask] = policy
+        return policy
+
+    def load_q_table(self, q_table):
+        """Loads {mask: table}, a ``QTableStack``, or a list with one table per number of keys carried."""
+        if isinstance(q_table, QTableStack):
+            q_table = {mask: q_table.table(slot) for slot, mask in enumerate(q_table.masks)}
+        elif isinstance(q_table, (list, tuple)):
+            if len(q_table) != self.num_keys + 1:
+                raise ValueError(f"Expected {self.num_keys + 1} Q-tables, one per number of keys, "
+                                 f"got {len(q_table)}.")
+            q_table = {mask: q_table[bin(mask).count("1")] for mask in range(1 << self.num_keys)}
+
+        for mask, q in q_table.items():
+            policy = self.policy_for_mask(int(mask))
+            if self.stack is not None:
+                self.stack.load(self.stack.slots[int(mask)], q)
+            else:
+                policy.load_q_table(q.to_dict() if isinstance(q, DenseQTable) else dict(q))
+
+    def select_policy(self, *flags):
+        mask = sum(map(operator.mul, flags, MASK_BITS))
+        policy = self._policies.get(mask)
+        if policy is None:
+            policy = self._add_policy(mask)
+        return policy
+
+    def _flags_policy(self, flags):
+        # observations repeat the same few flag tuples, so their policies are cached by tuple
+        policy = self._flag_policies[flags] = self.select_policy(*flags)
+        return policy
 
     def choose_action(self, state):
-        x, y, c1, c2 = state
-        policy = self.select_policy(c1, c2)
-        return policy.get_action((x, y))
+        flags = tuple(state[2:])
+        policy = self._flag_policies.get(flags) or self._flags_policy(flags)
+        return policy.get_action((state[0], state[1]))
+
+    def greedy_action(self, state):
+        # carry masks without a table yet act like unseen states instead of getting one
+        policy = self._policies.get(sum(map(operator.mul, state[2:], MASK_BITS)))
+        return policy.greedy_action((state[0], state[1])) if policy is not None else 0
 
     def learn(self, state, action, reward, next_state, update_epsilon):
-        x, y, c1, c2 = state
-        next_x, next_y, _, _ = next_state
-        policy = self.select_policy(c1, c2)
-        policy.update_policy((x, y), action, reward, (next_x, next_y), update_epsilon)
+        flags = tuple(state[2:])
+        policy = self._flag_policies.get(flags) or self._flags_policy(flags)
+        policy.update_policy((state[0], state[1]), action, reward, (next_state[0], next_state[1]), update_epsilon)
+        if update_epsilon:
+            # traces are per episode, also in the tables of the carry states left behind
+            for other in self.policies:
+                other.reset_traces()
+
+    def freeze(self):
+        return FrozenPolicy.from_agent(self)
+
+    def _dense_stack(self):
+        if self.stack is not None:
+            return self.stack
+        stack = QTableStack(StateEncoder(self.position_shape), self.config.ACTION_SPACE_SIZE,
+                            dtype=self.config.Q_TABLE_DTYPE)
+        for mask, policy in zip(self.masks, self.policies):
+            stack.load(stack.add(mask), policy.q_table)
+        return stack
 
     def save(self, experiment_path=None):
         if experiment_path:
-            for i, policy in enumerate(self.policies):
-                with open(f"{experiment_path}/q_table_policy_{i}.pkl", 'wb') as f:
-                    pickle.dump(policy.q_table, f)
+            _save_q_table(f"{experiment_path}/q_table_stack", self.save_format,
+                          lambda path: qtable_io.save_stack(path, self._dense_stack(), self.num_keys),
+                          lambda: {"num_keys": self.num_keys, "position_shape": self.position_shape,
+                                   "q_tables": {mask: policy.q_table_dict()
+                                                for mask, policy in zip(self.masks, self.policies)}})
+
+
+def load_agent(experiment_path, storage=None, mmap=True, config=cfg):
+    """Agent or AgentV2 from the Q-table files of an experiment.
+
+    Binary tables are memory-mapped and kept dense unless another
+    ``storage`` is requested; the state shape comes from their header,
+    or from the payload of a pickle. Pickles written before the shape was
+    stored get it from the states they hold.
+    Older AgentV2 runs saved one file per number of keys carried, those
+    tables are loaded into every mask with that many keys.
+    """
+    paths = qtable_io.q_table_paths(experiment_path)
+    if not paths:
+        raise FileNotFoundError(f"No Q-table files found in {experiment_path}.")
+
+    q_tables = [qtable_io.read_q_table(path, mmap=mmap) for path in paths]
+    first = q_tables[0]
+    if isinstance(first, QTableStack):
+        num_keys = qtable_io.read_header(paths[0])["num_keys"]
+        return AgentV2(q_table=first, storage=storage or "dense", config=config,
+                       state_shape=first.encoder.dims + (2,) * num_keys)
+    if qtable_io.is_stack_dict(first):
+        position_shape = first.get("position_shape") or qtable_io.infer_encoder(
+            {state: None for q_table in first["q_tables"].values() for state in q_table}).dims
+        return AgentV2(q_table=first["q_tables"], storage=storage, config=config,
+                       state_shape=tuple(position_shape) + (2,) * first["num_keys"])
+    if qtable_io.is_table_dict(first):
+        return Agent(q_table=first["q_table"], storage=storage, config=config,
+                     state_shape=tuple(first["state_shape"]))
 
+    if isinstance(first, DenseQTable):
+        storage = storage or "dense"
+        state_shape = first.encoder.dims
+    else:
+        state_shape = qtable_io.infer_encoder({state: None for q_table in q_tables for state in q_table}).dims
+    if len(q_tables) == 1:
+        return Agent(q_table=first, storage=storage, config=config, state_shape=state_shape)
+    state_shape = state_shape[:2] + (2,) * (len(q_tables) - 1)
+    return AgentV2(q_table=q_tables, storage=storage, config=config, state_shape=state_shape)
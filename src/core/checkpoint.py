@@ -0,0 +1,248 @@
+import json
+import os
+import queue
+import random
+import shutil
+import threading
+import numpy as np
+from . import qtable_io
+from .metrics import RollingStats
+from .q_table import DenseQTable
+
+LATEST = "LATEST"
+
+
+def agent_policies(agent):
+    return agent.policies if hasattr(agent, 'policies') else [agent.policy]
+
+
+def config_values(config):
+    return {name: getattr(config, name) for name in dir(config) if name.isupper()}
+
+
+def snapshot(trainer, episodes):
+    """Copies everything a run needs to continue after ``episodes`` episodes.
+
+    Runs on the training thread; the copies are written later by
+    ``CheckpointWriter`` so training can keep mutating the originals.
+    """
+    policies = []
+    masks = getattr(trainer.agent, 'masks', [None])
+    for mask, policy in zip(masks, agent_policies(trainer.agent)):
+        q_table = policy.q_table
+        if isinstance(q_table, DenseQTable):
+            q_table = DenseQTable.from_arrays(q_table.encoder, q_table.values.copy(), q_table.visited.copy())
+        else:
+            q_table = DenseQTable.from_dict(q_table, policy.encoder, policy.action_space_size)
+        policies.append({
+            "mask": mask,
+            "q_table": q_table,
+            "epsilon": policy.epsilon,
+            "current_episode": policy.current_episode,
+            "planner": policy.planner.state() if policy.planner is not None else None,
+        })
+
+    np_state = np.random.get_state()
+    return {
+        "episodes": episodes,
+        "config": config_values(trainer.config),
+        "python_random_state": random.getstate(),
+        "numpy_random_state": np_state,
+        "policies": policies,
+        "reward_stats": trainer.reward_stats.state(),
+        "success_stats": trainer.success_stats.state(),
+        "convergence": trainer.convergence.state() if trainer.convergence else None,
+    }
+
+
+def write_checkpoint(checkpoint_dir, state, keep=1):
+    name = f"episode_{state['episodes']:07d}"
+    path = os.path.join(checkpoint_dir, name)
+    os.makedirs(path, exist_ok=True)
+
+    for i, policy in enumerate(state["policies"]):
+        q_table = policy["q_table"]
+        # keep the training dtype so a resumed run continues bit-for-bit
+        qtable_io.save_q_table(os.path.join(path, f"q_table_{i}{qtable_io.EXTENSION}"), q_table,
+                               dtype=q_table.values.dtype)
+
+    algorithm, keys, position, has_gauss, cached_gaussian = state["numpy_random_state"]
+    np.save(os.path.join(path, "numpy_random_keys.npy"), keys)
+    for i, policy in enumerate(state["policies"]):
+        if policy["planner"] is not None:
+            arrays = {name: value for name, value in policy["planner"].items() if name != "rng"}
+            np.savez(os.path.join(path, f"planner_{i}.npz"), **arrays)
+
+    convergence = state.get("convergence")
+    if convergence is not None:
+        if convergence["previous"] is not None:
+            values, visited = convergence["previous"]
+            np.savez(os.path.join(path, "convergence.npz"), values=values, visited=visited)
+        convergence = {name: value for name, value in convergence.items() if name != "previous"}
+
+    version, internal_state, gauss_next = state["python_random_state"]
+    meta = {
+        "episodes": state["episodes"],
+        "config": state["config"],
+        "policies": [
+            {
+                "mask": policy["mask"],
+                "epsilon": policy["epsilon"],
+                "current_episode": policy["current_episode"],
+                "planner_rng": policy["planner"]["rng"] if policy["planner"] is not None else None,
+            }
+            for policy in state["policies"]
+        ],
+        "reward_stats": state["reward_stats"],
+        "success_stats": state["success_stats"],
+        "convergence": convergence,
+        "numpy_random_state": [algorithm, int(position), int(has_gauss), float(cached_gaussian)],
+        "python_random_state": [version, list(internal_state), gauss_next],
+    }
+    with open(os.path.join(path, "meta.json"), "w") as f:
+        json.dump(meta, f)
+
+    # the pointer is replaced atomically, so a crash mid-write leaves the previous checkpoint usable
+    pointer = os.path.join(checkpoint_dir, LATEST)
+    with open(f"{pointer}.tmp", "w") as f:
+        f.write(name)
+    os.replace(f"{pointer}.tmp", pointer)
+
+    # prune in write order: after a resume, checkpoints with higher episode numbers can be older than this one
+    older = sorted((d for d in os.listdir(checkpoint_dir) if d.startswith("episode_") and d != name),
+                   key=lambda d: (_written_at(os.path.join(checkpoint_dir, d)), d))
+    for old in older[:max(0, len(older) + 1 - keep)]:
+        shutil.rmtree(os.path.join(checkpoint_dir, old), ignore_errors=True)
+    return path
+
+
+def _written_at(path):
+    # meta.json is written last, a checkpoint without one was never completed
+    meta_path = os.path.join(path, "meta.json")
+    return os.stat(meta_path if os.path.exists(meta_path) else path).st_mtime_ns
+
+
+def latest_checkpoint(path):
+    """Checkpoint directory for an experiment, its ``checkpoints`` directory or a checkpoint itself."""
+    if os.path.exists(os.path.join(path, "meta.json")):
+        return path
+    for checkpoint_dir in (os.path.join(path, "checkpoints"), path):
+        pointer = os.path.join(checkpoint_dir, LATEST)
+        if os.path.exists(pointer):
+            with open(pointer) as f:
+                return os.path.join(checkpoint_dir, f.read().strip())
+    raise FileNotFoundError(f"No checkpoint found in {path}.")
+
+
+def read_checkpoint(path):
+    path = latest_checkpoint(path)
+    with open(os.path.join(path, "meta.json")) as f:
+        meta = json.load(f)
+
+    keys = np.load(os.path.join(path, "numpy_random_keys.npy"))
+    algorithm, position, has_gauss, cached_gaussian = meta["numpy_random_state"]
+    version, internal_state, gauss_next = meta["python_random_state"]
+    policies = []
+    for i, policy in enumerate(meta["policies"]):
+        planner = None
+        if policy.get("planner_rng") is not None:
+            with np.load(os.path.join(path, f"planner_{i}.npz")) as data:
+                planner = {name: data[name] for name in data.files}
+            planner["rng"] = policy["planner_rng"]
+        policies.append(dict(
+            policy,
+            q_table=qtable_io.load_q_table(os.path.join(path, f"q_table_{i}{qtable_io.EXTENSION}"), mmap=False),
+            planner=planner,
+        ))
+
+    convergence = meta.get("convergence")
+    if convergence is not None:
+        previous_path = os.path.join(path, "convergence.npz")
+        previous = None
+        if os.path.exists(previous_path):
+            with np.load(previous_path) as data:
+                previous = data["values"], data["visited"]
+        convergence = dict(convergence, previous=previous)
+
+    return {
+        "episodes": meta["episodes"],
+        "config": meta["config"],
+        "python_random_state": (version, tuple(internal_state), gauss_next),
+        "numpy_random_state": (algorithm, keys, position, has_gauss, cached_gaussian),
+        "policies": policies,
+        "reward_stats": meta["reward_stats"],
+        "success_stats": meta["success_stats"],
+        "convergence": convergence,
+    }
+
+
+def restore(trainer, state):
+    agent = trainer.agent
+    for i, saved in enumerate(state["policies"]):
+        q_table = saved["q_table"]
+        if hasattr(agent, 'policies'):
+            # checkpoints without masks held one table per number of keys
+            mask = saved.get("mask", (1 << i) - 1)
+            policy = agent.policy_for_mask(mask)
+        else:
+            policy = agent.policy
+        if policy.storage == "dense" and q_table.values.dtype != np.dtype(policy.dtype):
+            raise ValueError(f"Checkpoint Q-table is {q_table.values.dtype}, the run uses {policy.dtype}.")
+        if hasattr(agent, 'policies'):
+            agent.load_q_table({mask: q_table})
+        elif policy.storage == "dense":
+            policy.q_table = q_table
+        else:
+            policy.q_table = q_table.to_dict()
+        policy.epsilon = saved["epsilon"]
+        policy.current_episode = saved["current_episode"]
+        if policy.planner is not None and saved["planner"] is not None:
+            policy.planner.load_state(saved["planner"])
+
+    trainer.reward_stats = RollingStats.from_state(state["reward_stats"])
+    trainer.success_stats = RollingStats.from_state(state["success_stats"])
+    trainer.start_episode = state["episodes"]
+    # checkpoints written before the monitor state was saved start the checks over
+    if trainer.convergence is not None and state.get("convergence") is not None:
+        trainer.convergence.load_state(state["convergence"])
+
+    random.setstate(state["python_random_state"])
+    np.random.set_state(state["numpy_random_state"])
+
+
+class CheckpointWriter:
+    """Writes checkpoint snapshots on a background thread, like ``EpisodeRecorder`` writes frames."""
+
+    def __init__(self, checkpoint_dir, keep=1, max_pending=1):
+        self.checkpoint_dir = checkpoint_dir
+        self.keep = keep
+        os.makedirs(checkpoint_dir, exist_ok=True)
+
+        # a snapshot holds full Q-table copies, so at most one waits behind the one being written
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._errors = []
+        self._writer = threading.Thread(target=self._write_loop, daemon=True)
+        self._writer.start()
+
+    def submit(self, state):
+        self._raise_errors()
+        self._queue.put(state)
+
+    def close(self):
+        self._queue.put(None)
+        self._writer.join()
+        self._raise_errors()
+
+    def _raise_errors(self):
+        if self._errors:
+            raise RuntimeError("Checkpoint writer failed") from self._errors[0]
+
+    def _write_loop(self):
+        while True:
+            state = self._queue.get()
+            if state is None:
+                return
+            try:
+                write_checkpoint(self.checkpoint_dir, state, keep=self.keep)
+            except Exception as e:
+                self._errors.append(e)
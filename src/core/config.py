@@ -2,10 +2,20 @@ import os
 
 
 class EnvConfig:
+    # default dungeon
     GRID_SIZE = (11, 11)
     INITIAL_AGENT_POSITION = (5, 2)
     GOAL_POSITION = (5, 0)
 
+    # other layouts: a layout file (.txt or .npz) or a generated maze
+    LAYOUT_PATH = None
+    GENERATE_LAYOUT = False
+    GENERATED_GRID_SIZE = (101, 101)
+    NUM_KEYS = 2
+    LAVA_DENSITY = 0.1
+    LAYOUT_SEED = 0
+    LAYOUT_CACHE_DIR = None
+
     LAVA = 0
     WALL = 1
     WALKABLE = 2
@@ -20,6 +30,9 @@ class EnvConfig:
 
 
 class LearningConfig:
+    AGENT_TYPE = "Agent"        # "Agent" (basic Q-learning) or "AgentV2" (one Q-table per carried key mask)
+    SEED = None
+
     MAX_EPISODES = 20000
     LEARNING_RATE = 0.02
     DISCOUNT_FACTOR = 0.99
@@ -30,18 +43,122 @@ class LearningConfig:
     RENDERING_ENABLED = False
     ACTION_SPACE_SIZE = 4
 
-    VISUALIZE_RESULTS = True
+    WARM_START = None           # None, "value_iteration" or "policy_iteration"
+
+    PLANNING_MODE = None        # None, "dyna" (Dyna-Q) or "prioritized" (prioritized sweeping)
+    PLANNING_STEPS = 10         # model updates per real step
+    PRIORITY_THRESHOLD = 1e-4   # smallest TD error queued by prioritized sweeping
+
+    TRACE_MODE = None           # None, "watkins" or "peng" Q(lambda) eligibility traces
+    TRACE_LAMBDA = 0.5
+    TRACE_CUTOFF = 0.01         # traces below this are dropped
+    TRACE_MAX_LENGTH = 1000     # pairs kept at most, for lambda * discount close to 1
+
+    FUSED_TRAINING = False      # whole episodes per kernel call; dense storage, no planning, traces or rendering
+    FUSED_BACKEND = "auto"      # "auto" (Numba when installed), "numba" or "python"
+    FUSED_BATCH_EPISODES = 1000
+
+    # actor processes step their own envs and feed a learner in the training process through
+    # shared-memory rings; dense storage, no planning, traces, fused training, rendering or profiling
+    ACTOR_PROCESSES = 0         # 0 acts and learns in one loop
+    ACTOR_BUFFER_SIZE = 1 << 16 # transitions in each actor's ring, an actor waits while its ring is full
+    ACTOR_CHUNK_SIZE = 128      # transitions an actor writes at once; it syncs its Q-tables after each chunk
+    LEARNER_BATCH_SIZE = 4096   # transitions taken from one ring at a time
+    LEARNER_PUBLISH_INTERVAL = 1024  # updates between Q-table snapshots published to the actors
+
+    Q_TABLE_STORAGE = "dict"    # "dict" or "dense"
+    Q_TABLE_DTYPE = "float64"
+    Q_TABLE_FORMAT = "binary"   # "binary" (.qtb), "pickle" or "both"
+
+    METRICS_WINDOW = 100        # episodes in the running reward/success statistics
+    METRICS_CHUNK_SIZE = 4096   # episodes buffered per chunk of metrics.dqm
+
+    # early stopping: every criterion that is not None has to hold for CONVERGENCE_PATIENCE checks in a row
+    CONVERGENCE_WINDOW = 0      # episodes between convergence checks, 0 disables early stopping
+    CONVERGENCE_PATIENCE = 3
+    CONVERGENCE_MIN_EPISODES = 0
+    CONVERGENCE_MAX_Q_CHANGE = None         # largest |Q change| since the last check
+    CONVERGENCE_MEAN_Q_CHANGE = None        # mean |Q change| over visited states
+    CONVERGENCE_MAX_POLICY_CHANGES = 0      # states whose greedy action changed
+    CONVERGENCE_MIN_SUCCESS_RATE = 1.0      # one greedy episode from the start position, stepped lazily
+
+    CHECKPOINT_INTERVAL = 1000  # episodes between checkpoints, 0 disables them
+    CHECKPOINT_KEEP = 1
+
+    PROFILING_ENABLED = False
+    PROFILE_INTERVAL = 1000
+
+    VISUALIZE_RESULTS = True    # show the final plots (only where there is a display)
+    GENERATE_PLOTS = True
+    BACKGROUND_PLOTS = True     # render plots in worker processes
+    PLOT_INTERVAL = 0           # episodes between progress plots, 0 disables them
+    PLOT_WORKERS = 1
+    PLOT_ANNOTATE_LIMIT = 400   # grid cells above which heatmaps are drawn without value labels
+    PLOT_MAX_SIZE = 256         # cells per side drawn in a plot, larger grids are downsampled
+    PLOT_TILE_SIZE = 0          # also save full-resolution value maps as tiles of this many cells, 0 disables
     SAVE_RESULTS = True
+    EXPERIMENTS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))),
+                                   "experiments")
+
+
+class SweepConfig:
+    MODE = "grid"               # "grid" or "random"
+    NUM_SAMPLES = 32            # random mode only
+    MAX_WORKERS = os.cpu_count()
+    MAX_EPISODES = LearningConfig.MAX_EPISODES
+    GENERATE_PLOTS = False
+    CONVERGENCE_WINDOW = 500    # stop trials early (criteria from LearningConfig), 0 runs every trial to MAX_EPISODES
+
+    # "full" runs every trial to MAX_EPISODES; "halving" (synchronous successive halving) and "asha"
+    # (asynchronous) run them in rungs of MIN_EPISODES * REDUCTION_FACTOR**k episodes, promoting the best
+    # 1/REDUCTION_FACTOR of each rung by moving-average reward
+    SCHEDULER = "full"
+    MIN_EPISODES = 1000         # episodes of the first rung
+    REDUCTION_FACTOR = 3
+    RESUME_FROM = "memory"      # promoted trials continue from a state sent back by the worker, or "disk" (checkpoints)
+
+    # lists are enumerated (grid) or sampled from (random), (low, high) tuples
+    # are sampled uniformly in random mode
+    SPACE = {
+        "LEARNING_RATE": [0.01, 0.02, 0.05],
+        "DISCOUNT_FACTOR": [0.95, 0.99],
+        "EPSILON_DECAY": [0.999, 0.9995],
+        "MIN_EPSILON": [0.05, 0.1],
+        "AGENT_TYPE": ["Agent", "AgentV2"],
+        "SEED": [0, 1],
+    }
 
 
 class RenderingConfig(EnvConfig):
     CELL_SIZE = 16
     UPSCALE_FACTOR = 4
     TICKS_PER_SECOND = 20
+    MAX_WINDOW_SIZE = (1280, 960)
     ASSETPATH = "assets/v2-1"
 
 
 class TestConfig:
     MAX_EPISODES = 1000
+    MAX_STEPS = 500             # per episode, greedy policies can loop forever
     EXPERIMENT_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), 
-                                 "experiments/20250619-113431")
\ No newline at end of file
+                                 "experiments/20250619-113431")
+
+    RANDOM_STARTS = False       # evaluate from random walkable cells instead of the start position
+    EVAL_SEED = 0
+
+    RENDER_EPISODES = 3         # greedy episodes shown in the window (or recorded) after the evaluation
+    HEADLESS = False            # render offscreen, no window and no frame rate limit
+    RECORD = False
+    RECORD_FORMAT = "npz"       # "npz", "png" or "gif"
+    RECORD_EPISODES = [0, 1, 2] # None records every episode
+    FRAME_SKIP = 1
+
+
+def make_config(base=LearningConfig, **overrides):
+    """Per-run config object: an instance of ``base`` with some attributes overridden."""
+    config = base()
+    for name, value in overrides.items():
+        if not hasattr(base, name):
+            raise AttributeError(f"{base.__name__} has no setting {name}")
+        setattr(config, name, value)
+    return config
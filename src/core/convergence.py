@@ -0,0 +1,162 @@
+import json
+import os
+import numpy as np
+from .config import TestConfig
+from .dungeon_env import DungeonEnv
+from .q_table import DenseQTable
+
+FILENAME = "convergence.json"
+
+
+def q_snapshot(agent):
+    """(values, visited) of all of an agent's Q-tables stacked into one dense array."""
+    policies = agent.policies if hasattr(agent, 'policies') else [agent.policy]
+    values, visited = [], []
+    for policy in policies:
+        q_table = policy.q_table
+        if not isinstance(q_table, DenseQTable):
+            q_table = DenseQTable.from_dict(q_table, policy.encoder, policy.action_space_size)
+        values.append(np.array(q_table.values, dtype=np.float64))
+        visited.append(np.array(q_table.visited))
+    return np.concatenate(values), np.concatenate(visited)
+
+
+class ConvergenceMonitor:
+    """Checks every ``window`` episodes whether training has converged.
+
+    Each check compares the Q-tables with the previous check (max and mean
+    absolute change over visited states, greedy actions that changed) and,
+    with ``min_success_rate``, runs a greedy episode from the start position.
+    Training has converged once every criterion that is not None holds for
+    ``patience`` checks in a row.
+
+    The greedy episode steps the environment and reads the agent's tables
+    as it goes, unlike ``evaluate_agent`` which freezes every state of
+    every carry mask first, so a check costs at most ``eval_max_steps``
+    lookups however many keys the layout has. Greedy episodes from the
+    start position all play out the same, so the success rate is 0 or 1.
+    """
+
+    def __init__(self, agent, layout=None, window=500, patience=3, min_episodes=0, max_q_change=None,
+                 mean_q_change=None, max_policy_changes=0, min_success_rate=1.0,
+                 eval_max_steps=TestConfig.MAX_STEPS):
+        self.agent = agent
+        self.layout = layout
+        self.window = window
+        self.patience = patience
+        self.min_episodes = min_episodes
+        self.criteria = {
+            "max_q_change": max_q_change,
+            "mean_q_change": mean_q_change,
+            "policy_changes": max_policy_changes,
+            "success_rate": min_success_rate,
+        }
+        self.eval_max_steps = eval_max_steps
+        self._env = DungeonEnv(layout) if min_success_rate is not None else None
+
+        self.history = []
+        self.streak = 0
+        self.converged_episode = None
+        self._previous = None
+
+    @classmethod
+    def from_config(cls, config, agent, layout=None):
+        return cls(
+            agent,
+            layout=layout,
+            window=config.CONVERGENCE_WINDOW,
+            patience=config.CONVERGENCE_PATIENCE,
+            min_episodes=config.CONVERGENCE_MIN_EPISODES,
+            max_q_change=config.CONVERGENCE_MAX_Q_CHANGE,
+            mean_q_change=config.CONVERGENCE_MEAN_Q_CHANGE,
+            max_policy_changes=config.CONVERGENCE_MAX_POLICY_CHANGES,
+            min_success_rate=config.CONVERGENCE_MIN_SUCCESS_RATE
+        )
+
+    def due(self, episodes):
+        return episodes % self.window == 0
+
+    def measure(self):
+        values, visited = q_snapshot(self.agent)
+        stats = {"max_q_change": None, "mean_q_change": None, "policy_changes": None, "success_rate": None,
+                 "visited_states": int(visited.sum())}
+        if self._previous is not None:
+            previous_values, previous_visited = self._previous
+            # AgentV2 tables of carry masks seen since the last check are appended
+            added = len(values) - len(previous_values)
+            previous_values = np.concatenate([previous_values, np.zeros((added, values.shape[1]))])
+            previous_visited = np.concatenate([previous_visited, np.zeros(added, dtype=bool)])
+            rows = visited | previous_visited
+            change = np.abs(values[rows] - previous_values[rows])
+            stats["max_q_change"] = float(change.max()) if change.size else 0.0
+            stats["mean_q_change"] = float(change.mean()) if change.size else 0.0
+            stats["policy_changes"] = int(np.count_nonzero(
+                values[rows].argmax(axis=1) != previous_values[rows].argmax(axis=1)
+            ))
+        if self.criteria["success_rate"] is not None:
+            stats["success_rate"] = self.greedy_success()
+        self._previous = values, visited
+        return stats
+
+    def greedy_success(self):
+        env = self._env
+        state = env.reset()
+        for _ in range(self.eval_max_steps):
+            state, _, done, terminated, _ = env.step(self.agent.greedy_action(state))
+            if done or terminated:
+                return float(done)
+        return 0.0
+
+    def met(self, stats):
+        for name, threshold in self.criteria.items():
+            if threshold is None:
+                continue
+            value = stats[name]
+            if value is None:
+                return False
+            if (value < threshold) if name == "success_rate" else (value > threshold):
+                return False
+        return True
+
+    def check(self, episodes):
+        """Measures after ``episodes`` episodes; True once training has converged."""
+        stats = self.measure()
+        self.streak = self.streak + 1 if self.met(stats) else 0
+        self.history.append({"episode": episodes, **stats, "met": self.streak > 0})
+        if self.streak >= self.patience and episodes >= self.min_episodes:
+            self.converged_episode = episodes
+            return True
+        return False
+
+    def reason(self):
+        if self.converged_episode is None:
+            return "max_episodes"
+        active = [name for name, threshold in self.criteria.items() if threshold is not None]
+        return f"converged: {', '.join(active)} met for {self.patience} checks of {self.window} episodes"
+
+    def state(self):
+        """Everything a resumed run needs to continue the checks; the snapshot arrays are never mutated."""
+        return {
+            "previous": self._previous,
+            "streak": self.streak,
+            "history": list(self.history),
+            "converged_episode": self.converged_episode,
+        }
+
+    def load_state(self, state):
+        self._previous = state["previous"]
+        self.streak = state["streak"]
+        self.history = list(state["history"])
+        self.converged_episode = state["converged_episode"]
+
+    def save(self, experiment_path, episodes):
+        with open(os.path.join(experiment_path, FILENAME), "w") as f:
+            json.dump({
+                "converged": self.converged_episode is not None,
+                "stop_reason": self.reason(),
+                "episodes": episodes,
+                "window": self.window,
+                "patience": self.patience,
+                "criteria": self.criteria,
+                "history": self.history,
+            }, f, indent=2)
@@ -0,0 +1,465 @@
+"""Actor-learner training over shared memory.
+
+Actor processes step their own ``DungeonEnv`` with a local copy of the
+agent's dense Q-tables and write their transitions to a
+``TransitionBuffer``, a single-producer single-consumer ring in
+``multiprocessing.shared_memory``. The learner, running in the training
+process, applies them to the agent's tables in batches and publishes the
+tables and its epsilons to ``SharedQTables``, which every actor copies
+after each chunk it writes. Epsilons decay per episode learned, as in the
+single-process loop, however many actors there are. An actor waits while its ring is full, so it never runs more than
+one ring of transitions ahead of the learner.
+"""
+import multiprocessing
+import time
+from multiprocessing import shared_memory
+import numpy as np
+from .checkpoint import agent_policies, config_values
+from .fused import agent_tables
+from .q_table import DenseQTable
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+RECORD_DTYPE = np.dtype([
+    ("state", np.int64),
+    ("next_state", np.int64),
+    ("reward", np.float64),
+    ("action", np.int8),
+    ("done", np.bool_),
+    ("end", np.bool_),
+])
+HEADER_WORDS = 16
+HEADER_BYTES = HEADER_WORDS * 8
+WAIT_SECONDS = 0.0002
+
+# ring header: the producer writes the first cache line, the consumer the second
+HEAD, STEPS, EPISODES, SYNCS, WAITS, WAIT_NS = range(6)
+TAIL = 8
+# Q-table header
+VERSION, STOP = 0, 1
+
+
+def _apply_transitions(q, visited, table_of, row_of, states, actions, rewards, next_states, num_rows, num_actions,
+                       learning_rate, discount, count):
+    """Q-learning updates of ``count`` transitions in order, on flat ``(table, row, action)`` buffers.
+
+    Like ``fused._train_episodes`` this runs on Numba arrays or on plain
+    Python sequences; the next state is looked up in the same table as the
+    state, as ``AgentV2.learn`` does.
+    """
+    for i in range(count):
+        state = states[i]
+        table = table_of[state]
+        slot = table * num_rows + row_of[state]
+        next_slot = table * num_rows + row_of[next_states[i]]
+        visited[slot] = True
+        visited[next_slot] = True
+
+        next_row = next_slot * num_actions
+        best_next = q[next_row]
+        for a in range(1, num_actions):
+            if q[next_row + a] > best_next:
+                best_next = q[next_row + a]
+
+        index = slot * num_actions + actions[i]
+        current = q[index]
+        q[index] = current + learning_rate * (rewards[i] + discount * best_next - current)
+
+
+_apply_transitions_numba = numba.njit(cache=True)(_apply_transitions) if numba is not None else None
+
+
+def shared_tables(agent):
+    """The agent's dense Q-tables as views of one (table, row, action) array; returns it and the visited flags."""
+    if getattr(agent, 'stack', None) is not None:
+        return agent.stack.arrays()
+    policies = agent_policies(agent)
+    values = np.stack([policy.q_table.values for policy in policies])
+    visited = np.stack([policy.q_table.visited for policy in policies])
+    for i, policy in enumerate(policies):
+        policy.q_table = DenseQTable.from_arrays(policy.encoder, values[i], visited[i])
+    return values, visited
+
+
+class _SharedBlock:
+    """A header of int64 counters followed by data in a shared memory block, created or attached by name."""
+
+    def __init__(self, data_bytes, name=None):
+        self.owner = name is None
+        if self.owner:
+            self._shm = shared_memory.SharedMemory(create=True, size=HEADER_BYTES + data_bytes)
+        else:
+            self._shm = shared_memory.SharedMemory(name=name)
+        self.name = self._shm.name
+        self.header = np.ndarray(HEADER_WORDS, dtype=np.int64, buffer=self._shm.buf)
+        if self.owner:
+            self.header[:] = 0
+
+    def _data(self, shape, dtype):
+        return np.ndarray(shape, dtype=dtype, buffer=self._shm.buf, offset=HEADER_BYTES)
+
+    def close(self):
+        # every view of the buffer has to be gone before it can be closed
+        self.__dict__.update({name: None for name, value in vars(self).items() if isinstance(value, np.ndarray)})
+        self._shm.close()
+        if self.owner:
+            self._shm.unlink()
+
+
+class TransitionBuffer(_SharedBlock):
+    """Ring of ``capacity`` transitions written by one actor and read by the learner.
+
+    The producer copies records in before it advances ``HEAD`` and the
+    consumer copies them out before it advances ``TAIL``, so with a single
+    process on each side neither needs a lock.
+    """
+
+    def __init__(self, capacity, name=None):
+        super().__init__(capacity * RECORD_DTYPE.itemsize, name)
+        self.capacity = capacity
+        self.records = self._data(capacity, RECORD_DTYPE)
+        self._head = int(self.header[HEAD])
+
+    def write(self, chunk, stop=None):
+        """Appends ``chunk``, waiting while the ring is full; False if ``stop()`` turned true meanwhile."""
+        header = self.header
+        count = len(chunk)
+        head = self._head
+        if head + count - int(header[TAIL]) > self.capacity:
+            start = time.perf_counter_ns()
+            header[WAITS] += 1
+            while head + count - int(header[TAIL]) > self.capacity:
+                if stop is not None and stop():
+                    return False
+                time.sleep(WAIT_SECONDS)
+            header[WAIT_NS] += time.perf_counter_ns() - start
+
+        position = head % self.capacity
+        first = min(count, self.capacity - position)
+        self.records[position:position + first] = chunk[:first]
+        self.records[:count - first] = chunk[first:]
+        self._head = head + count
+        header[HEAD] = self._head
+        return True
+
+    def read(self, limit):
+        """Copies out up to ``limit`` unread transitions, oldest first, and frees their slots."""
+        tail = int(self.header[TAIL])
+        count = min(int(self.header[HEAD]) - tail, limit)
+        chunk = np.take(self.records, np.arange(tail, tail + count) % self.capacity)
+        self.header[TAIL] = tail + count
+        return chunk
+
+
+class SharedQTables(_SharedBlock):
+    """Q-values and epsilons of each table published by the learner; ``VERSION`` is odd while they are written."""
+
+    def __init__(self, shape, dtype, name=None):
+        dtype = np.dtype(dtype)
+        super().__init__(shape[0] * 8 + int(np.prod(shape)) * dtype.itemsize, name)
+        self.epsilons = self._data(shape[0], np.float64)
+        self.values = np.ndarray(shape, dtype=dtype, buffer=self._shm.buf, offset=HEADER_BYTES + shape[0] * 8)
+
+    @property
+    def version(self):
+        return int(self.header[VERSION])
+
+    @property
+    def stopped(self):
+        return bool(self.header[STOP])
+
+    def stop(self):
+        self.header[STOP] = 1
+
+    def publish(self, values, epsilons):
+        self.header[VERSION] += 1
+        np.copyto(self.values, values)
+        self.epsilons[:] = epsilons
+        self.header[VERSION] += 1
+
+    def read_into(self, out):
+        """Copies the tables to ``out``; (version, epsilons), or None if they changed while copying."""
+        version = self.version
+        if version & 1:
+            return None
+        np.copyto(out, self.values)
+        epsilons = self.epsilons.tolist()
+        return (version, epsilons) if self.version == version else None
+
+
+def run_actor(config, layout, seed, masks, tables_name, tables_shape, dtype, buffer_name, capacity, chunk_size):
+    """Actor process: epsilon-greedy episodes on a synced copy of the Q-tables until the learner stops.
+
+    ``masks`` are the learner's AgentV2 carry masks in slot order, None for an ``Agent``.
+    """
+    from .config import LearningConfig, make_config
+    from .dungeon_env import DungeonEnv
+    from .trainer import make_agent
+
+    np.random.seed(seed)
+    env = DungeonEnv(layout)
+    agent = make_agent(make_config(LearningConfig, **config), env=env)
+    for mask in masks or ():
+        agent.policy_for_mask(mask)
+    values, _ = shared_tables(agent)
+    tables = SharedQTables(tables_shape, dtype, name=tables_name)
+    buffer = TransitionBuffer(capacity, name=buffer_name)
+    try:
+        _act(env, agent, values, tables, buffer, chunk_size)
+    finally:
+        tables.close()
+        buffer.close()
+
+
+def _sync(agent, values, tables):
+    """Copies the published tables and epsilons into the actor's agent; the version, or None."""
+    synced = tables.read_into(values)
+    if synced is None:
+        return None
+    version, epsilons = synced
+    for policy, epsilon in zip(agent_policies(agent), epsilons):
+        policy.epsilon = epsilon
+    return version
+
+
+def _act(env, agent, values, tables, buffer, chunk_size):
+    header = buffer.header
+    select_policy = agent.select_policy if hasattr(agent, 'policies') else None
+    version = _sync(agent, values, tables)
+    pending = []
+    episodes = 0
+    state = env.reset()
+    index = env.state_index
+
+    while not tables.stopped:
+        action = agent.choose_action(state)
+        next_state, reward, done, terminated, _ = env.step(action)
+        next_index = env.state_index
+        end = done or terminated
+        if end:
+            # decays the local epsilon until the next sync
+            policy = select_policy(*state[2:]) if select_policy else agent.policy
+            policy.end_episode()
+            episodes += 1
+        pending.append((index, next_index, reward, action, done, end))
+        if end:
+            state = env.reset()
+            index = env.state_index
+        else:
+            state, index = next_state, next_index
+
+        if len(pending) == chunk_size:
+            if not buffer.write(np.array(pending, dtype=RECORD_DTYPE), stop=lambda: tables.stopped):
+                return
+            header[STEPS] += len(pending)
+            header[EPISODES] += episodes
+            pending = []
+            episodes = 0
+            if tables.version != version:
+                synced = _sync(agent, values, tables)
+                if synced is not None:
+                    version = synced
+                    header[SYNCS] += 1
+
+
+class ActorLearner:
+    """Trains a dense ``Agent`` or ``AgentV2`` with ``num_actors`` actor processes and a learner in this one.
+
+    Between ``start`` and ``stop`` the agent's Q-tables are views of one
+    array that ``episodes`` updates from the actors' transitions. The order
+    in which actors' transitions arrive varies, so runs are not
+    reproducible even with a seed.
+    """
+
+    def __init__(self, agent, env, config, num_actors, buffer_size=1 << 16, chunk_size=128, batch_size=4096,
+                 publish_interval=1024, seed=None):
+        if num_actors < 1:
+            raise ValueError("Actor-learner training needs at least one actor.")
+        if chunk_size > buffer_size:
+            raise ValueError(f"Actor chunks of {chunk_size} transitions do not fit a ring of {buffer_size}.")
+        self.policies = agent_policies(agent)
+        for policy in self.policies:
+            if policy.storage != "dense":
+                raise ValueError("Actor-learner training requires dense Q-table storage.")
+            if policy.planner is not None or policy.traces is not None:
+                raise ValueError("Actor-learner training does not support planning or eligibility traces.")
+
+        self.agent = agent
+        self.env = env
+        self.config = config
+        self.num_actors = num_actors
+        self.buffer_size = buffer_size
+        self.chunk_size = chunk_size
+        self.batch_size = batch_size
+        self.publish_interval = publish_interval
+        self.seed = seed
+
+        self.table_of, self.row_of = agent_tables(agent, env.model)
+        self.keys_of = env.model.observations.reshape(env.model.num_states, -1)[:, 2:].sum(axis=1).tolist()
+        self.kernel = _apply_transitions_numba if numba is not None else _apply_transitions
+        self.tables = None
+        self.buffers = []
+        self.processes = []
+        self.updates = 0
+        self.published = 0
+        self.idle_time = 0.0
+        self.final_stats = None
+
+    @classmethod
+    def from_config(cls, config, agent, env, start_episode=0):
+        seed = None if config.SEED is None else [config.SEED, start_episode]
+        return cls(
+            agent, env, config,
+            num_actors=config.ACTOR_PROCESSES,
+            buffer_size=config.ACTOR_BUFFER_SIZE,
+            chunk_size=config.ACTOR_CHUNK_SIZE,
+            batch_size=config.LEARNER_BATCH_SIZE,
+            publish_interval=config.LEARNER_PUBLISH_INTERVAL,
+            seed=seed
+        )
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def start(self):
+        values, visited = shared_tables(self.agent)
+        self.num_rows, self.num_actions = values.shape[1:]
+        if numba is not None:
+            self._buffers = (values.reshape(-1), visited.reshape(-1), self.table_of, self.row_of)
+        else:
+            # memoryviews share the arrays' memory but index to Python scalars
+            self._buffers = (memoryview(values.reshape(-1)), memoryview(visited.reshape(-1)),
+                             self.table_of.tolist(), self.row_of.tolist())
+        self.values = values
+
+        self.tables = SharedQTables(values.shape, values.dtype)
+        self.publish()
+        config = config_values(self.config)
+        context = multiprocessing.get_context("spawn")
+        for i in range(self.num_actors):
+            buffer = TransitionBuffer(self.buffer_size)
+            seed = None if self.seed is None else [*self.seed, i]
+            process = context.Process(
+                target=run_actor, name=f"actor-{i}", daemon=True,
+                args=(config, self.env.layout, seed, getattr(self.agent, 'masks', None), self.tables.name,
+                      values.shape, values.dtype.str, buffer.name, self.buffer_size, self.chunk_size)
+            )
+            process.start()
+            self.buffers.append(buffer)
+            self.processes.append(process)
+        self._start_time = time.perf_counter()
+
+    def stop(self):
+        if self.tables is None:
+            return
+        self.tables.stop()
+        for process in self.processes:
+            process.join(timeout=5)
+            if process.is_alive():
+                process.terminate()
+                process.join()
+        self.final_stats = self.stats()
+        for buffer in self.buffers:
+            buffer.close()
+        self.tables.close()
+        self.tables = None
+        self.buffers = []
+        self.processes = []
+        self._buffers = None
+        self.values = None
+
+    def publish(self):
+        self.tables.publish(self.values, [policy.epsilon for policy in self.policies])
+        self.published += 1
+
+    def _check_actors(self):
+        for i, process in enumerate(self.processes):
+            if not process.is_alive():
+                raise RuntimeError(f"Actor {i} exited with code {process.exitcode}.")
+
+    def _apply(self, chunk):
+        q, visited, table_of, row_of = self._buffers
+        fields = [chunk[name] for name in ("state", "action", "reward", "next_state")]
+        if numba is None:
+            fields = [field.tolist() for field in fields]
+        first = self.policies[0]
+        self.kernel(q, visited, table_of, row_of, *fields, self.num_rows, self.num_actions, first.learning_rate,
+                    first.discount_factor, len(chunk))
+
+    def episodes(self, limit):
+        """Learns until ``limit`` more episodes have ended, yielding their (reward, done, steps, keys, epsilon).
+
+        Episodes are yielded once the batch they end in has been applied.
+        """
+        remaining = limit
+        totals = [0] * self.num_actors
+        lengths = [0] * self.num_actors
+        since_publish = 0
+        while remaining > 0:
+            applied = 0
+            for i, buffer in enumerate(self.buffers):
+                chunk = buffer.read(self.batch_size)
+                if not len(chunk):
+                    continue
+                ends = np.flatnonzero(chunk["end"])
+                if len(ends) >= remaining:
+                    # transitions after the last episode are never applied
+                    chunk = chunk[:ends[remaining - 1] + 1]
+                    ends = ends[:remaining]
+                self._apply(chunk)
+                applied += len(chunk)
+
+                rewards = chunk["reward"].tolist()
+                start = 0
+                for end in ends.tolist():
+                    record = chunk[end]
+                    self.policies[self.table_of[record["state"]]].end_episode()
+                    total = sum(rewards[start:end + 1], totals[i])
+                    steps = lengths[i] + end + 1 - start
+                    totals[i], lengths[i], start = 0, 0, end + 1
+                    keys = self.keys_of[record["next_state"]]
+                    remaining -= 1
+                    yield total, bool(record["done"]), steps, keys, self.policies[0].epsilon
+                totals[i] = sum(rewards[start:], totals[i])
+                lengths[i] += len(rewards) - start
+                if remaining <= 0:
+                    break
+
+            self.updates += applied
+            since_publish += applied
+            if since_publish >= self.publish_interval:
+                self.publish()
+                since_publish = 0
+            if not applied:
+                self._check_actors()
+                idle_start = time.perf_counter()
+                time.sleep(WAIT_SECONDS)
+                self.idle_time += time.perf_counter() - idle_start
+
+    def stats(self):
+        """Throughput counters of the actors and the learner since ``start``."""
+        if self.tables is None:
+            return self.final_stats
+        elapsed = time.perf_counter() - self._start_time
+        counters = np.array([buffer.header[:TAIL] for buffer in self.buffers]).sum(axis=0).tolist()
+        return {
+            "actors": self.num_actors,
+            "actor_steps": counters[STEPS],
+            "actor_episodes": counters[EPISODES],
+            "actor_steps_per_s": counters[STEPS] / elapsed,
+            "learner_updates": self.updates,
+            "learner_updates_per_s": self.updates / elapsed,
+            "policy_syncs": counters[SYNCS],
+            "snapshots_published": self.published,
+            "backpressure_waits": counters[WAITS],
+            "backpressure_wait_s": counters[WAIT_NS] / 1e9,
+            "learner_idle_s": self.idle_time,
+            "wall_time": elapsed,
+        }
@@ -1,134 +1,89 @@
-import gymnasium as gym
-from gymnasium import spaces
+import functools
 import numpy as np
 import random
 from time import sleep
 from .config import EnvConfig as envcfg
+from .env_model import get_env_model
+from .layout import get_layout
 
-class DungeonEnv(gym.Env):
+class DungeonEnv:
 
     
-    def __init__(self):
-        self.action_space = spaces.Discrete(4)
-        self.observation_space = spaces.Box(
-            low=np.array([0, 0, 0, 0]),
-            high=np.array([10, 10, 1, 1]),
+    def __init__(self, layout=None):
+        self.layout = layout or get_layout()
+        self.model = get_env_model(self.layout.grid, self.layout.start_position)
+        self.grid_size = self.model.grid_size
+        self.num_keys = self.model.num_keys
+
+        if self.model.small:
+            self._transition = self.model.transition_list.__getitem__
+            self._observation = self.model.observation_list.__getitem__
+        else:
+            self._transition = self.model.transition
+            self._observation = self.model.observation
+        self._num_actions = self.model.num_actions
+        self.state_index = self.model.start_index
+        self.state = self._observation(self.state_index)
+
+    # gymnasium is only imported by code that asks for the spaces
+    @functools.cached_property
+    def action_space(self):
+        from gymnasium import spaces
+        return spaces.Discrete(self._num_actions)
+
+    @functools.cached_property
+    def observation_space(self):
+        from gymnasium import spaces
+        return spaces.Box(
+            low=np.zeros(2 + self.num_keys, dtype=np.int32),
+            high=np.array([self.grid_size[0] - 1, self.grid_size[1] - 1] + [1] * self.num_keys),
             dtype=np.int32
         )
 
-    def reset(self):
-        self.grid = np.full(shape=envcfg.GRID_SIZE, fill_value=envcfg.LAVA, dtype=np.int32)
-        self.agent_pos = np.array(list(envcfg.INITIAL_AGENT_POSITION), dtype=np.int32)
-        self.carrying = np.zeros(2, dtype=np.int32)
-
-        # walls
-        self.grid[5, 5:] = envcfg.WALL
-        self.grid[3:8, 5] = envcfg.WALL
-        self.grid[3, :5] = envcfg.WALL
-        self.grid[7, :5] = envcfg.WALL
-        self.grid[6, 0] = envcfg.WALL
-        self.grid[4, 0] = envcfg.WALL
-
-        # walkable
-        self.grid[1:10, 2] = envcfg.WALKABLE
-        self.grid[5, 0:5] = envcfg.WALKABLE
-        self.grid[4, 1:5] = envcfg.WALKABLE
-        self.grid[6, 1:5] = envcfg.WALKABLE
-        self.grid[9, 2:10] = envcfg.WALKABLE
-        self.grid[1, 2:10] = envcfg.WALKABLE
-
-        # agent position
-        self.grid[envcfg.INITIAL_AGENT_POSITION] = envcfg.AGENT
-
-        # keys
-        self.grid[1, 9] = envcfg.KEY
-        self.grid[9, 9] = envcfg.KEY
-
-        # goal
-        self.grid[envcfg.GOAL_POSITION] = envcfg.GOAL
-
-        self.state = (
-            self.agent_pos[0],
-            self.agent_pos[1],
-            self.carrying[0],
-            self.carrying[1]
-        )
+    @property
+    def state_shape(self):
+        # (x, y, carrying flags...) ranges, used to size dense Q-tables
+        return (*self.grid_size, *([2] * self.num_keys))
+
+    @property
+    def agent_pos(self):
+        return self.state[0], self.state[1]
+
+    @property
+    def carrying(self):
+        return np.array(self.state[2:], dtype=np.int32)
+
+    @property
+    def keys_collected(self):
+        return sum(self.state[2:])
 
+    @property
+    def grid(self):
+        position_id, mask = divmod(self.state_index, self.model.num_masks)
+        return self.model.render_grid(position_id, mask)
+
+    def reset(self):
+        self.state_index = self.model.start_index
+        self.state = self._observation(self.state_index)
         return self.state
 
     def step(self, action):
-        if action == envcfg.UP:
-            new_pos = self.agent_pos + np.array([-1, 0])
-        elif action == envcfg.DOWN:
-            new_pos = self.agent_pos + np.array([1, 0])
-        elif action == envcfg.LEFT:
-            new_pos = self.agent_pos + np.array([0, -1])
-        elif action == envcfg.RIGHT:
-            new_pos = self.agent_pos + np.array([0, 1])
-        else:
+        if not 0 <= action < self._num_actions:
             raise ValueError(f"Invalid action: {action}")
 
-        new_pos = np.clip(new_pos, 0, np.array(envcfg.GRID_SIZE) - 1)
-        new_cell = self.grid[tuple(new_pos)]
-
-        reward = 0
-        done = False
-        terminated = False
-
-        if new_cell == envcfg.WALL:
-            reward = -0.1
-
-        elif new_cell == envcfg.LAVA:
-            reward = -10
-            terminated = True
-
-        elif new_cell == envcfg.KEY:
-            if self.carrying[0]:
-                self.carrying[1] = 1
-            else:
-                self.carrying[0] = 1
-            reward = 10
-            self.grid[tuple(self.agent_pos)] = envcfg.WALKABLE
-            self.grid[tuple(new_pos)] = envcfg.AGENT
-            self.agent_pos = new_pos
-
-        elif new_cell == envcfg.GOAL:
-            if self.carrying[0] and self.carrying[1]:
-                done = True
-                reward = 100
-                self.grid[tuple(self.agent_pos)] = envcfg.WALKABLE
-                self.grid[tuple(new_pos)] = envcfg.AGENT
-                self.agent_pos = new_pos
-            else:
-                reward = -1
-
-        elif new_cell == envcfg.WALKABLE:
-            reward = -0.1
-            self.grid[tuple(self.agent_pos)] = envcfg.WALKABLE
-            self.grid[tuple(new_pos)] = envcfg.AGENT
-            self.agent_pos = new_pos
-
-        elif new_cell == envcfg.AGENT:
-            reward = -1
-
-        else:
-            raise ValueError("Invalid cell type.")
-
-        self.state = (
-            self.agent_pos[0],
-            self.agent_pos[1],
-            self.carrying[0],
-            self.carrying[1]
+        self.state_index, reward, done, terminated = self._transition(
+            self.state_index * self._num_actions + action
         )
-        
+        self.state = self._observation(self.state_index)
+
         return self.state, reward, done, terminated, {}
 
     def render(self):
         
         grid_display = np.array(self.grid, dtype=object)
 
-        for i in range(envcfg.GRID_SIZE[0]):
-            for j in range(envcfg.GRID_SIZE[1]):
+        for i in range(self.grid_size[0]):
+            for j in range(self.grid_size[1]):
                 if grid_display[i, j] == envcfg.WALL:
                     grid_display[i, j] = 'W'
                 elif grid_display[i, j] == envcfg.WALKABLE:
@@ -151,6 +106,60 @@ class DungeonEnv(gym.Env):
         print("-------------------")
 
 
+class VecDungeonEnv:
+    """Steps ``num_envs`` copies of ``DungeonEnv`` at once.
+
+    All environments share the compiled ``EnvModel`` of the layout; each one
+    only keeps its position id and the mask of keys it has picked up.
+    Finished environments are reset automatically: ``step`` returns the
+    transition's next states, while ``self.state`` already holds the
+    observations the next actions should be chosen from.
+    """
+
+    def __init__(self, num_envs, auto_reset=True, layout=None):
+        self.num_envs = num_envs
+        self.auto_reset = auto_reset
+        self.layout = layout or get_layout()
+        self.model = get_env_model(self.layout.grid, self.layout.start_position)
+
+        start_position, _ = divmod(self.model.start_index, self.model.num_masks)
+        self._start_position = start_position
+        self.positions = np.full(num_envs, start_position, dtype=np.int32)
+        self.masks = np.zeros(num_envs, dtype=np.int32)
+        self.state = self.model.observations[self.positions, self.masks]
+
+    def reset(self):
+        self.reset_envs(np.ones(self.num_envs, dtype=bool))
+        return self.state.copy()
+
+    def reset_envs(self, mask):
+        self.positions[mask] = self._start_position
+        self.masks[mask] = 0
+        self.state[mask] = self.model.observations[self._start_position, 0]
+
+    def step(self, actions):
+        actions = np.asarray(actions)
+        if actions.shape != (self.num_envs,):
+            raise ValueError(f"Expected {self.num_envs} actions, got shape {actions.shape}")
+        if np.any((actions < 0) | (actions >= self.model.num_actions)):
+            raise ValueError(f"Invalid action in: {actions}")
+
+        index = (self.positions, self.masks, actions)
+        reward = self.model.reward[index]
+        done = self.model.done[index]
+        terminated = self.model.terminated[index]
+        self.positions, self.masks = self.model.next_position[index], self.model.next_mask[index]
+        next_state = self.model.observations[self.positions, self.masks]
+        self.state = next_state.copy()
+
+        if self.auto_reset:
+            finished = done | terminated
+            if np.any(finished):
+                self.reset_envs(finished)
+
+        return next_state, reward, done, terminated, {}
+
+
 if __name__ == "__main__":
     env = DungeonEnv()
     state = env.reset()
@@ -0,0 +1,148 @@
+import heapq
+import numpy as np
+
+PLANNING_MODES = ("dyna", "prioritized")
+
+
+class TransitionModel:
+    """Last observed (reward, next state) per (state id, action), in flat arrays.
+
+    ``observed`` lists the flat ``state_id * num_actions + action`` indices
+    in the order they were first seen, for uniform sampling, and
+    ``predecessors`` maps a state id to the flat indices that led to it.
+    """
+
+    def __init__(self, num_states, num_actions):
+        self.num_actions = num_actions
+        self.next_ids = np.full(num_states * num_actions, -1, dtype=np.int64)
+        self.rewards = np.zeros(num_states * num_actions)
+        self.observed = np.zeros(1024, dtype=np.int64)
+        self.num_observed = 0
+        self.predecessors = {}
+
+    def add(self, state_id, action, reward, next_id):
+        index = state_id * self.num_actions + action
+        previous = self.next_ids.item(index)
+        if previous < 0:
+            if self.num_observed == len(self.observed):
+                self.observed = np.concatenate([self.observed, np.zeros_like(self.observed)])
+            self.observed[self.num_observed] = index
+            self.num_observed += 1
+        if previous != next_id:
+            predecessors = self.predecessors.setdefault(next_id, [])
+            if index not in predecessors:
+                predecessors.append(index)
+        self.next_ids[index] = next_id
+        self.rewards[index] = reward
+
+    def sample(self, rng, size):
+        return self.observed[rng.integers(self.num_observed, size=size)].tolist()
+
+    def state(self):
+        keys = sorted(self.predecessors)
+        return {
+            "next_ids": self.next_ids.copy(),
+            "rewards": self.rewards.copy(),
+            "observed": self.observed[:self.num_observed].copy(),
+            "predecessor_keys": np.array(keys, dtype=np.int64),
+            "predecessor_counts": np.array([len(self.predecessors[k]) for k in keys], dtype=np.int64),
+            "predecessor_values": np.array([i for k in keys for i in self.predecessors[k]], dtype=np.int64),
+        }
+
+    def load_state(self, state):
+        self.next_ids = np.array(state["next_ids"])
+        self.rewards = np.array(state["rewards"])
+        self.num_observed = len(state["observed"])
+        self.observed = np.zeros(max(1024, self.num_observed), dtype=np.int64)
+        self.observed[:self.num_observed] = state["observed"]
+        values = state["predecessor_values"].tolist()
+        offsets = np.concatenate([[0], np.cumsum(state["predecessor_counts"])]).tolist()
+        self.predecessors = {
+            key: values[offsets[i]:offsets[i + 1]] for i, key in enumerate(state["predecessor_keys"].tolist())
+        }
+
+
+class Planner:
+    """Extra Q-learning updates from a learned model after every real step.
+
+    ``dyna`` replays ``steps`` uniformly sampled remembered transitions
+    (Dyna-Q). ``prioritized`` keeps a max-priority queue of absolute TD
+    errors above ``threshold`` and, after updating a pair, queues the pairs
+    that lead into its state (prioritized sweeping).
+    """
+
+    def __init__(self, policy, mode="dyna", steps=10, threshold=1e-4, seed=None):
+        if mode not in PLANNING_MODES:
+            raise ValueError(f"Invalid planning mode: {mode}")
+        if policy.encoder is None:
+            raise ValueError("Planning requires a state_shape.")
+        self.policy = policy
+        self.mode = mode
+        self.steps = steps
+        self.threshold = threshold
+        self.model = TransitionModel(policy.encoder.size, policy.action_space_size)
+        self.rng = np.random.default_rng(seed)
+        # heap of (-priority, index) with lazy deletion: an entry is live while it matches ``priorities``
+        self.queue = []
+        self.priorities = {}
+
+    def observe(self, state_id, action, reward, next_id):
+        self.model.add(state_id, action, reward, next_id)
+        if self.mode == "dyna":
+            self._plan_uniform()
+        else:
+            self._push(state_id * self.model.num_actions + action)
+            self._plan_prioritized(state_id)
+
+    def _plan_uniform(self):
+        update = self.policy.update_ids
+        model = self.model
+        num_actions = model.num_actions
+        for index in model.sample(self.rng, self.steps):
+            state_id, action = divmod(index, num_actions)
+            update(state_id, action, model.rewards.item(index), model.next_ids.item(index))
+
+    def _push(self, index):
+        state_id, action = divmod(index, self.model.num_actions)
+        priority = abs(self.policy.td_error_ids(
+            state_id, action, self.model.rewards.item(index), self.model.next_ids.item(index)
+        ))
+        if priority > self.threshold and priority > self.priorities.get(index, 0.0):
+            self.priorities[index] = priority
+            heapq.heappush(self.queue, (-priority, index))
+
+    def _plan_prioritized(self, state_id):
+        model = self.model
+        num_actions = model.num_actions
+        # predecessors of the state the real step just updated
+        for index in model.predecessors.get(state_id, ()):
+            if model.next_ids.item(index) == state_id:
+                self._push(index)
+
+        updates = 0
+        while self.queue and updates < self.steps:
+            negative_priority, index = heapq.heappop(self.queue)
+            if self.priorities.get(index) != -negative_priority:
+                continue
+            del self.priorities[index]
+            state_id, action = divmod(index, num_actions)
+            self.policy.update_ids(state_id, action, model.rewards.item(index), model.next_ids.item(index))
+            updates += 1
+            for previous in model.predecessors.get(state_id, ()):
+                if model.next_ids.item(previous) == state_id:
+                    self._push(previous)
+
+    def state(self):
+        state = self.model.state()
+        state["queue_priorities"] = np.array([-p for p, _ in self.queue])
+        state["queue_indices"] = np.array([i for _, i in self.queue], dtype=np.int64)
+        state["priority_indices"] = np.array(list(self.priorities), dtype=np.int64)
+        state["priority_values"] = np.array(list(self.priorities.values()))
+        state["rng"] = self.rng.bit_generator.state
+        return state
+
+    def load_state(self, state):
+        self.model.load_state(state)
+        self.queue = [(-p, i) for p, i in zip(state["queue_priorities"].tolist(), state["queue_indices"].tolist())]
+        self.priorities = dict(zip(state["priority_indices"].tolist(), state["priority_values"].tolist()))
+        self.rng.bit_generator.state = state["rng"]
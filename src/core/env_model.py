@@ -0,0 +1,209 @@
+import functools
+import numpy as np
+from .config import EnvConfig as envcfg
+
+ACTION_DELTAS = np.array([[-1, 0], [1, 0], [0, -1], [0, 1]], dtype=np.int32)
+
+_model_cache = {}
+
+
+class EnvModel:
+    """Compiled dynamics of a static dungeon layout.
+
+    States are (position, key mask) pairs, where ``position = x * width + y``
+    and bit ``i`` of the mask is set once the i-th key (row-major order) has
+    been picked up. For every (position, mask, action) the tables hold the
+    next position and mask, the reward and the done/terminated flags, so an
+    environment step is a single lookup.
+
+    Those tables grow with ``2 ** num_keys`` and are only built when
+    something reads them (evaluation, planning, fused training). Larger
+    models step from the per-(position, action) moves instead, so many-key
+    dungeons can be trained without them.
+    """
+
+    # above this many transitions the tables are not mirrored as Python lists
+    LIST_TABLE_LIMIT = 1 << 20
+    FULL_TABLES = ("next_position", "next_mask", "reward", "done", "terminated", "observations", "next_index",
+                   "_flat_reward", "_flat_done", "_flat_terminated")
+
+    def __init__(self, grid, start_position):
+        self.grid = np.array(grid, dtype=np.int32)
+        self.grid.setflags(write=False)
+        self.grid_size = self.grid.shape
+        self.start_position = tuple(int(v) for v in start_position)
+
+        self.key_positions = np.argwhere(self.grid == envcfg.KEY).astype(np.int32)
+        self.num_keys = len(self.key_positions)
+        self.num_positions = self.grid.size
+        self.num_masks = 1 << self.num_keys
+        self.num_actions = len(ACTION_DELTAS)
+        self.full_mask = self.num_masks - 1
+
+        self.num_states = self.num_positions * self.num_masks
+        self.small = self.num_states * self.num_actions <= self.LIST_TABLE_LIMIT
+        self.start_index = self.state_index(self.position_id(self.start_position), 0)
+        self._compile_moves()
+
+    def __getattr__(self, name):
+        # only called for missing attributes: the full tables are built on first access
+        if name in EnvModel.FULL_TABLES:
+            self._compile()
+            return self.__dict__[name]
+        raise AttributeError(f"{type(self).__name__} has no attribute {name}")
+
+    def position_id(self, position):
+        return int(position[0]) * self.grid_size[1] + int(position[1])
+
+    def state_index(self, position_id, mask):
+        return position_id * self.num_masks + mask
+
+    def carrying_flags(self, mask):
+        """Observation flags of a key mask: flag ``i`` is set once the i-th key has been picked up."""
+        return tuple((mask >> i) & 1 for i in range(self.num_keys))
+
+    def _compile_moves(self):
+        height, width = self.grid_size
+        positions = np.arange(self.num_positions)
+        rows, cols = np.divmod(positions, width)
+
+        key_index = np.full(self.grid_size, -1, dtype=np.int64)
+        key_index[tuple(self.key_positions.T)] = np.arange(self.num_keys)
+
+        # (position, action) neighbours, clipped at the border like DungeonEnv
+        new_rows = np.clip(rows[:, None] + ACTION_DELTAS[:, 0], 0, height - 1)
+        new_cols = np.clip(cols[:, None] + ACTION_DELTAS[:, 1], 0, width - 1)
+        self._new_positions = new_rows * width + new_cols
+        self._stays = self._new_positions == positions[:, None]
+        self._move_cells = self.grid[new_rows, new_cols]
+        self._move_keys = key_index[new_rows, new_cols]
+
+        if not self.small:
+            # flat (position, action) lists for transition(); a staying move never picks up a key
+            self._move_list = list(zip(
+                self._new_positions.ravel().tolist(),
+                np.where(self._stays, envcfg.AGENT, self._move_cells).ravel().tolist(),
+                np.where(self._stays, -1, self._move_keys).ravel().tolist()
+            ))
+
+    def _compile(self):
+        positions = np.arange(self.num_positions)
+        rows, cols = np.divmod(positions, self.grid_size[1])
+        masks = np.arange(self.num_masks)
+        new_positions = self._new_positions
+        stays = self._stays
+
+        # broadcast everything to (position, mask, action)
+        cell = np.broadcast_to(self._move_cells[:, None, :],
+                               (self.num_positions, self.num_masks, self.num_actions)).copy()
+        key_ids = self._move_keys[:, None, :]
+        key_bits = np.where(key_ids >= 0, 1 << np.maximum(key_ids, 0), 0)
+        mask_grid = masks[None, :, None]
+        cell[(key_bits & mask_grid) != 0] = envcfg.WALKABLE
+        cell[np.broadcast_to(stays[:, None, :], cell.shape)] = envcfg.AGENT
+
+        is_key = cell == envcfg.KEY
+        is_goal = cell == envcfg.GOAL
+        done = is_goal & (mask_grid == self.full_mask)
+        terminated = cell == envcfg.LAVA
+        moved = is_key | done | (cell == envcfg.WALKABLE)
+
+        reward = np.full(cell.shape, -1.0)
+        reward[(cell == envcfg.WALL) | (cell == envcfg.WALKABLE)] = -0.1
+        reward[terminated] = -10.0
+        reward[is_key] = 10.0
+        reward[done] = 100.0
+
+        current = np.broadcast_to(positions[:, None, None], cell.shape)
+        self.next_position = np.where(moved, new_positions[:, None, :], current).astype(np.int32)
+        self.next_mask = np.where(is_key, mask_grid | key_bits, mask_grid).astype(np.int32)
+        self.reward = reward
+        self.done = done
+        self.terminated = terminated
+
+        self.observations = np.zeros((self.num_positions, self.num_masks, 2 + self.num_keys), dtype=np.int32)
+        self.observations[:, :, 0] = rows[:, None]
+        self.observations[:, :, 1] = cols[:, None]
+        self.observations[:, :, 2:] = (masks[None, :, None] >> np.arange(self.num_keys)) & 1
+
+        for table in (self.next_position, self.next_mask, self.reward, self.done,
+                      self.terminated, self.observations):
+            table.setflags(write=False)
+
+        self.next_index = (self.next_position.astype(np.int64) * self.num_masks + self.next_mask).ravel()
+        self._flat_reward = self.reward.ravel()
+        self._flat_done = self.done.ravel()
+        self._flat_terminated = self.terminated.ravel()
+
+    @functools.cached_property
+    def transition_list(self):
+        # flat Python lists so small environments never touch NumPy per step
+        return list(zip(
+            self.next_index.tolist(),
+            self._flat_reward.tolist(),
+            self._flat_done.tolist(),
+            self._flat_terminated.tolist()
+        ))
+
+    @functools.cached_property
+    def observation_list(self):
+        return [tuple(obs) for obs in self.observations.reshape(-1, 2 + self.num_keys).tolist()]
+
+    def transition(self, index):
+        """(next state index, reward, done, terminated) for ``index = state_index * num_actions + action``.
+
+        Computed from the move of the (position, action) pair, the same
+        rules ``_compile`` applies to every mask at once.
+        """
+        state_index, action = divmod(int(index), self.num_actions)
+        position_id, mask = divmod(state_index, self.num_masks)
+        new_position, cell, key = self._move_list[position_id * self.num_actions + action]
+        if key >= 0 and mask >> key & 1:
+            cell = envcfg.WALKABLE
+
+        if cell == envcfg.KEY:
+            return new_position * self.num_masks + (mask | 1 << key), 10.0, False, False
+        if cell == envcfg.GOAL and mask == self.full_mask:
+            return new_position * self.num_masks + mask, 100.0, True, False
+        if cell == envcfg.LAVA:
+            return state_index, -10.0, False, True
+        if cell == envcfg.WALKABLE:
+            return new_position * self.num_masks + mask, -0.1, False, False
+        if cell == envcfg.WALL:
+            return state_index, -0.1, False, False
+        # the border, or the goal without every key
+        return state_index, -1.0, False, False
+
+    def observation(self, state_index):
+        position_id, mask = divmod(state_index, self.num_masks)
+        return divmod(position_id, self.grid_size[1]) + self.carrying_flags(mask)
+
+    def render_grid(self, position_id, mask):
+        grid = self.grid.copy()
+        for i, (x, y) in enumerate(self.key_positions):
+            if mask & (1 << i):
+                grid[x, y] = envcfg.WALKABLE
+        grid[divmod(position_id, self.grid_size[1])] = envcfg.AGENT
+        return grid
+
+    def save(self, path):
+        np.savez_compressed(
+            path,
+            grid=self.grid,
+            start_position=np.array(self.start_position),
+            key_positions=self.key_positions,
+            next_position=self.next_position,
+            next_mask=self.next_mask,
+            reward=self.reward,
+            done=self.done,
+            terminated=self.terminated,
+            observations=self.observations
+        )
+
+
+def get_env_model(grid, start_position):
+    grid = np.asarray(grid, dtype=np.int32)
+    key = (grid.shape, grid.tobytes(), tuple(int(v) for v in start_position))
+    if key not in _model_cache:
+        _model_cache[key] = EnvModel(grid, start_position)
+    return _model_cache[key]
@@ -0,0 +1,133 @@
+import csv
+import json
+import os
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
+from .agent import load_agent
+from .config import EnvConfig as envcfg
+from .config import TestConfig
+from .env_model import get_env_model
+from .frozen_policy import FrozenPolicy
+from .layout import get_layout
+from .planning import shortest_path_lengths
+
+RESULT_FIELDS = [
+    "success_rate", "mean_reward", "mean_length", "mean_shortest_path", "path_length_ratio",
+    "timeout_rate", "episodes", "episodes_per_second", "steps_per_second", "eval_time",
+]
+
+
+def greedy_action_table(agent, model):
+    """The action ``agent`` (or a ``FrozenPolicy``) picks in every state of ``model``, indexed by state index."""
+    policy = agent if isinstance(agent, FrozenPolicy) else FrozenPolicy.from_agent(agent)
+    observations = model.observations.reshape(model.num_states, -1)
+    return policy.choose_actions(observations).astype(np.int64)
+
+
+def start_states(model, episodes, random_starts=False, seed=0):
+    if not random_starts:
+        return np.full(episodes, model.start_index, dtype=np.int64)
+    positions = np.flatnonzero(model.grid.ravel() == envcfg.WALKABLE)
+    rng = np.random.default_rng(seed)
+    return rng.choice(positions, size=episodes).astype(np.int64) * model.num_masks
+
+
+def rollout(model, actions, starts, max_steps):
+    """Runs all episodes at once from ``starts``; returns per-episode (reward, length, success)."""
+    num_actions = model.num_actions
+    states = starts.copy()
+    rewards = np.zeros(len(starts))
+    lengths = np.zeros(len(starts), dtype=np.int64)
+    successes = np.zeros(len(starts), dtype=bool)
+
+    next_index = model.next_index
+    reward = model.reward.reshape(-1)
+    finished = model.done.reshape(-1)
+    ended = (model.done | model.terminated).reshape(-1)
+
+    # indices of the episodes still running, so finished ones cost nothing
+    running = np.arange(len(starts))
+    for _ in range(max_steps):
+        if not len(running):
+            break
+        index = states[running] * num_actions + actions[states[running]]
+        states[running] = next_index[index]
+        rewards[running] += reward[index]
+        lengths[running] += 1
+        successes[running] = finished[index]
+        running = running[~ended[index]]
+
+    return rewards, lengths, successes
+
+
+def evaluate_agent(agent, layout=None, episodes=TestConfig.MAX_EPISODES, max_steps=TestConfig.MAX_STEPS,
+                   random_starts=False, seed=0):
+    """Greedy evaluation of a loaded ``Agent``/``AgentV2`` (or ``FrozenPolicy``) over a batch of episodes.
+
+    The agent is frozen into one action per state and all episodes then
+    advance together through the layout's transition tables. Episodes
+    still running after ``max_steps`` count as timeouts.
+    """
+    layout = layout or get_layout()
+    model = get_env_model(layout.grid, layout.start_position)
+    start_time = time.perf_counter()
+
+    actions = greedy_action_table(agent, model)
+    starts = start_states(model, episodes, random_starts, seed)
+    rewards, lengths, successes = rollout(model, actions, starts, max_steps)
+    eval_time = time.perf_counter() - start_time
+
+    shortest = shortest_path_lengths(model)[starts]
+    solved = successes & (shortest > 0)
+    timeouts = ~successes & (lengths >= max_steps)
+    return {
+        "episodes": episodes,
+        "success_rate": float(successes.mean()) if episodes else 0.0,
+        "mean_reward": float(rewards.mean()) if episodes else 0.0,
+        "mean_length": float(lengths[successes].mean()) if successes.any() else None,
+        "mean_shortest_path": float(shortest[shortest > 0].mean()) if (shortest > 0).any() else None,
+        # 1.0 means every successful episode took a shortest path
+        "path_length_ratio": float((lengths[solved] / shortest[solved]).mean()) if solved.any() else None,
+        "timeout_rate": float(timeouts.mean()) if episodes else 0.0,
+        "eval_time": eval_time,
+        "episodes_per_second": episodes / eval_time if eval_time else None,
+        "steps_per_second": int(lengths.sum()) / eval_time if eval_time else None,
+    }
+
+
+def evaluate_experiment(experiment_path, episodes=TestConfig.MAX_EPISODES, max_steps=TestConfig.MAX_STEPS,
+                        random_starts=False, seed=0):
+    try:
+        result = evaluate_agent(load_agent(experiment_path), episodes=episodes, max_steps=max_steps,
+                                random_starts=random_starts, seed=seed)
+        with open(os.path.join(experiment_path, "evaluation.json"), "w") as f:
+            json.dump(result, f, indent=2)
+        return {"experiment_path": experiment_path, **result, "error": ""}
+    except Exception:
+        return {"experiment_path": experiment_path, "error": traceback.format_exc()}
+
+
+def evaluate_experiments(experiment_paths, max_workers=None, output_path=None, verbose=True, **kwargs):
+    """Evaluates many experiment directories in worker processes; best first."""
+    results = []
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        futures = [executor.submit(evaluate_experiment, path, **kwargs) for path in experiment_paths]
+        for future in as_completed(futures):
+            result = future.result()
+            results.append(result)
+            if verbose:
+                if result["error"]:
+                    print(f"{result['experiment_path']} failed:\n{result['error']}")
+                else:
+                    print(f"{result['experiment_path']} ({len(results)}/{len(futures)}): "
+                          f"success rate {result['success_rate']:.3f}, mean reward {result['mean_reward']:.2f}")
+
+    results.sort(key=lambda r: (not r["error"], r.get("success_rate", 0), r.get("mean_reward", 0)), reverse=True)
+    if output_path:
+        with open(output_path, "w", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=["experiment_path", *RESULT_FIELDS, "error"], extrasaction="ignore")
+            writer.writeheader()
+            writer.writerows(results)
+    return results
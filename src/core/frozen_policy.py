@@ -0,0 +1,88 @@
+import operator
+import numpy as np
+from .q_table import DenseQTable, StateEncoder
+
+
+
+def greedy_actions(q_table, encoder, action_space_size):
+    """Greedy action per encoded state (first best action on ties, 0 for unseen states, like ``Policy``)."""
+    if not isinstance(q_table, DenseQTable) or q_table.encoder != encoder:
+        q_table = DenseQTable.from_dict(q_table, encoder, action_space_size)
+    return q_table.values.argmax(axis=1).astype(np.int8)
+
+
+def _in_range(value, dim):
+    return 0 <= value < dim
+
+
+class FrozenPolicy:
+    """Read-only greedy policy: one precomputed action per encoded state.
+
+    Built from a trained ``Agent`` or ``AgentV2`` and indexed by the full
+    observation ``(x, y, c1, c2, ...)``. Lookups never consume random
+    numbers or add states, and the action array is read-only, so one
+    instance can be shared between threads or pickled to worker processes.
+    Observations outside the encoded dims raise ``ValueError``.
+    """
+
+    def __init__(self, actions, dims):
+        encoder = StateEncoder(dims)
+        actions = np.array(actions, dtype=np.int8).reshape(encoder.size)
+        actions.setflags(write=False)
+        object.__setattr__(self, "encoder", encoder)
+        object.__setattr__(self, "actions", actions)
+        object.__setattr__(self, "_strides", encoder.strides)
+        object.__setattr__(self, "_dims", encoder.dims)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("FrozenPolicy is immutable")
+
+    def __reduce__(self):
+        return self.__class__, (self.actions, self.encoder.dims)
+
+    @classmethod
+    def from_q_table(cls, q_table, state_shape, action_space_size=4):
+        encoder = q_table.encoder if isinstance(q_table, DenseQTable) else StateEncoder(state_shape)
+        return cls(greedy_actions(q_table, encoder, action_space_size), encoder.dims)
+
+    @classmethod
+    def from_agent(cls, agent):
+        if not hasattr(agent, 'policies'):
+            policy = agent.policy
+            return cls.from_q_table(policy.q_table, policy.encoder.dims, policy.action_space_size)
+
+        # AgentV2: one (x, y) table per carry mask, merged into the (x, y, c1, c2, ...) space;
+        # masks the agent has never been in act like unseen states
+        height, width = agent.position_shape
+        actions = np.zeros((height, width, 1 << agent.num_keys), dtype=np.int8)
+        for mask, policy in zip(agent.masks, agent.policies):
+            actions[:, :, mask] = greedy_actions(
+                policy.q_table, policy.encoder, policy.action_space_size
+            ).reshape(height, width)
+        # flag i is bit i of the mask, but the first flag is the slowest varying axis
+        flag_axes = tuple(range(2, 2 + agent.num_keys))
+        actions = actions.reshape(height, width, *([2] * agent.num_keys)).transpose(0, 1, *flag_axes[::-1])
+        return cls(actions, actions.shape)
+
+    def choose_action(self, state):
+        if len(state) != len(self._dims) or not all(map(_in_range, state, self._dims)):
+            raise ValueError(f"Invalid state: {state}")
+        return self.actions.item(sum(map(operator.mul, state, self._strides)))
+
+    def choose_actions(self, states):
+        """Actions for an (n, len(dims)) array of observations."""
+        states = np.asarray(states, dtype=np.int64)
+        if states.ndim != 2 or states.shape[1] != len(self._dims) or np.any((states < 0) | (states >= self._dims)):
+            raise ValueError("Invalid states in batch")
+        return self.actions[self.encoder.encode_batch(states)]
+
+    def save(self, path):
+        np.savez(path, actions=self.actions, dims=np.array(self.encoder.dims))
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            return cls(data["actions"], data["dims"])
+
+    def __repr__(self):
+        return f"FrozenPolicy(dims={self.encoder.dims})"
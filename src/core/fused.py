@@ -0,0 +1,288 @@
+"""Whole-episode Q-learning over the compiled environment tables.
+
+``FusedTrainer`` runs batches of training episodes in one function call
+instead of dispatching ``choose_action``/``step``/``learn`` per step. The
+exploration draws come from blocks of raw words of the global legacy NumPy
+generator, consumed exactly as ``np.random.rand()`` and
+``np.random.choice(range(n))`` would, so a seeded run produces the same
+Q-tables, epsilons and episode results as ``Trainer.run_episode``. The
+kernel is compiled with Numba when it is installed.
+"""
+from array import array
+import numpy as np
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+BACKENDS = ("auto", "numba", "python")
+BLOCK_WORDS = 1 << 14
+ARRAY_TYPECODES = {np.dtype(np.float64): "d", np.dtype(np.float32): "f"}
+
+
+def _train_episodes(q, visited, epsilon, episode_counts, table_of, row_of, next_index, reward, done, terminated,
+                    keys_of, start_index, num_rows, num_actions, action_mask, learning_rate, discount,
+                    epsilon_decay, min_epsilon, words, cursor, totals, out_reward, out_length, out_done, out_keys,
+                    out_epsilon, num_episodes):
+    """Trains until ``num_episodes`` episodes are done or ``words`` runs out.
+
+    Written for both Numba arrays and plain Python sequences: ``q`` and
+    ``visited`` are flat ``(table, row, action)`` and ``(table, row)``
+    buffers. ``cursor`` holds (episode, state index, steps, word position,
+    state without a table) and ``totals`` the reward of the running
+    episode, so a call that ran out of random words, or reached a carry
+    mask the agent has no table for yet (``table_of`` is -1 there), can be
+    continued with a new block or new tables.
+    """
+    episode = cursor[0]
+    state = cursor[1]
+    steps = cursor[2]
+    pos = cursor[3]
+    total = totals[0]
+    num_words = len(words)
+
+    while episode < num_episodes:
+        if pos + 2 > num_words:
+            break
+        table = table_of[state]
+        if table < 0:
+            cursor[4] = state
+            break
+        step_pos = pos
+        slot = table * num_rows + row_of[state]
+        row = slot * num_actions
+        visited[slot] = True
+
+        # np.random.rand(): 53 bits from two 32-bit words
+        sample = ((words[pos] >> 5) * 67108864.0 + (words[pos + 1] >> 6)) / 9007199254740992.0
+        pos += 2
+        if sample < epsilon[table]:
+            # np.random.choice(range(n)): masked rejection sampling, one word per try
+            action = num_actions
+            while pos < num_words:
+                value = words[pos] & action_mask
+                pos += 1
+                if value < num_actions:
+                    action = value
+                    break
+            if action == num_actions:
+                pos = step_pos
+                break
+        else:
+            action = 0
+            best = q[row]
+            for a in range(1, num_actions):
+                if q[row + a] > best:
+                    best = q[row + a]
+                    action = a
+
+        index = state * num_actions + action
+        next_state = next_index[index]
+        next_slot = table * num_rows + row_of[next_state]
+        next_row = next_slot * num_actions
+        visited[next_slot] = True
+        best_next = q[next_row]
+        for a in range(1, num_actions):
+            if q[next_row + a] > best_next:
+                best_next = q[next_row + a]
+
+        step_reward = reward[index]
+        temp = step_reward + discount * best_next
+        current = q[row + action]
+        q[row + action] = current + learning_rate * (temp - current)
+
+        total += step_reward
+        steps += 1
+        state = next_state
+        if done[index] or terminated[index]:
+            new_epsilon = epsilon[table] * epsilon_decay
+            if new_epsilon < min_epsilon:
+                new_epsilon = min_epsilon
+            epsilon[table] = new_epsilon
+            episode_counts[table] += 1
+
+            out_reward[episode] = total
+            out_length[episode] = steps
+            out_done[episode] = done[index]
+            out_keys[episode] = keys_of[next_state]
+            out_epsilon[episode] = epsilon[0]
+            episode += 1
+            state = start_index
+            steps = 0
+            total = 0.0
+
+    cursor[0] = episode
+    cursor[1] = state
+    cursor[2] = steps
+    cursor[3] = pos
+    totals[0] = total
+
+
+_train_episodes_numba = numba.njit(cache=True)(_train_episodes) if numba is not None else None
+
+
+def _policies(agent):
+    return agent.policies if hasattr(agent, 'policies') else [agent.policy]
+
+
+def reachable_masks(model):
+    """Carry masks of the states reachable from the start state."""
+    next_index = model.next_index.reshape(model.num_states, -1)
+    reached = np.zeros(model.num_states, dtype=bool)
+    frontier = np.array([model.start_index])
+    reached[frontier] = True
+    while frontier.size:
+        successors = np.unique(next_index[frontier])
+        frontier = successors[~reached[successors]]
+        reached[frontier] = True
+    return np.unique(np.flatnonzero(reached) % model.num_masks)
+
+
+def agent_rows(agent, model):
+    """Row of every model state index in the Q-table an ``Agent``/``AgentV2`` uses there."""
+    observations = model.observations.reshape(model.num_states, -1)
+    if not hasattr(agent, 'policies'):
+        return agent.policy.encoder.encode_batch(observations).astype(np.int64)
+    return agent.policies[0].encoder.encode_batch(observations[:, :2]).astype(np.int64)
+
+
+def agent_slots(agent, model):
+    """Table of every model state index: the policy an ``Agent``/``AgentV2`` uses there, -1 where it has none yet."""
+    if not hasattr(agent, 'policies'):
+        return np.zeros(model.num_states, dtype=np.int64)
+    slot_of_mask = np.full(model.num_masks, -1, dtype=np.int64)
+    for slot, mask in enumerate(agent.masks):
+        if mask < model.num_masks:
+            slot_of_mask[mask] = slot
+    return slot_of_mask[np.arange(model.num_states) % model.num_masks]
+
+
+def agent_tables(agent, model):
+    """(table, row) of every model state index, creating the ``AgentV2`` tables of every reachable carry mask."""
+    if hasattr(agent, 'policies'):
+        for mask in reachable_masks(model).tolist():
+            agent.policy_for_mask(mask)
+    return agent_slots(agent, model), agent_rows(agent, model)
+
+
+class FusedTrainer:
+    """Trains a dense ``Agent`` or ``AgentV2`` on an ``EnvModel`` a batch of episodes at a time.
+
+    The Q-tables, visited flags, epsilons and episode counters of the
+    agent's policies are updated in place after every ``run``. ``AgentV2``
+    tables are added when the kernel first reaches their carry mask, in
+    the same order as the reference loop adds them.
+    """
+
+    def __init__(self, agent, model, backend="auto"):
+        if backend not in BACKENDS:
+            raise ValueError(f"Invalid fused training backend: {backend}")
+        if backend == "numba" and numba is None:
+            raise ImportError("The numba backend requires Numba to be installed.")
+        self.backend = "numba" if backend != "python" and numba is not None else "python"
+
+        self.agent = agent
+        self.model = model
+        self.row_of = agent_rows(agent, model)
+        self.policies = _policies(agent)
+        for policy in self.policies:
+            if policy.storage != "dense":
+                raise ValueError("Fused training requires dense Q-table storage.")
+            if policy.planner is not None or policy.traces is not None:
+                raise ValueError("Fused training does not support planning or eligibility traces.")
+        first = self.policies[0]
+        if any(p.q_table.values.shape != first.q_table.values.shape for p in self.policies):
+            raise ValueError("Fused training needs Q-tables of the same shape.")
+        self.dtype = first.q_table.values.dtype
+        if self.backend == "python" and self.dtype not in ARRAY_TYPECODES:
+            raise ValueError(f"Fused training does not support {self.dtype} Q-tables without Numba.")
+
+        self.num_rows, self.num_actions = first.q_table.values.shape
+        self.action_mask = (1 << (self.num_actions - 1).bit_length()) - 1
+        self.keys_of = model.observations.reshape(model.num_states, -1)[:, 2:].sum(axis=1).astype(np.int64)
+        self.done = model.done.reshape(-1)
+        self.terminated = model.terminated.reshape(-1)
+        self.reward = model.reward.reshape(-1)
+
+    def run(self, episodes):
+        """Runs ``episodes`` episodes; returns their reward, length, done, keys and epsilon arrays."""
+        first = self.policies[0]
+        model = self.model
+        names = ("reward", "length", "done", "keys", "epsilon")
+        out = {
+            "reward": np.zeros(episodes),
+            "length": np.zeros(episodes, dtype=np.int64),
+            "done": np.zeros(episodes, dtype=bool),
+            "keys": np.zeros(episodes, dtype=np.int64),
+            "epsilon": np.zeros(episodes),
+        }
+        cursor = np.array([0, model.start_index, 0, 0, -1], dtype=np.int64)
+        totals = np.zeros(1)
+        static = [self.row_of, model.next_index, self.reward, self.done, self.terminated, self.keys_of]
+
+        if self.backend == "python":
+            # Python containers keep every element access free of NumPy scalars
+            static = [a.tolist() for a in static]
+            outputs = [out[name].tolist() for name in names]
+            cursor, totals = cursor.tolist(), totals.tolist()
+            kernel = _train_episodes
+        else:
+            outputs = [out[name] for name in names]
+            kernel = _train_episodes_numba
+        buffers = self._buffers()
+
+        legacy_state = np.random.get_state()
+        bit_generator = np.random.MT19937()
+        bit_generator.state = {"bit_generator": "MT19937",
+                               "state": {"key": legacy_state[1], "pos": legacy_state[2]}}
+        while cursor[0] < episodes:
+            block_state = bit_generator.state
+            words = bit_generator.random_raw(BLOCK_WORDS).astype(np.int64)
+            cursor[3] = 0
+            kernel(*buffers, *static, model.start_index, self.num_rows, self.num_actions, self.action_mask,
+                   first.learning_rate, first.discount_factor, first.epsilon_decay, first.min_epsilon,
+                   words.tolist() if self.backend == "python" else words,
+                   cursor, totals, *outputs, episodes)
+            # leave the generator right after the last word the kernel used
+            bit_generator.state = block_state
+            bit_generator.random_raw(cursor[3])
+            if cursor[4] >= 0:
+                # first step in a carry mask without a table: add it like AgentV2.choose_action would
+                self._store(buffers)
+                self.agent.policy_for_mask(int(cursor[4]) % model.num_masks)
+                cursor[4] = -1
+                buffers = self._buffers()
+        key_state = bit_generator.state["state"]
+        np.random.set_state(("MT19937", key_state["key"], key_state["pos"], legacy_state[3], legacy_state[4]))
+
+        self._store(buffers)
+        if self.backend == "python":
+            out = {name: np.array(values, dtype=out[name].dtype) for name, values in zip(names, outputs)}
+        return out
+
+    def _buffers(self):
+        """Kernel inputs holding the policies' current tables, epsilons and episode counts."""
+        policies = self.policies
+        q = np.concatenate([p.q_table.values.reshape(-1) for p in policies])
+        visited = np.concatenate([p.q_table.visited for p in policies])
+        epsilon = np.array([p.epsilon for p in policies], dtype=np.float64)
+        episode_counts = np.zeros(len(policies), dtype=np.int64)
+        table_of = agent_slots(self.agent, self.model)
+        if self.backend == "python":
+            return [array(ARRAY_TYPECODES[self.dtype], q.tolist()), bytearray(visited.tobytes()), epsilon.tolist(),
+                    episode_counts.tolist(), table_of.tolist()]
+        return [q, visited, epsilon, episode_counts, table_of]
+
+    def _store(self, buffers):
+        q, visited, epsilon, episode_counts = buffers[:4]
+        if self.backend == "python":
+            q = np.array(q, dtype=self.dtype)
+            visited = np.frombuffer(bytes(visited), dtype=bool)
+
+        size = self.num_rows * self.num_actions
+        for i, policy in enumerate(self.policies):
+            policy.q_table.values.reshape(-1)[:] = q[i * size:(i + 1) * size]
+            policy.q_table.visited[:] = visited[i * self.num_rows:(i + 1) * self.num_rows]
+            policy.epsilon = float(epsilon[i])
+            policy.current_episode += int(episode_counts[i])
@@ -0,0 +1,217 @@
+import functools
+import os
+from collections import deque
+import numpy as np
+from .config import EnvConfig as envcfg
+
+# text format, one character per cell; the start cell is walkable
+CELL_CHARS = {
+    'W': envcfg.WALL,
+    '.': envcfg.WALKABLE,
+    'L': envcfg.LAVA,
+    'K': envcfg.KEY,
+    'G': envcfg.GOAL,
+    'A': envcfg.WALKABLE,
+}
+CHAR_CELLS = {cell: char for char, cell in CELL_CHARS.items() if char != 'A'}
+
+
+class Layout:
+    """A static dungeon: cell types plus the agent's start position."""
+
+    def __init__(self, grid, start_position, name=None):
+        self.grid = np.array(grid, dtype=np.int32)
+        self.grid.setflags(write=False)
+        self.start_position = tuple(int(v) for v in start_position)
+        self.name = name
+
+        if self.grid[self.start_position] not in (envcfg.WALKABLE, envcfg.AGENT):
+            raise ValueError(f"Start position {self.start_position} is not walkable.")
+        if self.grid[self.start_position] == envcfg.AGENT:
+            grid = self.grid.copy()
+            grid[self.start_position] = envcfg.WALKABLE
+            grid.setflags(write=False)
+            self.grid = grid
+
+    @property
+    def grid_size(self):
+        return self.grid.shape
+
+    @property
+    def num_keys(self):
+        return int(np.count_nonzero(self.grid == envcfg.KEY))
+
+    def to_text(self):
+        rows = []
+        for i, row in enumerate(self.grid):
+            chars = [CHAR_CELLS[cell] for cell in row]
+            if i == self.start_position[0]:
+                chars[self.start_position[1]] = 'A'
+            rows.append("".join(chars))
+        return "\n".join(rows) + "\n"
+
+    def save(self, path):
+        if path.endswith(".npz"):
+            np.savez_compressed(path, grid=self.grid, start_position=np.array(self.start_position))
+        else:
+            with open(path, "w") as f:
+                f.write(self.to_text())
+
+    def __repr__(self):
+        return f"Layout(name={self.name!r}, grid_size={self.grid_size}, num_keys={self.num_keys})"
+
+
+def build_default_layout():
+    grid = np.full(shape=envcfg.GRID_SIZE, fill_value=envcfg.LAVA, dtype=np.int32)
+
+    # walls
+    grid[5, 5:] = envcfg.WALL
+    grid[3:8, 5] = envcfg.WALL
+    grid[3, :5] = envcfg.WALL
+    grid[7, :5] = envcfg.WALL
+    grid[6, 0] = envcfg.WALL
+    grid[4, 0] = envcfg.WALL
+
+    # walkable
+    grid[1:10, 2] = envcfg.WALKABLE
+    grid[5, 0:5] = envcfg.WALKABLE
+    grid[4, 1:5] = envcfg.WALKABLE
+    grid[6, 1:5] = envcfg.WALKABLE
+    grid[9, 2:10] = envcfg.WALKABLE
+    grid[1, 2:10] = envcfg.WALKABLE
+
+    # keys
+    grid[1, 9] = envcfg.KEY
+    grid[9, 9] = envcfg.KEY
+
+    # goal
+    grid[envcfg.GOAL_POSITION] = envcfg.GOAL
+
+    return grid
+
+
+@functools.lru_cache(maxsize=None)
+def default_layout():
+    return Layout(build_default_layout(), envcfg.INITIAL_AGENT_POSITION, name="default")
+
+
+def parse_layout(text, name=None):
+    lines = [line.rstrip("\n") for line in text.splitlines() if line.strip() and not line.startswith(";")]
+    width = max(len(line) for line in lines)
+    grid = np.full((len(lines), width), envcfg.WALL, dtype=np.int32)
+    start_position = None
+
+    for i, line in enumerate(lines):
+        for j, char in enumerate(line):
+            if char not in CELL_CHARS:
+                raise ValueError(f"Invalid layout character {char!r} at row {i}, column {j}.")
+            grid[i, j] = CELL_CHARS[char]
+            if char == 'A':
+                if start_position is not None:
+                    raise ValueError("Layout has more than one start position.")
+                start_position = (i, j)
+
+    if start_position is None:
+        raise ValueError("Layout has no start position ('A').")
+    return Layout(grid, start_position, name=name)
+
+
+def load_layout(path):
+    name = os.path.splitext(os.path.basename(path))[0]
+    if path.endswith(".npz"):
+        with np.load(path) as data:
+            return Layout(data["grid"], data["start_position"], name=name)
+    with open(path) as f:
+        return parse_layout(f.read(), name=name)
+
+
+def _carve_maze(height, width, rng):
+    # randomized depth-first search over the odd cells
+    grid = np.full((height, width), envcfg.WALL, dtype=np.int32)
+    grid[1, 1] = envcfg.WALKABLE
+    stack = [(1, 1)]
+    steps = ((-2, 0), (2, 0), (0, -2), (0, 2))
+
+    while stack:
+        x, y = stack[-1]
+        neighbours = [
+            (x + dx, y + dy) for dx, dy in steps
+            if 0 < x + dx < height - 1 and 0 < y + dy < width - 1 and grid[x + dx, y + dy] == envcfg.WALL
+        ]
+        if not neighbours:
+            stack.pop()
+            continue
+        nx, ny = neighbours[rng.integers(len(neighbours))]
+        grid[(x + nx) // 2, (y + ny) // 2] = envcfg.WALKABLE
+        grid[nx, ny] = envcfg.WALKABLE
+        stack.append((nx, ny))
+
+    return grid
+
+
+def _distances(grid, start):
+    distances = np.full(grid.shape, -1, dtype=np.int64)
+    distances[start] = 0
+    queue = deque([start])
+    while queue:
+        x, y = queue.popleft()
+        for nx, ny in ((x - 1, y), (x + 1, y), (x, y - 1), (x, y + 1)):
+            if 0 <= nx < grid.shape[0] and 0 <= ny < grid.shape[1] \
+                    and distances[nx, ny] < 0 and grid[nx, ny] == envcfg.WALKABLE:
+                distances[nx, ny] = distances[x, y] + 1
+                queue.append((nx, ny))
+    return distances
+
+
+@functools.lru_cache(maxsize=32)
+def generate_layout(height, width, num_keys=2, lava_density=0.1, seed=0):
+    """Random maze with the start in a corner, the goal at the farthest cell and keys on random passages.
+
+    ``lava_density`` is the fraction of wall cells turned into lava, so
+    every generated dungeon stays solvable. Results are cached per
+    argument tuple (including the seed).
+    """
+    if height < 5 or width < 5:
+        raise ValueError("Generated layouts need to be at least 5x5.")
+    rng = np.random.default_rng(seed)
+    grid = _carve_maze(height, width, rng)
+    start_position = (1, 1)
+
+    distances = _distances(grid, start_position)
+    passages = np.argwhere(distances > 0)
+    if len(passages) < num_keys + 1:
+        raise ValueError(f"A {height}x{width} maze has too few cells for {num_keys} keys.")
+
+    goal = tuple(passages[np.argmax(distances[tuple(passages.T)])])
+    candidates = np.array([p for p in passages if tuple(p) != goal])
+    keys = candidates[rng.choice(len(candidates), size=num_keys, replace=False)]
+
+    walls = np.argwhere(grid == envcfg.WALL)
+    lava = walls[rng.random(len(walls)) < lava_density]
+    grid[tuple(lava.T)] = envcfg.LAVA
+    grid[tuple(keys.T)] = envcfg.KEY
+    grid[goal] = envcfg.GOAL
+
+    name = f"maze_{height}x{width}_k{num_keys}_l{lava_density}_s{seed}"
+    return Layout(grid, start_position, name=name)
+
+
+def get_layout(config=envcfg):
+    """Layout selected by ``EnvConfig``: a layout file, a generated maze or the default dungeon."""
+    if config.LAYOUT_PATH:
+        return load_layout(config.LAYOUT_PATH)
+
+    if not config.GENERATE_LAYOUT:
+        return default_layout()
+
+    height, width = config.GENERATED_GRID_SIZE
+    args = (height, width, config.NUM_KEYS, config.LAVA_DENSITY, config.LAYOUT_SEED)
+    if config.LAYOUT_CACHE_DIR:
+        path = os.path.join(config.LAYOUT_CACHE_DIR, "maze_{}x{}_k{}_l{}_s{}.npz".format(*args))
+        if os.path.exists(path):
+            return load_layout(path)
+        layout = generate_layout(*args)
+        os.makedirs(config.LAYOUT_CACHE_DIR, exist_ok=True)
+        layout.save(path)
+        return layout
+    return generate_layout(*args)
@@ -0,0 +1,236 @@
+"""Per-episode training metrics.
+
+``MetricsWriter`` appends records to an append-only columnar file
+(``metrics.dqm``): the magic bytes, a uint32 header length and a JSON
+header naming the columns, followed by chunks of a uint32 row count and
+one contiguous block per column. ``MetricsReader`` memory-maps the
+chunks, so plots can read a strided subset of a multi-million-episode run
+without loading it. ``RollingStats`` keeps windowed means in O(1).
+"""
+import json
+import os
+import struct
+import numpy as np
+
+MAGIC = b"DQMETRIC"
+VERSION = 1
+FILENAME = "metrics.dqm"
+COLUMNS = (
+    ("reward", "<f4"),
+    ("length", "<i4"),
+    ("success", "u1"),
+    ("epsilon", "<f4"),
+    ("keys", "u1"),
+)
+
+
+class RollingStats:
+    """Mean and variance over the last ``window`` values, plus the mean of everything seen."""
+
+    def __init__(self, window=100):
+        self.window = window
+        self.values = [0.0] * window
+        self.index = 0
+        self.size = 0
+        self.total = 0.0
+        self.total_sq = 0.0
+        self.count = 0
+        self.grand_total = 0.0
+
+    def add(self, value):
+        value = float(value)
+        if self.size == self.window:
+            old = self.values[self.index]
+            self.total -= old
+            self.total_sq -= old * old
+        else:
+            self.size += 1
+        self.values[self.index] = value
+        self.total += value
+        self.total_sq += value * value
+        self.count += 1
+        self.grand_total += value
+
+        self.index += 1
+        if self.index == self.window:
+            # re-summing once per window keeps rounding errors from accumulating, amortized O(1)
+            self.index = 0
+            self.total = sum(self.values)
+            self.total_sq = sum(v * v for v in self.values)
+
+    @property
+    def mean(self):
+        return self.total / self.size if self.size else 0.0
+
+    @property
+    def variance(self):
+        if not self.size:
+            return 0.0
+        mean = self.total / self.size
+        return max(0.0, self.total_sq / self.size - mean * mean)
+
+    @property
+    def std(self):
+        return self.variance ** 0.5
+
+    @property
+    def overall_mean(self):
+        return self.grand_total / self.count if self.count else 0.0
+
+    def state(self):
+        state = {name: getattr(self, name) for name in
+                 ("window", "index", "size", "total", "total_sq", "count", "grand_total")}
+        state["values"] = list(self.values)
+        return state
+
+    @classmethod
+    def from_state(cls, state):
+        stats = cls(state["window"])
+        for name, value in state.items():
+            setattr(stats, name, list(value) if name == "values" else value)
+        return stats
+
+
+def _read_header(f, path):
+    if f.read(len(MAGIC)) != MAGIC:
+        raise ValueError(f"{path} is not a metrics file.")
+    (header_length,) = struct.unpack("<I", f.read(4))
+    header = json.loads(f.read(header_length).decode("utf-8"))
+    if header["version"] > VERSION:
+        raise ValueError(f"{path} uses metrics format version {header['version']}, "
+                         f"this version reads up to {VERSION}.")
+    return header, f.tell()
+
+
+class MetricsReader:
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            header, offset = _read_header(f, path)
+        self.columns = [(name, np.dtype(dtype)) for name, dtype in header["columns"]]
+        self.row_size = sum(dtype.itemsize for _, dtype in self.columns)
+
+        # (file offset of the first column block, rows); a chunk cut short by a crash is ignored
+        self.chunks = []
+        file_size = os.path.getsize(path)
+        with open(path, "rb") as f:
+            while offset + 4 <= file_size:
+                f.seek(offset)
+                (rows,) = struct.unpack("<I", f.read(4))
+                end = offset + 4 + rows * self.row_size
+                if end > file_size:
+                    break
+                self.chunks.append((offset + 4, rows))
+                offset = end
+        self.end_offset = offset
+
+    def __len__(self):
+        return sum(rows for _, rows in self.chunks)
+
+    def _column_offset(self, chunk_offset, rows, name):
+        for column, dtype in self.columns:
+            if column == name:
+                return chunk_offset, dtype
+            chunk_offset += rows * dtype.itemsize
+        raise KeyError(name)
+
+    def column(self, name, start=0, stop=None, step=1):
+        """Rows ``start:stop:step`` of a column; only the pages holding those rows are read."""
+        stop = len(self) if stop is None else min(stop, len(self))
+        parts = []
+        first_row = 0
+        for chunk_offset, rows in self.chunks:
+            if first_row + rows > start and first_row < stop:
+                offset, dtype = self._column_offset(chunk_offset, rows, name)
+                # first index in this chunk that lies on the global stride
+                begin = max(start, first_row)
+                begin += (start - begin) % step
+                if begin < min(stop, first_row + rows):
+                    data = np.memmap(self.path, dtype=dtype, mode="r", offset=offset, shape=(rows,))
+                    parts.append(np.array(data[begin - first_row:min(stop, first_row + rows) - first_row:step]))
+            first_row += rows
+        if not parts:
+            return np.zeros(0, dtype=dict(self.columns)[name])
+        return np.concatenate(parts)
+
+    def downsample_factor(self, max_points):
+        return max(1, -(-len(self) // max_points))
+
+
+class MetricsWriter:
+    """Buffers records in memory and appends them to the file one chunk at a time.
+
+    With ``truncate_to`` an existing file is cut back to that many rows and
+    appended to, as when resuming from a checkpoint; otherwise it is
+    replaced.
+    """
+
+    def __init__(self, path, chunk_size=4096, columns=COLUMNS, truncate_to=None):
+        self.path = path
+        self.chunk_size = chunk_size
+        self.columns = [(name, np.dtype(dtype)) for name, dtype in columns]
+        self._buffers = [[] for _ in self.columns]
+        self.rows = 0
+
+        if truncate_to is not None and os.path.exists(path):
+            self._file = self._truncate(truncate_to)
+        else:
+            header = json.dumps({"version": VERSION, "columns": [[name, dtype.str] for name, dtype in self.columns]})
+            header = header.encode("utf-8")
+            self._file = open(path, "wb")
+            self._file.write(MAGIC)
+            self._file.write(struct.pack("<I", len(header)))
+            self._file.write(header)
+
+    def _truncate(self, rows):
+        reader = MetricsReader(self.path)
+        if [name for name, _ in reader.columns] != [name for name, _ in self.columns]:
+            raise ValueError(f"{self.path} has different columns.")
+        rows = min(rows, len(reader))
+
+        offset = reader.end_offset
+        kept = 0
+        tail = None
+        for chunk_offset, chunk_rows in reader.chunks:
+            if kept + chunk_rows > rows:
+                offset = chunk_offset - 4
+                tail = [reader.column(name, kept, rows) for name, _ in self.columns]
+                break
+            kept += chunk_rows
+
+        f = open(self.path, "r+b")
+        f.truncate(offset)
+        f.seek(offset)
+        self._file = f
+        self.rows = kept
+        if tail is not None and len(tail[0]):
+            self._buffers = [column.tolist() for column in tail]
+            self.rows = rows
+            self.flush()
+        return f
+
+    def append(self, *values):
+        for buffer, value in zip(self._buffers, values):
+            buffer.append(value)
+        self.rows += 1
+        if len(self._buffers[0]) >= self.chunk_size:
+            self._write_chunk()
+
+    def _write_chunk(self):
+        rows = len(self._buffers[0])
+        if not rows:
+            return
+        self._file.write(struct.pack("<I", rows))
+        for (_, dtype), buffer in zip(self.columns, self._buffers):
+            self._file.write(np.asarray(buffer, dtype=dtype).tobytes())
+        self._buffers = [[] for _ in self.columns]
+
+    def flush(self):
+        if self._file.closed:
+            return
+        self._write_chunk()
+        self._file.flush()
+
+    def close(self):
+        self.flush()
+        self._file.close()
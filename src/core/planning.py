@@ -0,0 +1,222 @@
+import heapq
+import numpy as np
+from .config import EnvConfig as envcfg
+from .config import LearningConfig as cfg
+
+
+def _scipy_sparse(caller):
+    # scipy is only imported by the solvers that need it
+    try:
+        import scipy.sparse as sparse
+        import scipy.sparse.linalg as sparse_linalg
+    except ImportError:
+        raise ImportError(f"{caller} requires scipy.") from None
+    return sparse, sparse_linalg
+
+
+def _flat_tables(model):
+    next_index = (model.next_position * model.num_masks + model.next_mask).reshape(-1, model.num_actions)
+    continues = ~(model.done | model.terminated).reshape(-1, model.num_actions)
+    rewards = model.reward.reshape(-1, model.num_actions)
+    return next_index, continues, rewards
+
+
+def label_setting_values(model, discount_factor=cfg.DISCOUNT_FACTOR):
+    """State values from a Dijkstra-style sweep, used to initialize the iterative solvers.
+
+    Key masks only grow, so masks are solved from the most keys to the
+    fewest. Within a mask every move between positions costs, so the
+    state with the best tentative value is final and its value can be
+    pushed to its predecessors; leaving the mask (key, goal, lava) or
+    staying put forever are the seeds. Large corridors then cost one heap
+    pass instead of one full sweep per cell.
+    """
+    next_index, continues, rewards = _flat_tables(model)
+    num_masks = model.num_masks
+    states = np.arange(next_index.shape[0])
+    next_masks = next_index % num_masks
+    state_masks = states % num_masks
+
+    same_mask = continues & (next_masks == state_masks[:, None])
+    self_loop = same_mask & (next_index == states[:, None])
+    moves = same_mask & ~self_loop
+    if discount_factor < 1:
+        loop_values = rewards / (1 - discount_factor)
+    else:
+        loop_values = np.where(rewards < 0, -np.inf, np.inf)
+
+    values = np.zeros(len(states))
+    popcounts = [bin(mask).count("1") for mask in range(num_masks)]
+    for mask in sorted(range(num_masks), key=lambda m: -popcounts[m]):
+        mask_states = states[state_masks == mask]
+        exits = np.where(~continues[mask_states], rewards[mask_states], -np.inf)
+        leaves = continues[mask_states] & ~same_mask[mask_states]
+        exits = np.where(leaves, rewards[mask_states] + discount_factor * values[next_index[mask_states]], exits)
+        exits = np.where(self_loop[mask_states], loop_values[mask_states], exits)
+        labels = exits.max(axis=1).tolist()
+
+        # predecessors within the mask, indexed by position
+        sources, actions = np.nonzero(moves[mask_states])
+        targets = next_index[mask_states[sources], actions] // num_masks
+        order = np.argsort(targets, kind="stable")
+        offsets = np.searchsorted(targets[order], np.arange(len(mask_states) + 1)).tolist()
+        predecessors = sources[order].tolist()
+        edge_rewards = rewards[mask_states[sources], actions][order].tolist()
+
+        final = [False] * len(mask_states)
+        heap = [(-label, position) for position, label in enumerate(labels)]
+        heapq.heapify(heap)
+        while heap:
+            negative_value, position = heapq.heappop(heap)
+            if final[position]:
+                continue
+            final[position] = True
+            value = -negative_value
+            for k in range(offsets[position], offsets[position + 1]):
+                previous = predecessors[k]
+                candidate = edge_rewards[k] + discount_factor * value
+                if not final[previous] and candidate > labels[previous]:
+                    labels[previous] = candidate
+                    heapq.heappush(heap, (-candidate, previous))
+
+        values[mask_states] = labels
+
+    return values
+
+
+def value_iteration(model, discount_factor=cfg.DISCOUNT_FACTOR, tolerance=1e-8, max_iterations=100000,
+                    initialize=True):
+    """Optimal Q-values of an ``EnvModel``, shaped (positions, masks, actions).
+
+    The dynamics are deterministic, so each backup is a gather of the next
+    state's value rather than a full matrix product. Terminal transitions
+    (goal reached or lava) do not bootstrap. With ``initialize`` the sweeps
+    start from ``label_setting_values`` and usually stop after a couple of
+    iterations; otherwise they start from zero.
+    """
+    next_index, continues, rewards = _flat_tables(model)
+    discounts = discount_factor * continues
+    if initialize:
+        values = label_setting_values(model, discount_factor)
+    else:
+        values = np.zeros(next_index.shape[0])
+
+    for _ in range(max_iterations):
+        q_values = rewards + discounts * values[next_index]
+        new_values = q_values.max(axis=1)
+        delta = np.max(np.abs(new_values - values))
+        values = new_values
+        if delta < tolerance:
+            break
+
+    q_values = rewards + discounts * values[next_index]
+    return q_values.reshape(model.num_positions, model.num_masks, model.num_actions)
+
+
+def policy_iteration(model, discount_factor=cfg.DISCOUNT_FACTOR, max_iterations=1000, initialize=True):
+    """Same result as ``value_iteration``, evaluating each policy with a sparse linear solve.
+
+    With ``initialize`` the first policy is greedy with respect to
+    ``label_setting_values``.
+    """
+    sparse, sparse_linalg = _scipy_sparse("policy_iteration")
+    next_index, continues, rewards = _flat_tables(model)
+    num_states = next_index.shape[0]
+    states = np.arange(num_states)
+    if initialize:
+        values = label_setting_values(model, discount_factor)
+        policy = (rewards + discount_factor * continues * values[next_index]).argmax(axis=1)
+    else:
+        policy = np.zeros(num_states, dtype=np.int64)
+    identity = sparse.identity(num_states, format="csr")
+
+    for _ in range(max_iterations):
+        rows = states[continues[states, policy]]
+        transitions = sparse.csr_matrix(
+            (np.full(len(rows), discount_factor), (rows, next_index[rows, policy[rows]])),
+            shape=(num_states, num_states)
+        )
+        values = sparse_linalg.spsolve((identity - transitions).tocsc(), rewards[states, policy])
+        q_values = rewards + discount_factor * continues * values[next_index]
+
+        # keep the current action on ties so the iteration terminates
+        best = q_values.argmax(axis=1)
+        improved = q_values[states, best] > q_values[states, policy] + 1e-10
+        if not np.any(improved):
+            break
+        policy = np.where(improved, best, policy)
+
+    return q_values.reshape(model.num_positions, model.num_masks, model.num_actions)
+
+
+def shortest_path_lengths(model):
+    """Fewest steps from every state to finishing (goal with all keys), -1 where it is unreachable.
+
+    A breadth-first search backwards from the finishing transitions; lava
+    transitions are never used.
+    """
+    next_index, continues, _ = _flat_tables(model)
+    finishes = model.done.reshape(-1, model.num_actions).any(axis=1)
+
+    sources, actions = np.nonzero(continues)
+    targets = next_index[sources, actions]
+    order = np.argsort(targets, kind="stable")
+    offsets = np.searchsorted(targets[order], np.arange(len(finishes) + 1)).tolist()
+    predecessors = sources[order].tolist()
+
+    lengths = np.where(finishes, 1, -1).tolist()
+    frontier = np.flatnonzero(finishes).tolist()
+    while frontier:
+        next_frontier = []
+        for state in frontier:
+            length = lengths[state] + 1
+            for k in range(offsets[state], offsets[state + 1]):
+                previous = predecessors[k]
+                if lengths[previous] < 0:
+                    lengths[previous] = length
+                    next_frontier.append(previous)
+        frontier = next_frontier
+    return np.array(lengths, dtype=np.int64)
+
+
+def _standable_positions(model):
+    # the agent never ends a step on a wall or in lava
+    grid = model.grid.ravel()
+    return np.flatnonzero((grid != envcfg.WALL) & (grid != envcfg.LAVA))
+
+
+def to_agent_q_table(model, q_values):
+    """Q-table in ``Agent`` format: {(x, y, c1, c2, ...): [q per action]}."""
+    q_table = {}
+    for mask in range(model.num_masks):
+        carrying = model.carrying_flags(mask)
+        for position in _standable_positions(model):
+            x, y = divmod(int(position), model.grid_size[1])
+            q_table[(x, y, *carrying)] = q_values[position, mask].tolist()
+    return q_table
+
+
+def to_agent_v2_q_tables(model, q_values):
+    """Q-tables in ``AgentV2`` format: {mask: {(x, y): [q per action]}}."""
+    q_tables = {}
+    for mask in range(model.num_masks):
+        q_table = {}
+        for position in _standable_positions(model):
+            q_table[divmod(int(position), model.grid_size[1])] = q_values[position, mask].tolist()
+        q_tables[mask] = q_table
+    return q_tables
+
+
+def solve(model, method="value_iteration", discount_factor=cfg.DISCOUNT_FACTOR):
+    if method == "value_iteration":
+        return value_iteration(model, discount_factor)
+    elif method == "policy_iteration":
+        return policy_iteration(model, discount_factor)
+    raise ValueError(f"Invalid planning method: {method}")
+
+
+def planned_q_table(agent_type, model, method="value_iteration", discount_factor=cfg.DISCOUNT_FACTOR):
+    q_values = solve(model, method, discount_factor)
+    if agent_type == "AgentV2":
+        return to_agent_v2_q_tables(model, q_values)
+    return to_agent_q_table(model, q_values)
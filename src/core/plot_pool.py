@@ -0,0 +1,74 @@
+import multiprocessing
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+
+def has_display():
+    if sys.platform.startswith("linux"):
+        return bool(os.environ.get("DISPLAY") or os.environ.get("WAYLAND_DISPLAY"))
+    return True
+
+
+def render_snapshot(snapshot, output_dir, show_plots=False):
+    """Draws every plot of a training snapshot (see ``Trainer.plot_snapshot``)."""
+    from .visualizer import ANNOTATE_LIMIT, MAX_IMAGE_SIZE, PolicyVisualizer
+
+    os.makedirs(output_dir, exist_ok=True)
+    visualizer = PolicyVisualizer(experiment_path=output_dir, show_plots=show_plots,
+                                  grid_size=snapshot["grid_size"],
+                                  annotate_limit=snapshot.get("annotate_limit", ANNOTATE_LIMIT),
+                                  max_image_size=snapshot.get("max_image_size", MAX_IMAGE_SIZE),
+                                  tile_size=snapshot.get("tile_size", 0))
+    for q_table, suffix, policy_title, value_title in snapshot["tables"]:
+        visualizer.visualize_q_table(q_table, suffix=suffix, policy_title=policy_title, value_title=value_title)
+
+    if snapshot["metrics_path"]:
+        visualizer.visualize_metrics(snapshot["metrics_path"])
+    return output_dir
+
+
+class PlotPool:
+    """Renders plot snapshots in worker processes so training never waits on matplotlib.
+
+    Periodic snapshots are dropped while ``max_pending`` are still queued,
+    so asking for more plots costs at most the snapshot copies; the final
+    plots are submitted with ``drop_if_busy=False``.
+    """
+
+    def __init__(self, max_workers=1, max_pending=2):
+        # spawn: the trainer may run other threads (checkpoint writer) when the pool starts
+        self._executor = ProcessPoolExecutor(max_workers=max_workers,
+                                             mp_context=multiprocessing.get_context("spawn"))
+        self.max_pending = max_pending
+        self._futures = []
+        self._errors = []
+        self.dropped = 0
+
+    def _collect(self):
+        for future in self._futures:
+            if future.done() and future.exception() is not None:
+                self._errors.append(future.exception())
+        self._futures = [future for future in self._futures if not future.done()]
+
+    @property
+    def pending(self):
+        self._collect()
+        return len(self._futures)
+
+    def busy(self):
+        return self.pending >= self.max_pending
+
+    def submit(self, snapshot, output_dir, drop_if_busy=True):
+        if drop_if_busy and self.busy():
+            self.dropped += 1
+            return None
+        future = self._executor.submit(render_snapshot, snapshot, output_dir)
+        self._futures.append(future)
+        return future
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+        self._collect()
+        if self._errors:
+            raise RuntimeError("Plotting failed") from self._errors[0]
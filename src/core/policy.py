@@ -1,5 +1,10 @@
+import itertools
+import operator
 import numpy as np
 from .config import LearningConfig as cfg
+from .q_table import DenseQTable, StateEncoder
+from .dyna import Planner
+from .traces import EligibilityTraces
 
 class Policy:
     def __init__(
@@ -10,24 +15,119 @@ class Policy:
             epsilon=cfg.EPSILON,
             epsilon_decay=cfg.EPSILON_DECAY,
             min_epsilon=cfg.MIN_EPSILON,
-            action_space_size=cfg.ACTION_SPACE_SIZE
+            action_space_size=cfg.ACTION_SPACE_SIZE,
+            storage=cfg.Q_TABLE_STORAGE,
+            state_shape=None,
+            dtype=cfg.Q_TABLE_DTYPE,
+            planning=cfg.PLANNING_MODE,
+            planning_steps=cfg.PLANNING_STEPS,
+            priority_threshold=cfg.PRIORITY_THRESHOLD,
+            traces=cfg.TRACE_MODE,
+            trace_lambda=cfg.TRACE_LAMBDA,
+            trace_cutoff=cfg.TRACE_CUTOFF,
+            trace_max_length=cfg.TRACE_MAX_LENGTH
         ):
         self.learning_rate = learning_rate
         self.discount_factor = discount_factor
-        self.q_table = q_table if q_table is not None else {}
         self.action_space_size = action_space_size
-        self.epsilon = epsilon if q_table is None else 0.0 
+        self.epsilon = epsilon if q_table is None else 0.0
         self.epsilon_decay = epsilon_decay
         self.min_epsilon = min_epsilon
 
-        self.epsilon_history = np.zeros(cfg.MAX_EPISODES, dtype=np.float32)
+        self.encoder = StateEncoder(state_shape) if state_shape is not None else None
+        self.dtype = dtype
+        self.storage = None
+        self.q_table = q_table if q_table is not None else {}
+        self.set_storage(storage)
+
         self.current_episode = 0
 
+        self.planner = None
+        if planning:
+            self.planner = Planner(self, planning, planning_steps, priority_threshold,
+                                   seed=np.random.randint(2 ** 31))
+
+        self.traces = None
+        if traces:
+            self.traces = EligibilityTraces(traces, trace_lambda, discount_factor, trace_cutoff, trace_max_length)
+
+    @classmethod
+    def from_config(cls, config, q_table=None, storage=None, state_shape=None):
+        return cls(
+            q_table=q_table,
+            learning_rate=config.LEARNING_RATE,
+            discount_factor=config.DISCOUNT_FACTOR,
+            epsilon=config.EPSILON,
+            epsilon_decay=config.EPSILON_DECAY,
+            min_epsilon=config.MIN_EPSILON,
+            action_space_size=config.ACTION_SPACE_SIZE,
+            storage=storage or config.Q_TABLE_STORAGE,
+            state_shape=state_shape,
+            dtype=config.Q_TABLE_DTYPE,
+            planning=config.PLANNING_MODE,
+            planning_steps=config.PLANNING_STEPS,
+            priority_threshold=config.PRIORITY_THRESHOLD,
+            traces=config.TRACE_MODE,
+            trace_lambda=config.TRACE_LAMBDA,
+            trace_cutoff=config.TRACE_CUTOFF,
+            trace_max_length=config.TRACE_MAX_LENGTH
+        )
+
+    def set_storage(self, storage):
+        if storage == "dense":
+            if self.encoder is None:
+                raise ValueError("Dense Q-table storage requires a state_shape.")
+            if isinstance(self.q_table, DenseQTable):
+                if self.q_table.encoder != self.encoder:
+                    raise ValueError(f"Q-table uses {self.q_table.encoder}, expected {self.encoder}.")
+            else:
+                self.q_table = DenseQTable.from_dict(
+                    self.q_table, self.encoder, self.action_space_size, dtype=self.dtype
+                )
+        elif storage == "dict":
+            if isinstance(self.q_table, DenseQTable):
+                self.q_table = self.q_table.to_dict()
+        else:
+            raise ValueError(f"Invalid Q-table storage: {storage}")
+        self.storage = storage
+
+    def load_q_table(self, q_table):
+        # unlike passing q_table to the constructor this keeps epsilon, e.g. for warm starts
+        if self.storage == "dense" and not isinstance(q_table, DenseQTable):
+            q_table = DenseQTable.from_dict(q_table, self.encoder, self.action_space_size, dtype=self.dtype)
+        self.q_table = q_table
+        self.set_storage(self.storage)
+
+    def q_table_dict(self):
+        if isinstance(self.q_table, DenseQTable):
+            return self.q_table.to_dict()
+        return self.q_table
+
     def get_action(self, state):
+        if self.storage == "dense":
+            state_id = sum(map(operator.mul, state, self.encoder.strides))
+            self.q_table.visited[state_id] = True
+            if np.random.rand() < self.epsilon:
+                # draws the same number as np.random.choice(range(n)) without building an array first
+                return np.random.randint(self.action_space_size)
+            # like _update_dense: max and index on a Python list beat NumPy calls on a 4-value row
+            row = self.q_table.values[state_id].tolist()
+            return row.index(max(row))
+
         if state not in self.q_table:
             self.q_table[state] = [0] * self.action_space_size
         return self.epsilon_greedy_action(state)
 
+    def greedy_action(self, state):
+        """Best action without exploring or adding the state; unseen states pick action 0 like ``FrozenPolicy``."""
+        if self.storage == "dense":
+            row = self.q_table.values[self.encoder.encode(state)].tolist()
+        else:
+            row = self.q_table.get(state)
+            if row is None:
+                return 0
+        return row.index(max(row))
+
     def epsilon_greedy_action(self, state):
         if np.random.rand() < self.epsilon:
             return np.random.choice(range(self.action_space_size))
@@ -35,15 +135,123 @@ class Policy:
             return self.q_table[state].index(max(self.q_table[state]))
 
     def update_policy(self, state, action, reward, next_state, update_epsilon):
-        if next_state not in self.q_table:
-            self.q_table[next_state] = [0] * self.action_space_size
-        
-        best_next_action = np.argmax(self.q_table[next_state])
-        temp = reward + self.discount_factor * self.q_table[next_state][best_next_action]
-        self.q_table[state][action] += self.learning_rate * (temp - self.q_table[state][action])
+        if self.traces is not None:
+            self._update_traces(state, action, reward, next_state)
+            if update_epsilon:
+                self.traces.clear()
+        elif self.storage == "dense":
+            self._update_dense(state, action, reward, next_state)
+        else:
+            if next_state not in self.q_table:
+                self.q_table[next_state] = [0] * self.action_space_size
+
+            best_next_action = np.argmax(self.q_table[next_state])
+            temp = reward + self.discount_factor * self.q_table[next_state][best_next_action]
+            self.q_table[state][action] += self.learning_rate * (temp - self.q_table[state][action])
+
+        if self.planner is not None:
+            self.planner.observe(self.encoder.encode(state), action, reward, self.encoder.encode(next_state))
 
         if update_epsilon:
-            self.epsilon *= self.epsilon_decay
-            self.epsilon = max(self.epsilon, self.min_epsilon)
-            self.epsilon_history[self.current_episode] = self.epsilon
-            self.current_episode += 1
\ No newline at end of file
+            self.end_episode()
+
+    def end_episode(self):
+        self.epsilon *= self.epsilon_decay
+        self.epsilon = max(self.epsilon, self.min_epsilon)
+        self.current_episode += 1
+
+    def _update_dense(self, state, action, reward, next_state):
+        values = self.q_table.values
+        state_id = self.encoder.encode(state)
+        next_id = self.encoder.encode(next_state)
+        self.q_table.visited[state_id] = True
+        self.q_table.visited[next_id] = True
+
+        # scalar math on Python floats is much cheaper than on NumPy scalars
+        temp = reward + self.discount_factor * max(values[next_id].tolist())
+        current = values.item(state_id, action)
+        values[state_id, action] = current + self.learning_rate * (temp - current)
+
+    def _update_traces(self, state, action, reward, next_state):
+        """Watkins or Peng Q(lambda) update of every pair with a live trace."""
+        traces = self.traces
+        if self.storage == "dense":
+            values = self.q_table.values
+            state_id = self.encoder.encode(state)
+            next_id = self.encoder.encode(next_state)
+            self.q_table.visited[state_id] = True
+            self.q_table.visited[next_id] = True
+            row = values[state_id].tolist()
+            next_best = max(values[next_id].tolist())
+            pair = state_id * self.action_space_size + action
+        else:
+            if next_state not in self.q_table:
+                self.q_table[next_state] = [0] * self.action_space_size
+            row = self.q_table[state]
+            next_best = max(self.q_table[next_state])
+            pair = (state, action)
+
+        target = reward + self.discount_factor * next_best
+        if traces.mode == "watkins":
+            # an exploratory action ends the greedy path the traces follow
+            if row[action] < max(row):
+                traces.clear()
+            traces.visit(pair)
+            self._add_to_traces(self.learning_rate * (target - row[action]))
+        else:
+            # Peng: earlier pairs back up the greedy value, the current pair the action taken
+            traces.visit(pair)
+            self._add_to_traces(self.learning_rate * (target - max(row)), include_newest=False)
+            self._add_to_pair(pair, self.learning_rate * (target - row[action]))
+
+    def _add_to_traces(self, step, include_newest=True):
+        traces = self.traces
+        visits = traces.visits
+        count = len(visits) - (0 if include_newest else 1)
+        if count <= 0:
+            return
+        if self.storage == "dense":
+            pairs = np.fromiter(visits, dtype=np.int64, count=count)
+            ages = traces.step - np.fromiter(visits.values(), dtype=np.int64, count=count)
+            self.q_table.values.reshape(-1)[pairs] += step * traces.weights[ages]
+            return
+        q_table = self.q_table
+        weights = traces.weight_list
+        now = traces.step
+        for (state, action), stamp in itertools.islice(visits.items(), count):
+            q_table[state][action] += step * weights[now - stamp]
+
+    def _add_to_pair(self, pair, step):
+        if self.storage == "dense":
+            self.q_table.values.reshape(-1)[pair] += step
+        else:
+            state, action = pair
+            self.q_table[state][action] += step
+
+    def reset_traces(self):
+        if self.traces is not None:
+            self.traces.clear()
+
+    def _rows(self, state_id, next_id):
+        if self.storage == "dense":
+            values = self.q_table.values
+            return values[state_id], values[next_id]
+        # planning only replays observed transitions, so both states are in the table
+        return self.q_table[self.encoder.decode(state_id)], self.q_table[self.encoder.decode(next_id)]
+
+    def td_error_ids(self, state_id, action, reward, next_id):
+        row, next_row = self._rows(state_id, next_id)
+        if self.storage == "dense":
+            return reward + self.discount_factor * max(next_row.tolist()) - row.item(action)
+        return reward + self.discount_factor * max(next_row) - row[action]
+
+    def update_ids(self, state_id, action, reward, next_id):
+        """Q-learning update on encoded states, used by the planner."""
+        row, next_row = self._rows(state_id, next_id)
+        if self.storage == "dense":
+            temp = reward + self.discount_factor * max(next_row.tolist())
+            current = row.item(action)
+        else:
+            temp = reward + self.discount_factor * max(next_row)
+            current = row[action]
+        row[action] = current + self.learning_rate * (temp - current)
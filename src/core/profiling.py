@@ -0,0 +1,134 @@
+import json
+import os
+from collections import defaultdict
+from time import perf_counter
+
+
+class Profiler:
+    """Cumulative per-phase timers plus Q-table growth and epsilon tracking.
+
+    The trainer calls ``add(phase, start)`` around each phase of a step and
+    ``end_episode`` once per episode. Every ``report_interval`` episodes a
+    line is appended to ``profile.jsonl`` in the experiment directory, and
+    ``profile.json`` always holds the running totals.
+    """
+
+    enabled = True
+
+    def __init__(self, experiment_path=None, report_interval=1000, verbose=True):
+        self.experiment_path = experiment_path
+        self.report_interval = report_interval
+        self.verbose = verbose
+
+        self.totals = defaultdict(float)
+        self.counts = defaultdict(int)
+        self.episodes = 0
+        self.steps = 0
+        self.q_table_size = 0
+        self.epsilon = None
+        self.start_time = perf_counter()
+
+        self._interval_totals = defaultdict(float)
+        self._interval_states_added = 0
+        self._interval_steps = 0
+        self._interval_start = self.start_time
+
+    def add(self, phase, start):
+        now = perf_counter()
+        elapsed = now - start
+        self.totals[phase] += elapsed
+        self.counts[phase] += 1
+        self._interval_totals[phase] += elapsed
+        return now
+
+    def end_episode(self, episode, steps, q_table_size, epsilon):
+        self.episodes += 1
+        self.steps += steps
+        self._interval_steps += steps
+        self._interval_states_added += q_table_size - self.q_table_size
+        self.q_table_size = q_table_size
+        self.epsilon = epsilon
+
+        if self.report_interval and self.episodes % self.report_interval == 0:
+            self.report(episode)
+
+    def report(self, episode):
+        now = perf_counter()
+        interval_time = now - self._interval_start
+        record = {
+            "episode": episode + 1,
+            "steps": self._interval_steps,
+            "wall_time": interval_time,
+            "steps_per_sec": self._interval_steps / interval_time if interval_time else 0.0,
+            "phase_time": dict(self._interval_totals),
+            "states_added": self._interval_states_added,
+            "states_added_per_episode": self._interval_states_added / max(self.report_interval, 1),
+            "q_table_size": self.q_table_size,
+            "epsilon": self.epsilon,
+        }
+
+        if self.verbose:
+            phases = ", ".join(f"{phase} {seconds:.2f}s" for phase, seconds in self._interval_totals.items())
+            print(f"[profile] episode {episode + 1}: {record['steps_per_sec']:.0f} steps/s, "
+                  f"Q-table {self.q_table_size} states (+{self._interval_states_added}). {phases}")
+
+        if self.experiment_path:
+            with open(os.path.join(self.experiment_path, "profile.jsonl"), "a") as f:
+                f.write(json.dumps(record) + "\n")
+            self.save()
+
+        self._interval_totals = defaultdict(float)
+        self._interval_states_added = 0
+        self._interval_steps = 0
+        self._interval_start = now
+
+    def summary(self):
+        wall_time = perf_counter() - self.start_time
+        return {
+            "episodes": self.episodes,
+            "steps": self.steps,
+            "wall_time": wall_time,
+            "steps_per_sec": self.steps / wall_time if wall_time else 0.0,
+            "phase_time": dict(self.totals),
+            "phase_calls": dict(self.counts),
+            "phase_fraction": {phase: seconds / wall_time for phase, seconds in self.totals.items()} if wall_time else {},
+            "q_table_size": self.q_table_size,
+            "epsilon": self.epsilon,
+        }
+
+    def save(self):
+        if self.experiment_path:
+            with open(os.path.join(self.experiment_path, "profile.json"), "w") as f:
+                json.dump(self.summary(), f, indent=2)
+
+    def close(self):
+        self.save()
+        if self.verbose:
+            summary = self.summary()
+            print(f"[profile] {summary['steps']} steps in {summary['wall_time']:.2f}s")
+            for phase, fraction in sorted(summary["phase_fraction"].items(), key=lambda item: -item[1]):
+                print(f"[profile]   {phase:14s} {summary['phase_time'][phase]:8.2f}s ({fraction:6.1%})")
+
+
+class NullProfiler:
+    """Stand-in used when profiling is disabled; every hook is a no-op."""
+
+    enabled = False
+
+    def add(self, phase, start):
+        return start
+
+    def end_episode(self, episode, steps, q_table_size, epsilon):
+        pass
+
+    def report(self, episode):
+        pass
+
+    def close(self):
+        pass
+
+
+def make_profiler(config, experiment_path=None, verbose=True):
+    if not config.PROFILING_ENABLED:
+        return NullProfiler()
+    return Profiler(experiment_path, report_interval=config.PROFILE_INTERVAL, verbose=verbose)
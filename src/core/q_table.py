@@ -0,0 +1,176 @@
+from collections.abc import MutableMapping
+import operator
+import numpy as np
+
+
+class StateEncoder:
+    """Maps state tuples such as (x, y, c1, c2) to flat row ids and back."""
+
+    def __init__(self, dims):
+        self.dims = tuple(int(d) for d in dims)
+        self.size = int(np.prod(self.dims))
+        strides = []
+        stride = 1
+        for dim in reversed(self.dims):
+            strides.append(stride)
+            stride *= dim
+        self.strides = tuple(reversed(strides))
+
+    def encode(self, state):
+        return int(sum(map(operator.mul, state, self.strides)))
+
+    def encode_batch(self, states):
+        states = np.asarray(states, dtype=np.int64)
+        return states @ np.array(self.strides, dtype=np.int64)
+
+    def decode(self, state_id):
+        return tuple(int(v) for v in np.unravel_index(state_id, self.dims))
+
+    def __eq__(self, other):
+        return isinstance(other, StateEncoder) and self.dims == other.dims
+
+    def __repr__(self):
+        return f"StateEncoder(dims={self.dims})"
+
+
+class DenseQTable(MutableMapping):
+    """Q-table stored as one contiguous (n_states, n_actions) array.
+
+    Behaves like the dict-of-lists tables (keys are state tuples, values are
+    rows of action values) so savers and ``PolicyVisualizer`` keep working.
+    Only states that have been touched are reported as keys.
+    """
+
+    def __init__(self, encoder, action_space_size, dtype=np.float64):
+        self.encoder = encoder
+        self.action_space_size = action_space_size
+        self.values = np.zeros((encoder.size, action_space_size), dtype=dtype)
+        self.visited = np.zeros(encoder.size, dtype=bool)
+
+    @classmethod
+    def from_arrays(cls, encoder, values, visited):
+        # wraps existing (possibly memory-mapped) arrays without copying them
+        if values.shape != (encoder.size, values.shape[1]) or visited.shape != (encoder.size,):
+            raise ValueError(f"Arrays of shape {values.shape} and {visited.shape} do not match {encoder}.")
+        table = cls.__new__(cls)
+        table.encoder = encoder
+        table.action_space_size = values.shape[1]
+        table.values = values
+        table.visited = visited
+        return table
+
+    @classmethod
+    def from_dict(cls, q_table, encoder, action_space_size, dtype=np.float64):
+        table = cls(encoder, action_space_size, dtype=dtype)
+        for state, actions in q_table.items():
+            table[state] = actions
+        return table
+
+    def to_dict(self):
+        return {
+            self.encoder.decode(state_id): [float(q) for q in self.values[state_id]]
+            for state_id in np.flatnonzero(self.visited)
+        }
+
+    def __getitem__(self, state):
+        state_id = self.encoder.encode(state)
+        if not self.visited[state_id]:
+            raise KeyError(state)
+        return self.values[state_id]
+
+    def __setitem__(self, state, actions):
+        state_id = self.encoder.encode(state)
+        self.values[state_id] = actions
+        self.visited[state_id] = True
+
+    def __delitem__(self, state):
+        state_id = self.encoder.encode(state)
+        if not self.visited[state_id]:
+            raise KeyError(state)
+        self.values[state_id] = 0
+        self.visited[state_id] = False
+
+    def __contains__(self, state):
+        return bool(self.visited[self.encoder.encode(state)])
+
+    def __iter__(self):
+        for state_id in np.flatnonzero(self.visited):
+            yield self.encoder.decode(state_id)
+
+    def __len__(self):
+        return int(np.count_nonzero(self.visited))
+
+
+class QTableStack:
+    """Dense Q-tables of several carry masks in one (slot, state, action) array.
+
+    A mask gets the next slot the first time it is added and the arrays
+    double when they run out of slots, so memory grows with the masks
+    actually visited rather than with ``2 ** num_keys``.
+    """
+
+    def __init__(self, encoder, action_space_size, dtype=np.float64, capacity=4):
+        self.encoder = encoder
+        self.action_space_size = action_space_size
+        self.values = np.zeros((capacity, encoder.size, action_space_size), dtype=dtype)
+        self.visited = np.zeros((capacity, encoder.size), dtype=bool)
+        self.masks = []
+        self.slots = {}
+
+    @classmethod
+    def from_arrays(cls, encoder, values, visited, masks):
+        # wraps existing (possibly memory-mapped) arrays, they are copied once the stack grows
+        if values.shape[:2] != (len(masks), encoder.size) or visited.shape != values.shape[:2]:
+            raise ValueError(f"Arrays of shape {values.shape} and {visited.shape} do not match "
+                             f"{len(masks)} masks of {encoder}.")
+        stack = cls.__new__(cls)
+        stack.encoder = encoder
+        stack.action_space_size = values.shape[2]
+        stack.values = values
+        stack.visited = visited
+        stack.masks = [int(mask) for mask in masks]
+        stack.slots = {mask: slot for slot, mask in enumerate(stack.masks)}
+        return stack
+
+    def __len__(self):
+        return len(self.masks)
+
+    def add(self, mask):
+        """Slot of ``mask``, allocated if needed; may reallocate ``values`` and ``visited``."""
+        slot = self.slots.get(mask)
+        if slot is not None:
+            return slot
+        slot = len(self.masks)
+        if slot == len(self.values):
+            capacity = max(4, 2 * slot)
+            values = np.zeros((capacity, *self.values.shape[1:]), dtype=self.values.dtype)
+            visited = np.zeros((capacity, self.encoder.size), dtype=bool)
+            values[:slot] = self.values[:slot]
+            visited[:slot] = self.visited[:slot]
+            self.values, self.visited = values, visited
+        self.masks.append(mask)
+        self.slots[mask] = slot
+        return slot
+
+    def table(self, slot):
+        """``DenseQTable`` view of one slot."""
+        return DenseQTable.from_arrays(self.encoder, self.values[slot], self.visited[slot])
+
+    def arrays(self):
+        """(values, visited) of the slots in use."""
+        return self.values[:len(self.masks)], self.visited[:len(self.masks)]
+
+    def load(self, slot, q_table):
+        """Replaces a slot with a ``DenseQTable`` or dict Q-table over the stack's states."""
+        if isinstance(q_table, DenseQTable):
+            if q_table.encoder != self.encoder:
+                raise ValueError(f"Q-table uses {q_table.encoder}, expected {self.encoder}.")
+            self.values[slot] = q_table.values
+            self.visited[slot] = q_table.visited
+            return
+        self.values[slot] = 0
+        self.visited[slot] = False
+        for state, actions in q_table.items():
+            state_id = self.encoder.encode(state)
+            self.values[slot, state_id] = actions
+            self.visited[slot, state_id] = True
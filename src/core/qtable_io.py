@@ -0,0 +1,261 @@
+"""Versioned binary Q-table files (``.qtb``).
+
+Layout: the magic bytes, a little-endian uint32 header length, a JSON
+header, then (64-byte aligned) the dense ``values`` table and the
+``visited`` mask. The header records the dtype, the table shape and the
+state encoding, so files can be opened with ``np.memmap`` without copying.
+``AgentV2`` stacks add a leading slot axis to both arrays and list the
+carry mask of every slot in the header.
+
+Carry flag ``i`` of a state means the i-th key has been picked up. Tables
+written before that meant "at least i + 1 keys"; they have no
+``carry_flags`` marker and are remapped when they are read.
+"""
+import glob
+import itertools
+import json
+import os
+import pickle
+import struct
+import numpy as np
+from .config import EnvConfig as envcfg
+from .q_table import DenseQTable, QTableStack, StateEncoder
+
+MAGIC = b"DQTABLE\0"
+VERSION = 1
+ALIGNMENT = 64
+EXTENSION = ".qtb"
+CARRY_FLAGS = "mask"
+
+
+def _aligned(offset):
+    return (offset + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+
+def save_q_table(path, q_table, encoder=None, dtype=np.float32, fields=None):
+    if not isinstance(q_table, DenseQTable):
+        if encoder is None:
+            raise ValueError("Saving a dict Q-table requires its state encoder.")
+        action_space_size = len(next(iter(q_table.values()))) if q_table else 4
+        q_table = DenseQTable.from_dict(q_table, encoder, action_space_size)
+
+    _write(path, q_table.values, q_table.visited, q_table.encoder, dtype, fields, carry_flags=CARRY_FLAGS)
+
+
+def save_stack(path, stack, num_keys, dtype=np.float32, fields=None):
+    """Writes the slots in use of a ``QTableStack``; the header lists the carry mask of every slot."""
+    values, visited = stack.arrays()
+    _write(path, values, visited, stack.encoder, dtype, fields, masks=list(stack.masks), num_keys=num_keys)
+
+
+def _write(path, values, visited, encoder, dtype, fields, **extra):
+    values = np.ascontiguousarray(values, dtype=dtype)
+    visited = np.ascontiguousarray(visited, dtype=np.uint8)
+    header = {
+        "version": VERSION,
+        "dtype": np.dtype(dtype).str,
+        "shape": list(values.shape),
+        "encoding": {
+            "dims": list(encoder.dims),
+            "fields": fields or _default_fields(len(encoder.dims)),
+        },
+        **extra,
+    }
+
+    # offsets depend on the header length, which depends on the offsets
+    header["values_offset"] = header["visited_offset"] = 0
+    while True:
+        header_bytes = json.dumps(header).encode("utf-8")
+        values_offset = _aligned(len(MAGIC) + 4 + len(header_bytes))
+        visited_offset = _aligned(values_offset + values.nbytes)
+        if header["values_offset"] == values_offset and header["visited_offset"] == visited_offset:
+            break
+        header["values_offset"], header["visited_offset"] = values_offset, visited_offset
+
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(MAGIC)
+        f.write(struct.pack("<I", len(header_bytes)))
+        f.write(header_bytes)
+        f.write(b"\0" * (values_offset - f.tell()))
+        f.write(values.tobytes())
+        f.write(b"\0" * (visited_offset - f.tell()))
+        f.write(visited.tobytes())
+    os.replace(tmp_path, path)
+
+
+def read_header(path):
+    with open(path, "rb") as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{path} is not a binary Q-table file.")
+        (header_length,) = struct.unpack("<I", f.read(4))
+        header = json.loads(f.read(header_length).decode("utf-8"))
+    if header["version"] > VERSION:
+        raise ValueError(f"{path} uses Q-table format version {header['version']}, "
+                         f"this version reads up to {VERSION}.")
+    return header
+
+
+def _read_arrays(path, header, mmap):
+    shape = tuple(header["shape"])
+    dtype = np.dtype(header["dtype"])
+    if mmap:
+        values = np.memmap(path, dtype=dtype, mode="c", offset=header["values_offset"], shape=shape)
+        visited = np.memmap(path, dtype=np.bool_, mode="c", offset=header["visited_offset"], shape=shape[:-1])
+    else:
+        with open(path, "rb") as f:
+            f.seek(header["values_offset"])
+            values = np.fromfile(f, dtype=dtype, count=int(np.prod(shape))).reshape(shape)
+            f.seek(header["visited_offset"])
+            visited = np.fromfile(f, dtype=np.bool_, count=int(np.prod(shape[:-1]))).reshape(shape[:-1])
+    return StateEncoder(header["encoding"]["dims"]), values, visited
+
+
+def load_q_table(path, mmap=True):
+    """Loads a ``.qtb`` file as a ``DenseQTable``.
+
+    With ``mmap`` the arrays are copy-on-write memory maps: pages are
+    shared with the page cache (and other processes reading the file) until
+    they are written to. Tables with count-based carry flags are remapped
+    into memory instead.
+    """
+    header = read_header(path)
+    if "masks" in header:
+        raise ValueError(f"{path} holds a Q-table stack, use load_stack.")
+    q_table = DenseQTable.from_arrays(*_read_arrays(path, header, mmap))
+    if header.get("carry_flags") != CARRY_FLAGS:
+        q_table = remap_count_flags(q_table)
+    return q_table
+
+
+def load_stack(path, mmap=True):
+    """Loads a ``.qtb`` file written by ``save_stack`` as a ``QTableStack``, memory-mapped like ``load_q_table``."""
+    header = read_header(path)
+    if "masks" not in header:
+        raise ValueError(f"{path} holds a single Q-table, use load_q_table.")
+    encoder, values, visited = _read_arrays(path, header, mmap)
+    return QTableStack.from_arrays(encoder, values, visited, header["masks"])
+
+
+def remap_count_flags(q_table):
+    """Moves a table with count-based carry flags (flag i: at least i + 1 keys) to per-key flags.
+
+    Every carry mask gets the row of the count-based state with as many
+    keys. Tables without flags, such as ``AgentV2`` position tables, are
+    returned as they are.
+    """
+    if isinstance(q_table, DenseQTable):
+        dims = q_table.encoder.dims
+        if len(dims) <= 2:
+            return q_table
+        states = np.indices(dims).reshape(len(dims), -1)
+        states[2:] = np.arange(len(dims) - 2)[:, None] < states[2:].sum(axis=0)
+        rows = np.ravel_multi_index(tuple(states), dims)
+        return DenseQTable.from_arrays(q_table.encoder, q_table.values[rows], q_table.visited[rows])
+
+    remapped = {}
+    for state, row in q_table.items():
+        if len(state) <= 2:
+            return q_table
+        num_flags = len(state) - 2
+        for keys in itertools.combinations(range(num_flags), sum(state[2:])):
+            flags = tuple(int(i in keys) for i in range(num_flags))
+            remapped[tuple(state[:2]) + flags] = list(row)
+    return remapped
+
+
+def is_stack_dict(q_table):
+    """True for the pickled form of a Q-table stack.
+
+    That is {"num_keys": k, "position_shape": (h, w), "q_tables": {mask: dict Q-table}};
+    stacks pickled before the position shape was stored lack that key.
+    """
+    return isinstance(q_table, dict) and "q_tables" in q_table
+
+
+def is_table_dict(q_table):
+    """True for the pickled form of an ``Agent`` Q-table: {"state_shape": dims, "q_table": dict Q-table}."""
+    return isinstance(q_table, dict) and "q_table" in q_table
+
+
+def _default_fields(num_dims):
+    return ["x", "y"] + [f"carrying_{i}" for i in range(num_dims - 2)]
+
+
+def infer_encoder(q_table, grid_size=envcfg.GRID_SIZE):
+    """Encoder for a dict Q-table: positions cover the grid (or the largest key seen), flags are binary."""
+    states = np.array([tuple(int(v) for v in state) for state in q_table]) if q_table else np.zeros((1, 2))
+    dims = [max(grid_size[0], states[:, 0].max() + 1), max(grid_size[1], states[:, 1].max() + 1)]
+    dims += [2] * (states.shape[1] - 2)
+    return StateEncoder(dims)
+
+
+def q_table_paths(experiment_path):
+    """Q-table files of an experiment, preferring binary files over pickles.
+
+    Returns a list with one path for ``Agent`` runs and ``AgentV2`` stacks,
+    or one per policy, in order, for ``AgentV2`` runs saved before stacks.
+    """
+    for extension in (EXTENSION, ".pkl"):
+        for name in ("q_table", "q_table_stack"):
+            single = os.path.join(experiment_path, f"{name}{extension}")
+            if os.path.exists(single):
+                return [single]
+        policies = glob.glob(os.path.join(experiment_path, f"q_table_policy_*{extension}"))
+        if policies:
+            return sorted(policies, key=lambda p: int(p.rsplit("q_table_policy_", 1)[1].split(".")[0]))
+    return []
+
+
+def read_q_table(path, mmap=True):
+    if path.endswith(EXTENSION):
+        if "masks" in read_header(path):
+            return load_stack(path, mmap=mmap)
+        return load_q_table(path, mmap=mmap)
+    with open(path, "rb") as f:
+        q_table = pickle.load(f)
+    if is_stack_dict(q_table) or is_table_dict(q_table):
+        return q_table
+    # dicts pickled without their state shape predate per-key carry flags
+    return remap_count_flags(q_table)
+
+
+def convert_experiment(experiment_path, remove_pickles=False, grid_size=envcfg.GRID_SIZE):
+    """Writes a ``.qtb`` next to every ``q_table*.pkl`` of an experiment; returns the new paths."""
+    converted = []
+    for pickle_path in sorted(glob.glob(os.path.join(experiment_path, "q_table*.pkl"))):
+        q_table = read_q_table(pickle_path)
+        binary_path = pickle_path[:-len(".pkl")] + EXTENSION
+        if is_stack_dict(q_table):
+            tables = q_table["q_tables"]
+            if q_table.get("position_shape"):
+                encoder = StateEncoder(q_table["position_shape"])
+            else:
+                encoder = infer_encoder({state: None for table in tables.values() for state in table}, grid_size)
+            action_space_size = next((len(row) for table in tables.values() for row in table.values()), 4)
+            stack = QTableStack(encoder, action_space_size)
+            for mask, table in tables.items():
+                stack.load(stack.add(mask), table)
+            save_stack(binary_path, stack, q_table["num_keys"])
+        elif is_table_dict(q_table):
+            save_q_table(binary_path, q_table["q_table"], StateEncoder(q_table["state_shape"]))
+        else:
+            save_q_table(binary_path, q_table, infer_encoder(q_table, grid_size))
+        converted.append(binary_path)
+        if remove_pickles:
+            os.remove(pickle_path)
+    return converted
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Convert pickled Q-tables of experiment directories to .qtb files.")
+    parser.add_argument("experiments", nargs="+", help="experiment directories (globs allowed)")
+    parser.add_argument("--remove-pickles", action="store_true")
+    args = parser.parse_args()
+
+    for pattern in args.experiments:
+        for experiment_path in sorted(glob.glob(pattern)):
+            for path in convert_experiment(experiment_path, remove_pickles=args.remove_pickles):
+                print(f"Wrote {path}")
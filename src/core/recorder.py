@@ -0,0 +1,111 @@
+import os
+import queue
+import threading
+import numpy as np
+
+FORMATS = ("npz", "png", "gif")
+
+
+class EpisodeRecorder:
+    """Collects rendered frames of chosen episodes and writes them on a background thread.
+
+    Formats: ``npz`` (one compressed ``frames`` array per episode), ``png``
+    (one directory of numbered frames per episode) and ``gif`` (needs
+    Pillow). Only every ``frame_skip``-th frame is kept; the final frame of
+    an episode is always kept.
+    """
+
+    def __init__(self, output_dir, format="npz", frame_skip=1, episodes=None, fps=20, max_pending=8):
+        if format not in FORMATS:
+            raise ValueError(f"Invalid recording format: {format}")
+        if format == "gif":
+            try:
+                import PIL.Image  # noqa: F401
+            except ImportError as e:
+                raise ImportError("GIF recording requires Pillow (pip install pillow).") from e
+
+        self.output_dir = output_dir
+        self.format = format
+        self.frame_skip = max(1, frame_skip)
+        self.episodes = set(episodes) if episodes is not None else None
+        self.fps = fps
+        os.makedirs(output_dir, exist_ok=True)
+
+        self.episode = None
+        self.frames = []
+        self.step = 0
+        self.last_frame = None
+
+        # bounded so a slow disk applies backpressure instead of growing memory
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._errors = []
+        self._writer = threading.Thread(target=self._write_loop, daemon=True)
+        self._writer.start()
+
+    @property
+    def recording(self):
+        return self.episode is not None
+
+    def start_episode(self, episode):
+        self.episode = episode if self.episodes is None or episode in self.episodes else None
+        self.frames = []
+        self.step = 0
+        self.last_frame = None
+
+    def add_frame(self, frame):
+        if not self.recording:
+            return
+        if self.step % self.frame_skip == 0:
+            self.frames.append(frame)
+            self.last_frame = None
+        else:
+            self.last_frame = frame
+        self.step += 1
+
+    def end_episode(self):
+        if not self.recording:
+            return
+        if self.last_frame is not None:
+            self.frames.append(self.last_frame)
+        if self.frames:
+            self._queue.put((self.episode, self.frames))
+        self.episode = None
+        self.frames = []
+        self._raise_errors()
+
+    def close(self):
+        self._queue.put(None)
+        self._writer.join()
+        self._raise_errors()
+
+    def _raise_errors(self):
+        if self._errors:
+            raise RuntimeError("Frame writer failed") from self._errors[0]
+
+    def _write_loop(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            try:
+                self._write(*item)
+            except Exception as e:
+                self._errors.append(e)
+
+    def _write(self, episode, frames):
+        name = os.path.join(self.output_dir, f"episode_{episode:05d}")
+        if self.format == "npz":
+            np.savez_compressed(f"{name}.npz", frames=np.stack(frames))
+        elif self.format == "png":
+            import pygame
+
+            os.makedirs(name, exist_ok=True)
+            for i, frame in enumerate(frames):
+                surface = pygame.surfarray.make_surface(np.ascontiguousarray(frame.swapaxes(0, 1)))
+                pygame.image.save(surface, os.path.join(name, f"frame_{i:05d}.png"))
+        elif self.format == "gif":
+            from PIL import Image
+
+            images = [Image.fromarray(frame) for frame in frames]
+            images[0].save(f"{name}.gif", save_all=True, append_images=images[1:],
+                           duration=int(1000 * self.frame_skip / self.fps), loop=0)
@@ -1,58 +1,107 @@
+import numpy as np
 import pygame
 import time
 from .config import RenderingConfig as cfg
 
 class Renderer:
-    def __init__(self):
-
-        self.texture_pack = {
-            cfg.WALL: pygame.image.load(f"{cfg.ASSETPATH}/Wall.png"),
-            cfg.WALKABLE: pygame.image.load(f"{cfg.ASSETPATH}/Walkable.png"),
-            cfg.AGENT: pygame.image.load(f"{cfg.ASSETPATH}/Agent.png"),
-            cfg.KEY: pygame.image.load(f"{cfg.ASSETPATH}/Key.png"),
-            cfg.LAVA: pygame.image.load(f"{cfg.ASSETPATH}/Lava.png"),
-            cfg.GOAL: pygame.image.load(f"{cfg.ASSETPATH}/Goal.png")
-        }
+    """Draws the dungeon grid, redrawing only the cells that changed since the last frame.
 
-        self.grid_size = cfg.GRID_SIZE
-        self.cell_size = cfg.CELL_SIZE
+    Textures are scaled to the on-screen tile size once, and tiles shrink
+    so large grids still fit in ``MAX_WINDOW_SIZE``. A headless renderer
+    draws into an offscreen surface (no window, event pump or frame rate
+    limit) whose pixels are available through ``frame()``.
+    """
 
-        native_res = (self.grid_size[1] * self.cell_size, self.grid_size[0] * self.cell_size)
-        window_size = native_res[0] * cfg.UPSCALE_FACTOR, native_res[1] * cfg.UPSCALE_FACTOR
+    def __init__(self, grid_size=None, headless=False):
+        self.grid_size = tuple(grid_size or cfg.GRID_SIZE)
+        rows, cols = self.grid_size
+        max_width, max_height = cfg.MAX_WINDOW_SIZE
+        self.tile_size = max(1, min(cfg.CELL_SIZE * cfg.UPSCALE_FACTOR, max_width // cols, max_height // rows))
+        window_size = cols * self.tile_size, rows * self.tile_size
+        self.headless = headless
 
-        pygame.init()
-        self.screen = pygame.display.set_mode(window_size)
-        self.render_surface = pygame.Surface(native_res)
-        pygame.display.set_caption("Dungeon Environment")
-        self.clock = pygame.time.Clock()
-        time.sleep(1)
+        if headless:
+            self.screen = pygame.Surface(window_size)
+            self.clock = None
+            self.ticks_per_second = 0
+        else:
+            pygame.init()
+            self.screen = pygame.display.set_mode(window_size)
+            pygame.display.set_caption("Dungeon Environment")
+            self.clock = pygame.time.Clock()
+            self.ticks_per_second = cfg.TICKS_PER_SECOND
 
-    def draw_grid(self, grid):
+        self.texture_pack = self._load_textures()
+        self.previous_grid = None
+        if not headless:
+            time.sleep(1)
+
+    def _load_textures(self):
+        names = {
+            cfg.WALL: "Wall",
+            cfg.WALKABLE: "Walkable",
+            cfg.AGENT: "Agent",
+            cfg.KEY: "Key",
+            cfg.LAVA: "Lava",
+            cfg.GOAL: "Goal",
+        }
+        tile = (self.tile_size, self.tile_size)
+        textures = {
+            cell_type: pygame.transform.scale(pygame.image.load(f"{cfg.ASSETPATH}/{name}.png"), tile)
+            for cell_type, name in names.items()
+        }
+        if not self.headless:
+            textures = {cell_type: texture.convert_alpha() for cell_type, texture in textures.items()}
 
-        self.render_surface.fill((200, 200, 200))
+        # the agent sprite is drawn on top of a walkable tile
+        agent_tile = textures[cfg.WALKABLE].copy()
+        agent_tile.blit(textures[cfg.AGENT], (0, 0))
+        textures[cfg.AGENT] = agent_tile
+        return textures
 
+    def _handle_events(self):
         for event in pygame.event.get():
             if event.type == pygame.QUIT:
                 pygame.quit()
                 exit()
 
-        # grid
-        for i in range(grid.shape[0]):
-            for j in range(grid.shape[1]):
-                cell_type = grid[i, j]
-
-                if cell_type == cfg.AGENT:
-                    self.render_surface.blit(
-                        self.texture_pack[cfg.WALKABLE],
-                        (j * self.cell_size, i * self.cell_size)
-                    )
-
-                self.render_surface.blit(
-                    self.texture_pack[cell_type],
-                    (j * self.cell_size, i * self.cell_size)
-                )
-            
-        scaled_surface = pygame.transform.scale(self.render_surface, self.screen.get_size())
-        self.screen.blit(scaled_surface, (0, 0))
-        pygame.display.flip()
-        self.clock.tick(cfg.TICKS_PER_SECOND)
\ No newline at end of file
+    def _blit_cells(self, grid, cells):
+        tile = self.tile_size
+        self.screen.blits([
+            (self.texture_pack[grid[i, j]], (j * tile, i * tile))
+            for i, j in cells
+        ], doreturn=False)
+        return [pygame.Rect(j * tile, i * tile, tile, tile) for i, j in cells]
+
+    def draw_grid(self, grid):
+        if self.headless:
+            self._draw(grid)
+            return
+
+        self._handle_events()
+        rects = self._draw(grid)
+        if rects is None:
+            pygame.display.flip()
+        elif rects:
+            pygame.display.update(rects)
+        self.clock.tick(self.ticks_per_second)
+
+    def _draw(self, grid):
+        # returns None after a full redraw, otherwise the dirty rects
+        if self.previous_grid is None or self.previous_grid.shape != grid.shape:
+            self.screen.fill((200, 200, 200))
+            self._blit_cells(grid, list(np.ndindex(grid.shape)))
+            rects = None
+        else:
+            changed = np.argwhere(grid != self.previous_grid).tolist()
+            rects = self._blit_cells(grid, changed) if changed else []
+
+        self.previous_grid = np.array(grid, copy=True)
+        return rects
+
+    def reset(self):
+        self.previous_grid = None
+
+    def frame(self):
+        # (height, width, 3) uint8 copy of the current image
+        return pygame.surfarray.array3d(self.screen).swapaxes(0, 1)
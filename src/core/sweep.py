@@ -0,0 +1,327 @@
+import csv
+import datetime
+import itertools
+import json
+import os
+import random
+import traceback
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, as_completed, wait
+from . import checkpoint
+from .config import LearningConfig, SweepConfig, make_config
+from .trainer import Trainer, new_experiment_path
+
+RESULT_FIELDS = [
+    "final_avg_reward", "final_success_rate", "mean_reward", "final_epsilon", "episodes", "stop_reason", "wall_time",
+]
+
+
+def grid_trials(space):
+    names = list(space)
+    return [dict(zip(names, values)) for values in itertools.product(*(space[name] for name in names))]
+
+
+def random_trials(space, num_samples, seed=None):
+    rng = random.Random(seed)
+    trials = []
+    for _ in range(num_samples):
+        trial = {}
+        for name, values in space.items():
+            if isinstance(values, tuple):
+                trial[name] = rng.uniform(*values)
+            else:
+                trial[name] = rng.choice(values)
+        trials.append(trial)
+    return trials
+
+
+def run_trial(index, overrides, experiment_path):
+    try:
+        config = make_config(LearningConfig, **overrides)
+        summary = Trainer(config, experiment_path=experiment_path, verbose=False).run()
+        return {"trial": index, **overrides, **summary, "experiment_path": experiment_path, "error": ""}
+    except Exception:
+        return {"trial": index, **overrides, "experiment_path": experiment_path, "error": traceback.format_exc()}
+
+
+def run_rung(index, rung, overrides, experiment_path, state=None, return_state=False):
+    """Trains a trial up to ``overrides["MAX_EPISODES"]``; returns its result and, with ``return_state``, its state.
+
+    Later rungs continue from ``state`` (a ``checkpoint.snapshot``) or, without
+    one, from the trial's latest checkpoint on disk.
+    """
+    try:
+        if rung > 0 and state is None:
+            trainer = Trainer.resume(experiment_path, max_episodes=overrides["MAX_EPISODES"], verbose=False)
+        else:
+            config = make_config(LearningConfig, **overrides)
+            trainer = Trainer(config, experiment_path=experiment_path, verbose=False, checkpoint_state=state)
+        summary = trainer.run()
+        state = checkpoint.snapshot(trainer, summary["episodes"]) if return_state else None
+        result = {"trial": index, "rung": rung, **overrides, **summary, "experiment_path": experiment_path,
+                  "error": ""}
+    except Exception:
+        state = None
+        result = {"trial": index, "rung": rung, **overrides, "experiment_path": experiment_path,
+                  "error": traceback.format_exc()}
+    return result, state
+
+
+def rung_budgets(min_episodes, max_episodes, reduction_factor):
+    budgets = []
+    budget = min_episodes
+    while budget < max_episodes:
+        budgets.append(budget)
+        budget *= reduction_factor
+    return budgets + [max_episodes]
+
+
+class Ladder:
+    """Rung bookkeeping of successive halving and ASHA.
+
+    A trial is promoted from rung k once it is among the best
+    ``1/reduction_factor`` of the trials that finished rung k. ASHA promotes
+    as soon as that holds, so workers never wait for a rung to fill up;
+    synchronous halving only promotes once every trial of the rung is done.
+    Trials that converged before their budget are finished: they count
+    towards the rung but leave its promotions to the trials still training.
+    Failed trials are never promoted.
+    """
+
+    def __init__(self, num_trials, budgets, reduction_factor=3, asynchronous=True, metric="final_avg_reward"):
+        self.num_trials = num_trials
+        self.budgets = budgets
+        self.reduction_factor = reduction_factor
+        self.asynchronous = asynchronous
+        self.metric = metric
+        self.results = [{} for _ in budgets]
+        self.promoted = [set() for _ in budgets]
+        self.started = [0 for _ in budgets]
+        self.latest = {}
+        self.next_trial = 0
+
+    def score(self, result):
+        return float("-inf") if result["error"] else result[self.metric]
+
+    def ranking(self, rung):
+        return sorted(self.results[rung].values(), key=self.score, reverse=True)
+
+    def final_results(self):
+        """Every trial's result from the highest rung it reached, best first (ties go to the higher rung)."""
+        return sorted(self.latest.values(), key=lambda r: (self.score(r), r["rung"]), reverse=True)
+
+    def next_job(self):
+        """(trial, rung) to run next, or None until more results come in."""
+        for rung in reversed(range(len(self.budgets) - 1)):
+            candidates = self._promotable(rung)
+            if candidates:
+                trial = candidates[0]
+                self.promoted[rung].add(trial)
+                self.started[rung + 1] += 1
+                return trial, rung + 1
+        if self.next_trial < self.num_trials:
+            self.next_trial += 1
+            self.started[0] += 1
+            return self.next_trial - 1, 0
+        return None
+
+    def report(self, result):
+        self.results[result["rung"]][result["trial"]] = result
+        self.latest[result["trial"]] = result
+
+    def may_promote(self, trial):
+        """False once the trial's latest result can never be promoted, so its resume state can be dropped."""
+        result = self.latest[trial]
+        rung = result["rung"]
+        if rung == len(self.budgets) - 1 or not _training(result) or trial in self.promoted[rung]:
+            return False
+        if self._complete(rung):
+            return trial in self._promotable(rung)
+        # ranks only get worse as results come in, so a trial ranked below the most promotions
+        # the rung can still make never leaves it
+        rank = [r["trial"] for r in self._pool(rung)].index(trial)
+        return rank < self._max_top(rung)
+
+    def _pool(self, rung):
+        return [result for result in self.ranking(rung) if _training(result)]
+
+    def _max_top(self, rung):
+        top = self._max_entrants(rung) // self.reduction_factor
+        return top if self.asynchronous else max(1, top)
+
+    def _max_entrants(self, rung):
+        """Upper bound of the trials that will have entered ``rung`` by the end of the sweep."""
+        if rung == 0:
+            return self.num_trials
+        previous = rung - 1
+        # trials still running or yet to arrive in the previous rung, plus those that may still be promoted from it
+        pending = self._max_entrants(previous) - len(self.results[previous])
+        top = self._max_top(previous)
+        waiting = sum(result["trial"] not in self.promoted[previous] for result in self._pool(previous)[:top])
+        return min(self.num_trials, self.started[rung] + pending + waiting)
+
+    def _complete(self, rung):
+        if rung == 0:
+            filled = self.next_trial == self.num_trials
+        else:
+            filled = self._complete(rung - 1) and not self._promotable(rung - 1)
+        return filled and len(self.results[rung]) == self.started[rung]
+
+    def _promotable(self, rung):
+        finished = sum(not result["error"] for result in self.results[rung].values())
+        if self.asynchronous:
+            top = finished // self.reduction_factor
+        elif self._complete(rung):
+            top = max(1, finished // self.reduction_factor)
+        else:
+            return []
+        return [result["trial"] for result in self._pool(rung)[:top] if result["trial"] not in self.promoted[rung]]
+
+
+def _training(result):
+    # still training: neither failed nor converged before its budget
+    return not result["error"] and result["stop_reason"] == "max_episodes"
+
+
+class Sweep:
+    def __init__(self, config=SweepConfig, sweep_path=None):
+        self.config = config
+        self.sweep_path = sweep_path or new_experiment_path(
+            name=datetime.datetime.now().strftime("sweep-%Y%m%d-%H%M%S"))
+
+        if config.MODE == "grid":
+            trials = grid_trials(config.SPACE)
+        elif config.MODE == "random":
+            trials = random_trials(config.SPACE, config.NUM_SAMPLES)
+        else:
+            raise ValueError(f"Invalid sweep mode: {config.MODE}")
+
+        if config.SCHEDULER not in ("full", "halving", "asha"):
+            raise ValueError(f"Invalid sweep scheduler: {config.SCHEDULER}")
+        if config.RESUME_FROM not in ("memory", "disk"):
+            raise ValueError(f"Invalid sweep resume source: {config.RESUME_FROM}")
+        if config.SCHEDULER != "full" and config.RESUME_FROM == "disk" and not LearningConfig.CHECKPOINT_INTERVAL:
+            raise ValueError("Resuming promoted trials from disk requires LearningConfig.CHECKPOINT_INTERVAL.")
+
+        # settings every worker shares; workers never touch the global config
+        base = {
+            "MAX_EPISODES": config.MAX_EPISODES,
+            "CONVERGENCE_WINDOW": config.CONVERGENCE_WINDOW,
+            "GENERATE_PLOTS": config.GENERATE_PLOTS,
+            "RENDERING_ENABLED": False,
+            "VISUALIZE_RESULTS": False,
+            "SAVE_RESULTS": True,
+        }
+        self.trials = [{**base, **trial} for trial in trials]
+
+    def run(self):
+        if self.config.SCHEDULER != "full":
+            return self.run_ladder()
+        results = []
+        print(f"Running {len(self.trials)} trials on {self.config.MAX_WORKERS} workers: {self.sweep_path}")
+        with ProcessPoolExecutor(max_workers=self.config.MAX_WORKERS) as executor:
+            futures = [
+                executor.submit(run_trial, i, trial, os.path.join(self.sweep_path, f"run_{i:04d}"))
+                for i, trial in enumerate(self.trials)
+            ]
+            for future in as_completed(futures):
+                result = future.result()
+                results.append(result)
+                if result["error"]:
+                    print(f"Trial {result['trial']} failed:\n{result['error']}")
+                else:
+                    print(f"Trial {result['trial']} ({len(results)}/{len(futures)}): "
+                          f"Avg Reward (last 100): {result['final_avg_reward']:.2f}")
+
+        episodes = sum(r.get("episodes", 0) for r in results)
+        budget = len(results) * self.config.MAX_EPISODES
+        print(f"Ran {episodes}/{budget} episodes, {sum(r.get('stop_reason', '').startswith('converged') for r in results)} "
+              f"trials stopped early.")
+        results.sort(key=lambda r: r.get("final_avg_reward", float("-inf")), reverse=True)
+        self.write_results(results)
+        return results
+
+    def run_ladder(self):
+        """Runs the trials in rungs of growing budgets, continuing promoted trials where they stopped."""
+        cfg = self.config
+        ladder = Ladder(len(self.trials), rung_budgets(cfg.MIN_EPISODES, cfg.MAX_EPISODES, cfg.REDUCTION_FACTOR),
+                        cfg.REDUCTION_FACTOR, asynchronous=cfg.SCHEDULER == "asha")
+        in_memory = cfg.RESUME_FROM == "memory"
+        states = {}
+        print(f"Running {len(self.trials)} trials in rungs of {ladder.budgets} episodes "
+              f"({cfg.SCHEDULER}) on {cfg.MAX_WORKERS} workers: {self.sweep_path}")
+
+        with ProcessPoolExecutor(max_workers=cfg.MAX_WORKERS) as executor:
+            futures = set()
+            while True:
+                while len(futures) < cfg.MAX_WORKERS:
+                    job = ladder.next_job()
+                    if job is None:
+                        break
+                    trial, rung = job
+                    overrides = {**self.trials[trial], "MAX_EPISODES": ladder.budgets[rung]}
+                    futures.add(executor.submit(run_rung, trial, rung, overrides,
+                                                os.path.join(self.sweep_path, f"run_{trial:04d}"),
+                                                states.pop(trial, None), in_memory))
+                if not futures:
+                    break
+                done, futures = wait(futures, return_when=FIRST_COMPLETED)
+                for future in done:
+                    result, state = future.result()
+                    ladder.report(result)
+                    if state is not None:
+                        states[result["trial"]] = state
+                    if result["error"]:
+                        print(f"Trial {result['trial']} failed in rung {result['rung']}:\n{result['error']}")
+                    else:
+                        print(f"Trial {result['trial']} rung {result['rung']} ({result['episodes']} episodes): "
+                              f"Avg Reward (last 100): {result['final_avg_reward']:.2f}")
+                # snapshots are only kept while their trial can still be promoted
+                for trial in [trial for trial in states if not ladder.may_promote(trial)]:
+                    del states[trial]
+
+        results = ladder.final_results()
+        episodes = sum(r.get("episodes", 0) for r in results)
+        print(f"Ran {episodes}/{len(self.trials) * cfg.MAX_EPISODES} episodes, "
+              f"{len(ladder.results[-1])} trials reached the full budget.")
+        self.write_results(results)
+        self.write_ladder(ladder)
+        return results
+
+    def write_ladder(self, ladder):
+        """``ladder.csv``: one row per trial and rung; ``ladder.json``: the ranking and promotions of every rung."""
+        rows = [
+            {**result, "budget": ladder.budgets[rung], "promoted": result["trial"] in ladder.promoted[rung]}
+            for rung in range(len(ladder.budgets)) for result in ladder.ranking(rung)
+        ]
+        fields = ["rung", "budget", "trial", *self.config.SPACE, *RESULT_FIELDS, "promoted", "experiment_path",
+                  "error"]
+        with open(os.path.join(self.sweep_path, "ladder.csv"), "w", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=fields, extrasaction="ignore")
+            writer.writeheader()
+            writer.writerows(rows)
+        rungs = [
+            {
+                "rung": rung,
+                "budget": budget,
+                "trials": [result["trial"] for result in ladder.ranking(rung)],
+                "promoted": sorted(ladder.promoted[rung]),
+                "converged": [result["trial"] for result in ladder.ranking(rung)
+                              if not result["error"] and result["stop_reason"] != "max_episodes"],
+            }
+            for rung, budget in enumerate(ladder.budgets)
+        ]
+        with open(os.path.join(self.sweep_path, "ladder.json"), "w") as f:
+            json.dump({"scheduler": self.config.SCHEDULER, "reduction_factor": ladder.reduction_factor,
+                       "rungs": rungs, "results": rows}, f, indent=2)
+
+    def write_results(self, results):
+        param_names = list(self.config.SPACE)
+        rung = ["rung"] if any("rung" in result for result in results) else []
+        fields = ["trial", *rung, *param_names, *RESULT_FIELDS, "experiment_path", "error"]
+        with open(os.path.join(self.sweep_path, "results.csv"), "w", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=fields, extrasaction="ignore")
+            writer.writeheader()
+            writer.writerows(results)
+        with open(os.path.join(self.sweep_path, "results.json"), "w") as f:
+            json.dump(results, f, indent=2)
+
@@ -0,0 +1,53 @@
+import math
+import numpy as np
+
+TRACE_MODES = ("watkins", "peng")
+
+
+def trace_length(decay, cutoff, max_length):
+    """Steps before a trace decaying by ``decay`` per step falls below ``cutoff``, at most ``max_length``."""
+    if decay <= 0:
+        return 1
+    if decay >= 1 or cutoff <= 0:
+        return max_length
+    return max(1, min(max_length, int(math.log(cutoff) / math.log(decay)) + 1))
+
+
+class EligibilityTraces:
+    """Replacing traces of the (state, action) pairs visited in the current episode.
+
+    Every trace decays by ``discount * lam`` per step, so only the step each
+    pair was last visited is stored (oldest first) and its trace is
+    ``weights[age]``. Pairs whose trace has fallen below ``cutoff`` are
+    dropped, which bounds the work per step to ``length`` pairs however
+    long the episode runs.
+    """
+
+    def __init__(self, mode="watkins", lam=0.5, discount=0.99, cutoff=0.01, max_length=1000):
+        if mode not in TRACE_MODES:
+            raise ValueError(f"Invalid trace mode: {mode}")
+        self.mode = mode
+        self.decay = discount * lam
+        self.length = trace_length(self.decay, cutoff, max_length)
+        self.weights = self.decay ** np.arange(self.length)
+        self.weight_list = self.weights.tolist()
+        self.visits = {}
+        self.step = 0
+
+    def __len__(self):
+        return len(self.visits)
+
+    def visit(self, pair):
+        """Sets the trace of ``pair`` to 1 and ages every other trace by one step."""
+        visits = self.visits
+        self.step += 1
+        visits.pop(pair, None)
+        visits[pair] = self.step
+        # stamps are distinct, so at most one trace falls below the cutoff per step
+        oldest = next(iter(visits))
+        if visits[oldest] <= self.step - self.length:
+            del visits[oldest]
+
+    def clear(self):
+        self.visits = {}
+        self.step = 0
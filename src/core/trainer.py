@@ -0,0 +1,368 @@
+import datetime
+import json
+import os
+import random
+import shutil
+import time
+import numpy as np
+from .agent import Agent, AgentV2
+from .dungeon_env import DungeonEnv
+from .config import LearningConfig, make_config
+from .profiling import make_profiler
+from .plot_pool import PlotPool, has_display, render_snapshot
+from .q_table import DenseQTable
+from .fused import FusedTrainer
+from .distributed import ActorLearner
+from .convergence import ConvergenceMonitor
+from .metrics import FILENAME as METRICS_FILENAME, MetricsWriter, RollingStats
+from . import checkpoint
+
+AGENT_TYPES = {"Agent": Agent, "AgentV2": AgentV2}
+
+
+def _copy_q_table(q_table):
+    if isinstance(q_table, DenseQTable):
+        return DenseQTable.from_arrays(q_table.encoder, q_table.values.copy(), q_table.visited.copy())
+    return {state: list(actions) for state, actions in q_table.items()}
+
+
+def mask_name(mask):
+    keys = [str(i) for i in range(mask.bit_length()) if mask >> i & 1]
+    return f"Keys {', '.join(keys)}" if keys else "No Keys"
+
+
+def make_agent(config=LearningConfig, q_table=None, env=None):
+    if config.AGENT_TYPE not in AGENT_TYPES:
+        raise ValueError(f"Invalid agent type: {config.AGENT_TYPE}")
+    state_shape = env.state_shape if env is not None else None
+    return AGENT_TYPES[config.AGENT_TYPE](q_table=q_table, config=config, state_shape=state_shape)
+
+
+def new_experiment_path(config=LearningConfig, name=None):
+    name = name or datetime.datetime.now().strftime("%Y%m%d-%H%M%S")
+    experiment_path = os.path.join(config.EXPERIMENTS_DIR, name)
+    os.makedirs(experiment_path, exist_ok=True)
+    return experiment_path
+
+
+class Trainer:
+    def __init__(self, config=LearningConfig, experiment_path=None, verbose=True, checkpoint_state=None):
+        self.config = config
+        self.verbose = verbose
+
+        if config.SEED is not None:
+            np.random.seed(config.SEED)
+            random.seed(config.SEED)
+
+        self.env = DungeonEnv()
+        self.agent = make_agent(config, env=self.env)
+        if config.WARM_START and checkpoint_state is None:
+            from .planning import planned_q_table
+            self.agent.load_q_table(planned_q_table(
+                config.AGENT_TYPE, self.env.model, config.WARM_START, config.DISCOUNT_FACTOR
+            ))
+
+        self.fused = None
+        if config.FUSED_TRAINING:
+            if config.RENDERING_ENABLED or config.PROFILING_ENABLED:
+                raise ValueError("Fused training does not support rendering or profiling.")
+            self.fused = FusedTrainer(self.agent, self.env.model, backend=config.FUSED_BACKEND)
+
+        self.renderer = None
+        if config.RENDERING_ENABLED:
+            from .renderer import Renderer
+            self.renderer = Renderer(self.env.grid_size)
+
+        self.experiment_path = experiment_path
+        if self.experiment_path is None and config.SAVE_RESULTS:
+            self.experiment_path = new_experiment_path(config)
+        elif self.experiment_path:
+            os.makedirs(self.experiment_path, exist_ok=True)
+
+        self.profiler = make_profiler(config, self.experiment_path, verbose=verbose)
+
+        # created before a checkpoint is restored, which also restores the monitor's checks
+        self.convergence = None
+        if config.CONVERGENCE_WINDOW:
+            self.convergence = ConvergenceMonitor.from_config(config, self.agent, self.env.layout)
+
+        # constant-size running statistics; every episode is also appended to the metrics file
+        self.reward_stats = RollingStats(config.METRICS_WINDOW)
+        self.success_stats = RollingStats(config.METRICS_WINDOW)
+        self.start_episode = 0
+        if checkpoint_state is not None:
+            checkpoint.restore(self, checkpoint_state)
+
+        self.actor_learner = None
+        if config.ACTOR_PROCESSES:
+            if self.fused or config.RENDERING_ENABLED or config.PROFILING_ENABLED:
+                raise ValueError("Actor processes do not support fused training, rendering or profiling.")
+            self.actor_learner = ActorLearner.from_config(config, self.agent, self.env, self.start_episode)
+
+        self.metrics = None
+        if self.experiment_path:
+            self.metrics = MetricsWriter(
+                os.path.join(self.experiment_path, METRICS_FILENAME), chunk_size=config.METRICS_CHUNK_SIZE,
+                truncate_to=self.start_episode if checkpoint_state is not None else None
+            )
+
+        self.checkpoint_writer = None
+        if config.CHECKPOINT_INTERVAL and self.experiment_path:
+            self.checkpoint_writer = checkpoint.CheckpointWriter(
+                os.path.join(self.experiment_path, "checkpoints"), keep=config.CHECKPOINT_KEEP
+            )
+
+        self.plot_pool = None
+        if config.GENERATE_PLOTS and config.BACKGROUND_PLOTS and self.experiment_path:
+            self.plot_pool = PlotPool(max_workers=config.PLOT_WORKERS)
+
+    @classmethod
+    def resume(cls, path, max_episodes=None, verbose=True):
+        """Continues the run of an experiment (or checkpoint) directory from its latest checkpoint.
+
+        The config is the one the run was started with, optionally with a
+        new ``MAX_EPISODES``; the RNG state is restored, so the continued run
+        matches an uninterrupted one.
+        """
+        checkpoint_path = checkpoint.latest_checkpoint(path)
+        state = checkpoint.read_checkpoint(checkpoint_path)
+        overrides = state["config"]
+        if max_episodes is not None:
+            overrides["MAX_EPISODES"] = max_episodes
+        config = make_config(LearningConfig, **overrides)
+        experiment_path = os.path.dirname(os.path.dirname(checkpoint_path))
+        return cls(config, experiment_path, verbose=verbose, checkpoint_state=state)
+
+    def _log(self, message):
+        if self.verbose:
+            print(message)
+
+    def _epsilon(self):
+        if hasattr(self.agent, 'policies'):
+            return self.agent.policies[0].epsilon
+        return self.agent.policy.epsilon
+
+    def _q_table_size(self):
+        if hasattr(self.agent, 'policies'):
+            return sum(len(policy.q_table) for policy in self.agent.policies)
+        return len(self.agent.policy.q_table)
+
+    def run_episode(self):
+        env, agent, renderer = self.env, self.agent, self.renderer
+        state = env.reset()
+        done = False
+        terminated = False
+        total_reward = 0
+        steps = 0
+
+        while not done and not terminated:
+            action = agent.choose_action(state)
+            next_state, reward, done, terminated, _ = env.step(action)
+            agent.learn(state, action, reward, next_state, done or terminated)
+            state = next_state
+            total_reward += reward
+            steps += 1
+
+            if renderer:
+                renderer.draw_grid(env.grid)
+
+        return total_reward, done, steps
+
+    def run_episode_profiled(self):
+        # same loop as run_episode with a timer around every phase
+        env, agent, renderer, profiler = self.env, self.agent, self.renderer, self.profiler
+        clock = time.perf_counter
+        state = env.reset()
+        done = False
+        terminated = False
+        total_reward = 0
+        steps = 0
+
+        while not done and not terminated:
+            start = clock()
+            action = agent.choose_action(state)
+            start = profiler.add("choose_action", start)
+            next_state, reward, done, terminated, _ = env.step(action)
+            start = profiler.add("env_step", start)
+            agent.learn(state, action, reward, next_state, done or terminated)
+            start = profiler.add("learn", start)
+            state = next_state
+            total_reward += reward
+            steps += 1
+
+            if renderer:
+                renderer.draw_grid(env.grid)
+                profiler.add("render", start)
+
+        return total_reward, done, steps
+
+    def run(self):
+        profiler = self.profiler
+        run_episode = self.run_episode_profiled if profiler.enabled else self.run_episode
+        start_time = time.perf_counter()
+
+        if self.fused:
+            episodes = self._fused_episodes()
+        elif self.actor_learner:
+            episodes = self._actor_episodes()
+        else:
+            episodes = self._episodes(run_episode)
+        try:
+            self._run_episodes(episodes)
+        finally:
+            episodes.close()
+            if self.checkpoint_writer:
+                self.checkpoint_writer.close()
+            if self.metrics:
+                self.metrics.close()
+
+        self._log("Training completed!")
+        summary = self.summary(time.perf_counter() - start_time)
+        if "throughput" in summary:
+            stats = summary["throughput"]
+            self._log(f"{stats['actors']} actors: {stats['actor_steps_per_s']:,.0f} steps/s, learner "
+                      f"{stats['learner_updates_per_s']:,.0f} updates/s, {stats['policy_syncs']} policy syncs, "
+                      f"{stats['backpressure_waits']} backpressure waits ({stats['backpressure_wait_s']:.1f}s)")
+        if summary.get("plots_dropped"):
+            self._log(f"Skipped {summary['plots_dropped']} progress plots while the plot workers were busy")
+        profiler.close()
+        self.save(summary)
+        return summary
+
+    def _episodes(self, run_episode):
+        for _ in range(self.start_episode, self.config.MAX_EPISODES):
+            total_reward, done, steps = run_episode()
+            yield total_reward, done, steps, self.env.keys_collected, self._epsilon()
+
+    def _fused_episodes(self):
+        cfg = self.config
+        # batches end wherever a checkpoint or plot needs the agent's state
+        intervals = [cfg.FUSED_BATCH_EPISODES] + [
+            interval for interval in (cfg.CHECKPOINT_INTERVAL if self.checkpoint_writer else 0,
+                                      cfg.PLOT_INTERVAL if self.plot_pool else 0,
+                                      cfg.CONVERGENCE_WINDOW) if interval
+        ]
+        episode = self.start_episode
+        while episode < cfg.MAX_EPISODES:
+            end = min([cfg.MAX_EPISODES] + [(episode // interval + 1) * interval for interval in intervals])
+            batch = self.fused.run(end - episode)
+            yield from zip(batch["reward"].tolist(), batch["done"].tolist(), batch["length"].tolist(),
+                           batch["keys"].tolist(), batch["epsilon"].tolist())
+            episode = end
+
+    def _actor_episodes(self):
+        actor_learner = self.actor_learner
+        try:
+            actor_learner.start()
+            yield from actor_learner.episodes(self.config.MAX_EPISODES - self.start_episode)
+        finally:
+            actor_learner.stop()
+
+    def _run_episodes(self, episodes):
+        cfg = self.config
+        profiler = self.profiler
+
+        for episode, (total_reward, done, steps, keys, epsilon) in enumerate(episodes, self.start_episode):
+            self.reward_stats.add(total_reward)
+            self.success_stats.add(done)
+            if self.metrics:
+                self.metrics.append(total_reward, steps, done, epsilon, keys)
+
+            start = time.perf_counter()
+            converged = (self.convergence is not None and self.convergence.due(episode + 1)
+                         and self.convergence.check(episode + 1))
+            if (episode + 1) % 100 == 0 or episode == cfg.MAX_EPISODES - 1 or converged:
+                self._log(f"Episode {episode + 1}/{cfg.MAX_EPISODES}. Total Reward: {total_reward:.2f}. "
+                          f"Avg Reward (last {self.reward_stats.size}): {self.reward_stats.mean:.2f}")
+            elif episode < 10:
+                self._log(f"Episode {episode + 1}/{cfg.MAX_EPISODES}. Total Reward: {total_reward:.2f}.")
+
+            if self.checkpoint_writer and (
+                    (episode + 1) % cfg.CHECKPOINT_INTERVAL == 0 or episode == cfg.MAX_EPISODES - 1 or converged):
+                # the metrics file has to hold every episode the checkpoint covers
+                self.metrics.flush()
+                self.checkpoint_writer.submit(checkpoint.snapshot(self, episode + 1))
+
+            if self.plot_pool and cfg.PLOT_INTERVAL and (episode + 1) % cfg.PLOT_INTERVAL == 0:
+                self.plot_pool.submit(self.plot_snapshot(), os.path.join(
+                    self.experiment_path, "progress", f"episode_{episode + 1:07d}"
+                ))
+
+            if profiler.enabled:
+                profiler.add("reporting", start)
+                profiler.end_episode(episode, steps, self._q_table_size(), epsilon)
+
+            if converged:
+                self._log(f"Stopping after {episode + 1} episodes, {self.convergence.reason()}")
+                break
+
+    def summary(self, wall_time):
+        episodes = self.reward_stats.count
+        return {
+            "episodes": episodes,
+            "final_avg_reward": self.reward_stats.mean,
+            "final_reward_std": self.reward_stats.std,
+            "mean_reward": self.reward_stats.overall_mean,
+            "final_success_rate": self.success_stats.mean,
+            "final_epsilon": float(self._epsilon()) if episodes else None,
+            "stop_reason": self.convergence.reason() if self.convergence else "max_episodes",
+            "wall_time": wall_time,
+            **({"plots_dropped": self.plot_pool.dropped} if self.plot_pool else {}),
+            **({"throughput": self.actor_learner.stats()} if self.actor_learner else {}),
+        }
+
+    def plot_snapshot(self):
+        """Copies of the Q-tables and histories, for plotting while training continues."""
+        tables = []
+        if hasattr(self.agent, 'policies'):
+            for mask, policy in zip(self.agent.masks, self.agent.policies):
+                tables.append((_copy_q_table(policy.q_table), f"_mask_{mask}", f"Policy ({mask_name(mask)})",
+                               f"Value Function ({mask_name(mask)})"))
+        else:
+            tables.append((_copy_q_table(self.agent.policy.q_table), "_single_policy", None,
+                           "Value Function - Single Policy"))
+
+        if self.metrics:
+            self.metrics.flush()
+        return {
+            "grid_size": self.env.grid_size,
+            "annotate_limit": self.config.PLOT_ANNOTATE_LIMIT,
+            "max_image_size": self.config.PLOT_MAX_SIZE,
+            "tile_size": self.config.PLOT_TILE_SIZE,
+            "tables": tables,
+            "metrics_path": self.metrics.path if self.metrics else None,
+        }
+
+    def visualize(self):
+        self._log("Generating visualizations...")
+        show_plots = self.config.VISUALIZE_RESULTS and has_display()
+        if self.plot_pool and not show_plots:
+            self.plot_pool.submit(self.plot_snapshot(), self.experiment_path, drop_if_busy=False)
+        else:
+            render_snapshot(self.plot_snapshot(), self.experiment_path, show_plots=show_plots)
+
+    def save(self, summary=None):
+        if not self.experiment_path:
+            return
+
+        if self.config.GENERATE_PLOTS:
+            self.visualize()
+
+        self.agent.save(self.experiment_path)
+
+        config_source_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'config.py')
+        shutil.copyfile(config_source_path, os.path.join(self.experiment_path, 'config.py'))
+
+        overrides = vars(self.config) if not isinstance(self.config, type) else {}
+        with open(os.path.join(self.experiment_path, 'params.json'), 'w') as f:
+            json.dump(overrides, f, indent=2)
+        if summary is not None:
+            with open(os.path.join(self.experiment_path, 'results.json'), 'w') as f:
+                json.dump(summary, f, indent=2)
+        if self.convergence:
+            self.convergence.save(self.experiment_path, self.reward_stats.count)
+
+        if self.plot_pool:
+            self.plot_pool.close()
+            self.plot_pool = None
+        self._log(f"Results saved to: {self.experiment_path}")
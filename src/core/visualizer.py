@@ -1,9 +1,30 @@
+import os
+import matplotlib
+from .plot_pool import has_display
+
+# without a display interactive backends fail or hang, so default to Agg unless the user chose a backend
+if not has_display() and not os.environ.get("MPLBACKEND"):
+    matplotlib.use("Agg")
+
 import matplotlib.pyplot as plt
 import numpy as np
-import os
 import seaborn as sns
 from .config import EnvConfig as envcfg
 from .config import LearningConfig as lcfg
+from .metrics import MetricsReader
+
+MAX_PLOT_POINTS = 20000
+ANNOTATE_LIMIT = 400        # cells above which heatmaps have no value labels or cell borders
+MAX_IMAGE_SIZE = 256        # cells per side drawn in a figure, larger grids are downsampled
+TICK_LIMIT = 50             # cells per side that still get one tick each
+ARROW_LENGTH = 0.4
+
+# (dx, dy) of the arrow drawn for each action
+ARROW_DELTAS = np.zeros((4, 2))
+ARROW_DELTAS[envcfg.UP] = (0, -ARROW_LENGTH)
+ARROW_DELTAS[envcfg.DOWN] = (0, ARROW_LENGTH)
+ARROW_DELTAS[envcfg.LEFT] = (-ARROW_LENGTH, 0)
+ARROW_DELTAS[envcfg.RIGHT] = (ARROW_LENGTH, 0)
 
 def _get_next_counter(experiment_path, base_name):
     counter = 0
@@ -11,89 +32,162 @@ def _get_next_counter(experiment_path, base_name):
         counter += 1
     return counter
 
-def _draw_action_arrow(x, y, action):
-    if action == envcfg.UP:
-        plt.arrow(y + 0.5, x + 0.5, 0, -0.4, head_width=0.1, head_length=0.1, fc='blue', ec='blue')
-    elif action == envcfg.DOWN:
-        plt.arrow(y + 0.5, x + 0.5, 0, 0.4, head_width=0.1, head_length=0.1, fc='blue', ec='blue')
-    elif action == envcfg.LEFT:
-        plt.arrow(y + 0.5, x + 0.5, -0.4, 0, head_width=0.1, head_length=0.1, fc='blue', ec='blue')
-    elif action == envcfg.RIGHT:
-        plt.arrow(y + 0.5, x + 0.5, 0.4, 0, head_width=0.1, head_length=0.1, fc='blue', ec='blue')
+def can_show_plots():
+    return matplotlib.get_backend().lower() != "agg"
+
+def policy_arrays(q_table, grid_size):
+    """Dense (conditions, values, actions) of a dict or ``DenseQTable`` Q-table, in one pass.
+
+    ``conditions`` are the carry flag tuples present in the table (a single
+    empty tuple for (x, y) tables). ``values`` holds the max Q-value and
+    ``actions`` the greedy action of every cell, shaped (condition, height,
+    width); cells without an entry are NaN and -1, as are the actions of
+    all-zero rows.
+    """
+    if hasattr(q_table, 'visited'):
+        state_ids = np.flatnonzero(q_table.visited)
+        states = np.stack(np.unravel_index(state_ids, q_table.encoder.dims), axis=1)
+        rows = np.asarray(q_table.values[state_ids], dtype=np.float64)
+    else:
+        states = np.array(list(q_table.keys()), dtype=np.int64)
+        rows = np.array(list(q_table.values()), dtype=np.float64)
+    height, width = grid_size
+    inside = (states[:, 0] >= 0) & (states[:, 0] < height) & (states[:, 1] >= 0) & (states[:, 1] < width)
+    states, rows = states[inside], rows[inside]
 
-def _setup_grid_plot(title="Policy Visualization"):
-    plt.xticks(np.arange(envcfg.GRID_SIZE[1] + 1), np.arange(envcfg.GRID_SIZE[1] + 1))
-    plt.yticks(np.arange(envcfg.GRID_SIZE[0] + 1), np.arange(envcfg.GRID_SIZE[0] + 1))
-    plt.grid()
-    plt.title(title)
+    conditions, condition_ids = np.unique(states[:, 2:], axis=0, return_inverse=True)
+    conditions = [tuple(int(c) for c in condition) for condition in conditions]
+    values = np.full((len(conditions), height, width), np.nan)
+    actions = np.full((len(conditions), height, width), -1, dtype=np.int64)
+    index = (condition_ids.reshape(-1), states[:, 0], states[:, 1])
+    values[index] = rows.max(axis=1)
+    actions[index] = np.where(rows.any(axis=1), rows.argmax(axis=1), -1)
+    return conditions, values, actions
+
+def downsample(values, actions, max_size=MAX_IMAGE_SIZE):
+    """Block maxima of ``values`` and every ``factor``-th action, so neither side exceeds ``max_size``."""
+    height, width = values.shape[-2:]
+    factor = -(-max(height, width) // max_size)
+    if factor <= 1:
+        return values, actions, 1
+    padded = np.full(values.shape[:-2] + (-(-height // factor) * factor, -(-width // factor) * factor), np.nan)
+    padded[..., :height, :width] = values
+    blocks = padded.reshape(*values.shape[:-2], padded.shape[-2] // factor, factor,
+                            padded.shape[-1] // factor, factor)
+    # fmax skips NaN and leaves all-NaN blocks NaN without warnings
+    values = np.fmax.reduce(np.fmax.reduce(blocks, axis=-1), axis=-2)
+    return values, actions[..., ::factor, ::factor], factor
+
+def _condition_name(condition):
+    return "".join(str(c) for c in condition) + " keys" if condition else "default"
+
+def _draw_action_arrows(ax, actions, factor=1):
+    # one quiver for the whole grid, arrows start at the cell centres
+    rows, cols = np.nonzero(actions >= 0)
+    deltas = ARROW_DELTAS[actions[rows, cols]] * factor
+    ax.quiver((cols + 0.5) * factor, (rows + 0.5) * factor, deltas[:, 0], deltas[:, 1], color='blue',
+              angles='xy', scale_units='xy', scale=1, width=0.004, headwidth=3, headlength=3)
+
+def _setup_grid_plot(ax, title="Policy Visualization", grid_size=envcfg.GRID_SIZE):
+    height, width = grid_size
+    ax.set_xlim(0, width)
+    ax.set_ylim(0, height)
+    if max(grid_size) <= TICK_LIMIT:
+        ax.set_xticks(np.arange(width + 1))
+        ax.set_yticks(np.arange(height + 1))
+    ax.grid()
+    ax.set_title(title)
+
+def _subplots(count, size):
+    columns = min(count, 4)
+    rows = -(-count // columns)
+    fig, axes = plt.subplots(rows, columns, figsize=(size * columns, size * rows), squeeze=False)
+    for ax in axes.ravel()[count:]:
+        ax.set_visible(False)
+    return fig, axes.ravel()[:count]
 
 
 class PolicyVisualizer:
-    def __init__(self, experiment_path=None, show_plots=None):
+    """Policy, value and training plots of an experiment.
+
+    Q-tables are turned into dense per-condition arrays once per plot, so
+    a plot costs one quiver or image per condition however large the grid
+    is. Grids above ``annotate_limit`` cells lose their value labels, grids
+    wider than ``max_image_size`` cells are downsampled, and with
+    ``tile_size`` the value maps are also written at full resolution as
+    image tiles of ``tile_size`` cells per side.
+    """
+
+    def __init__(self, experiment_path=None, show_plots=None, grid_size=None, annotate_limit=ANNOTATE_LIMIT,
+                 max_image_size=MAX_IMAGE_SIZE, tile_size=0):
         self.experiment_path = experiment_path
+        self.grid_size = tuple(grid_size or envcfg.GRID_SIZE)
         self.show_plots = show_plots if show_plots is not None else lcfg.VISUALIZE_RESULTS
-    
+        self.show_plots = self.show_plots and can_show_plots()
+        self.annotate_limit = annotate_limit
+        self.max_image_size = max_image_size
+        self.tile_size = tile_size
+        # next free file number per base name; the directory is only scanned the first time
+        self._counters = {}
+
+    def visualize_q_table(self, q_table, suffix="", policy_title=None, value_title=None):
+        """Policy and value plots (and value tiles) of one Q-table, converting it only once."""
+        if not q_table:
+            print("Warning: Empty Q-table provided")
+            return
+        arrays = policy_arrays(q_table, self.grid_size)
+        self._visualize_policy(arrays, suffix, policy_title)
+        self._visualize_value_heatmap(arrays, suffix, value_title)
+        if self.tile_size:
+            self.save_value_tiles(arrays, suffix)
+
     def visualize_policy(self, q_table, suffix="", title=None):
         if not q_table:
             print("Warning: Empty Q-table provided")
             return
-            
-        state_sample = next(iter(q_table.keys()))
-        if len(state_sample) == 2:
-            self._visualize_simple_policy(q_table, suffix, title)
-        else:
-            self._visualize_multi_state_policy(q_table, suffix, title)
-    
+        self._visualize_policy(policy_arrays(q_table, self.grid_size), suffix, title)
+
     def visualize_training_progress(self, epsilon_history, reward_history=None, suffix=""):
         self._visualize_epsilon_decay(epsilon_history, suffix)
         if reward_history is not None:
             self._visualize_reward_history(reward_history, suffix)
-    
+
+    def visualize_metrics(self, metrics_path, suffix="", max_points=MAX_PLOT_POINTS):
+        # long runs are read with a stride, so at most max_points records are loaded per column
+        metrics = MetricsReader(metrics_path)
+        if not len(metrics):
+            return
+        factor = metrics.downsample_factor(max_points)
+        self._visualize_epsilon_decay(metrics.column("epsilon", step=factor), suffix, downsample_factor=factor)
+        self._visualize_reward_history(metrics, suffix, downsample_factor=factor)
+
     def visualize_value_heatmap(self, q_table, suffix="", title=None):
         if not q_table:
             print("Warning: Empty Q-table provided")
             return
-            
-        state_sample = next(iter(q_table.keys()))
-        if len(state_sample) == 2:
-            self._visualize_simple_value_heatmap(q_table, suffix, title)
-        else:
-            self._visualize_multi_state_value_heatmap(q_table, suffix, title)
-    
-    def _visualize_simple_policy(self, q_table, suffix="", title=None):
-        fig = plt.figure(figsize=(8, 8))
-        
-        for state, actions in q_table.items():
-            if all(a == 0 for a in actions):
-                continue
-            x, y = state
-            best_action = np.argmax(actions)
-            _draw_action_arrow(x, y, best_action)
-        
-        _setup_grid_plot(title or "Policy Visualization")
-        self._save_and_show(fig, f"policy_simple{suffix}")
-    
-    def _visualize_multi_state_policy(self, q_table, suffix="", title=None):
-        # Group states by condition
-        state_groups = self._group_states_by_condition(q_table)
-        
-        fig = plt.figure(figsize=(15, 5))
-        for i, (condition, states) in enumerate(state_groups.items()):
-            plt.subplot(1, len(state_groups), i + 1)
-            
-            for state, actions in states.items():
-                x, y = state[:2]  # Extract position coordinates
-                best_action = np.argmax(actions)
-                _draw_action_arrow(x, y, best_action)
-            
-            _setup_grid_plot(f"Policy: {condition}")
-        
-        plt.tight_layout()
+        self._visualize_value_heatmap(policy_arrays(q_table, self.grid_size), suffix, title)
+
+    def _visualize_policy(self, arrays, suffix="", title=None):
+        conditions, values, actions = arrays
+        values, actions, factor = downsample(values, actions, self.max_image_size)
+        if conditions == [()]:
+            fig, ax = plt.subplots(figsize=(8, 8))
+            _draw_action_arrows(ax, actions[0], factor)
+            _setup_grid_plot(ax, title or "Policy Visualization", self.grid_size)
+            self._save_and_show(fig, f"policy_simple{suffix}")
+            return
+
+        fig, axes = _subplots(len(conditions), 5)
+        for ax, condition, condition_actions in zip(axes, conditions, actions):
+            _draw_action_arrows(ax, condition_actions, factor)
+            _setup_grid_plot(ax, f"Policy: {_condition_name(condition)}", self.grid_size)
+        fig.tight_layout()
         self._save_and_show(fig, f"policy_multi{suffix}")
-    
-    def _visualize_epsilon_decay(self, epsilon_history, suffix=""):
+
+    def _visualize_epsilon_decay(self, epsilon_history, suffix="", downsample_factor=1):
         fig = plt.figure(figsize=(10, 6))
-        plt.plot(epsilon_history, label='Epsilon Decay', color='orange', linewidth=2)
+        episodes = np.arange(len(epsilon_history)) * downsample_factor
+        plt.plot(episodes, epsilon_history, label='Epsilon Decay', color='orange', linewidth=2)
         plt.xlabel('Episodes')
         plt.ylabel('Epsilon Value')
         plt.title('Exploration Rate Decay Over Time')
@@ -103,11 +197,11 @@ class PolicyVisualizer:
         self._save_and_show(fig, f"epsilon_decay{suffix}")
     
     def _visualize_reward_history(self, reward_history, suffix="", downsample_factor=1):
-        if downsample_factor > 1:
+        if isinstance(reward_history, MetricsReader):
+            reward_history = reward_history.column("reward", step=downsample_factor)
+        elif downsample_factor > 1:
             reward_history = reward_history[::downsample_factor]
-            episodes = np.arange(len(reward_history)) * downsample_factor
-        else:
-            episodes = np.arange(len(reward_history))
+        episodes = np.arange(len(reward_history)) * downsample_factor
         
         fig = plt.figure(figsize=(12, 6))
         plt.plot(episodes, reward_history, alpha=0.7, color='green', linewidth=1)
@@ -127,67 +221,9 @@ class PolicyVisualizer:
         
         self._save_and_show(fig, f"reward_history{suffix}")
     
-    def _group_states_by_condition(self, q_table):
-        groups = {}
-        for state, actions in q_table.items():
-            if len(state) == 4:
-                _, _, c1, c2 = state
-                condition = f"{int(c1)}{int(c2)} keys"
-            else:
-                condition = "default"
-            
-            if condition not in groups:
-                groups[condition] = {}
-            groups[condition][state] = actions
-        
-        return groups
-    
-    def _visualize_simple_value_heatmap(self, q_table, suffix="", title=None):
-        value_grid = np.zeros(envcfg.GRID_SIZE)
-        value_grid.fill(np.nan)
-        
-        for state, actions in q_table.items():
-            x, y = state
-            if 0 <= x < envcfg.GRID_SIZE[0] and 0 <= y < envcfg.GRID_SIZE[1]:
-                value_grid[x, y] = np.max(actions)
-        
-        fig, ax = plt.subplots(figsize=(10, 8))
-        
-        sns.heatmap(value_grid, 
-                    annot=True, 
-                    fmt='.2f', 
-                    cmap='viridis', 
-                    center=0,
-                    square=True,
-                    linewidths=0.5,
-                    cbar_kws={'label': 'Value Function (Max Q-value)'},
-                    ax=ax)
-        
-        ax.set_title(title or "Value Function Heatmap")
-        ax.set_xlabel("Y Coordinate")
-        ax.set_ylabel("X Coordinate")
-        ax.invert_yaxis()
-        
-        self._save_and_show(fig, f"value_heatmap{suffix}")
-    
-    def _visualize_multi_state_value_heatmap(self, q_table, suffix="", title=None):
-        state_groups = self._group_states_by_condition(q_table)
-        
-        n_conditions = len(state_groups)
-        fig, axes = plt.subplots(1, n_conditions, figsize=(6 * n_conditions, 6))
-        
-        if n_conditions == 1:
-            axes = [axes]
-        
-        for idx, (condition, states) in enumerate(state_groups.items()):
-            value_grid = np.zeros(envcfg.GRID_SIZE)
-            value_grid.fill(np.nan)
-            
-            for state, actions in states.items():
-                x, y = state[:2]
-                if 0 <= x < envcfg.GRID_SIZE[0] and 0 <= y < envcfg.GRID_SIZE[1]:
-                    value_grid[x, y] = np.max(actions)
-            
+    def _draw_value_grid(self, ax, value_grid, factor, label):
+        height, width = self.grid_size
+        if factor == 1 and height * width <= self.annotate_limit:
             sns.heatmap(value_grid,
                         annot=True,
                         fmt='.2f',
@@ -195,23 +231,65 @@ class PolicyVisualizer:
                         center=0,
                         square=True,
                         linewidths=0.5,
-                        cbar_kws={'label': 'Value Function'},
-                        ax=axes[idx])
-            
-            axes[idx].set_title(f"Value Function: {condition}")
-            axes[idx].set_xlabel("Y Coordinate")
-            axes[idx].set_ylabel("X Coordinate")
-            axes[idx].invert_yaxis()
-        
-        plt.tight_layout()
+                        cbar_kws={'label': label},
+                        ax=ax)
+            ax.invert_yaxis()
+        else:
+            # one image instead of a mesh of annotated cells
+            image = ax.imshow(value_grid, cmap='viridis', origin='lower', interpolation='nearest',
+                              extent=(0, value_grid.shape[1] * factor, 0, value_grid.shape[0] * factor))
+            ax.set_xlim(0, width)
+            ax.set_ylim(0, height)
+            ax.figure.colorbar(image, ax=ax, label=label)
+        ax.set_xlabel("Y Coordinate")
+        ax.set_ylabel("X Coordinate")
+
+    def _visualize_value_heatmap(self, arrays, suffix="", title=None):
+        conditions, values, actions = arrays
+        values, _, factor = downsample(values, actions, self.max_image_size)
+        if conditions == [()]:
+            fig, ax = plt.subplots(figsize=(10, 8))
+            self._draw_value_grid(ax, values[0], factor, 'Value Function (Max Q-value)')
+            ax.set_title(title or "Value Function Heatmap")
+            self._save_and_show(fig, f"value_heatmap{suffix}")
+            return
+
+        fig, axes = _subplots(len(conditions), 6)
+        for ax, condition, value_grid in zip(axes, conditions, values):
+            self._draw_value_grid(ax, value_grid, factor, 'Value Function')
+            ax.set_title(f"Value Function: {_condition_name(condition)}")
+        fig.tight_layout()
         self._save_and_show(fig, f"multi_value_heatmap{suffix}")
-    
+
+    def save_value_tiles(self, arrays, suffix=""):
+        """Writes the value maps of ``policy_arrays`` at one pixel per cell in tiles; returns their directory."""
+        if not self.experiment_path:
+            return None
+        conditions, values, _ = arrays
+        directory = os.path.join(self.experiment_path, f"value_tiles{suffix}")
+        os.makedirs(directory, exist_ok=True)
+        # one color scale for every tile; cells without a value are transparent
+        finite = values[np.isfinite(values)]
+        vmin, vmax = (finite.min(), finite.max()) if finite.size else (0, 1)
+        tile = self.tile_size
+        for condition, value_grid in zip(conditions, values):
+            name = "".join(str(c) for c in condition) or "values"
+            for row in range(0, value_grid.shape[0], tile):
+                for col in range(0, value_grid.shape[1], tile):
+                    plt.imsave(os.path.join(directory, f"{name}_{row // tile}_{col // tile}.png"),
+                               value_grid[row:row + tile, col:col + tile], cmap='viridis', vmin=vmin, vmax=vmax,
+                               origin='lower')
+        return directory
+
     def _save_and_show(self, fig, base_filename):
         if self.show_plots:
             plt.show()
         
         if self.experiment_path:
-            counter = _get_next_counter(self.experiment_path, base_filename)
+            if base_filename not in self._counters:
+                self._counters[base_filename] = _get_next_counter(self.experiment_path, base_filename)
+            counter = self._counters[base_filename]
+            self._counters[base_filename] += 1
             filename = f"{base_filename}_{counter}.png"
             fig.savefig(f"{self.experiment_path}/{filename}", dpi=300, bbox_inches='tight')
         
@@ -0,0 +1,28 @@
+from core.evaluation import evaluate_experiments
+from core.config import TestConfig as cfg
+import argparse
+import glob
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Greedy evaluation of many experiment directories.")
+    parser.add_argument("experiments", nargs="+", help="experiment directories (globs allowed)")
+    parser.add_argument("--episodes", type=int, default=cfg.MAX_EPISODES)
+    parser.add_argument("--max-steps", type=int, default=cfg.MAX_STEPS)
+    parser.add_argument("--random-starts", action="store_true", default=cfg.RANDOM_STARTS)
+    parser.add_argument("--seed", type=int, default=cfg.EVAL_SEED)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--output", default="evaluation.csv", help="consolidated CSV, best first")
+    args = parser.parse_args()
+
+    paths = sorted({path for pattern in args.experiments for path in glob.glob(pattern)})
+    results = evaluate_experiments(
+        paths, max_workers=args.workers, output_path=args.output,
+        episodes=args.episodes, max_steps=args.max_steps, random_starts=args.random_starts, seed=args.seed
+    )
+    failed = sum(1 for result in results if result["error"])
+    print(f"Evaluated {len(results) - failed} experiments ({failed} failed). Results saved to: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
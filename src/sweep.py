@@ -0,0 +1,17 @@
+from core.sweep import Sweep
+from core.config import SweepConfig as cfg
+
+def main():
+    sweep = Sweep(cfg)
+    results = sweep.run()
+
+    print("Sweep completed! Best trials:")
+    for result in results[:5]:
+        if not result["error"]:
+            params = ", ".join(f"{name}={result[name]}" for name in cfg.SPACE)
+            print(f"  {result['final_avg_reward']:8.2f}  {params}")
+    print(f"Results saved to: {sweep.sweep_path}")
+
+
+if __name__ == "__main__":
+    main()
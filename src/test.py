@@ -1,42 +1,74 @@
-from core import DungeonEnv, AgentV2, Agent, Renderer
+from core import DungeonEnv, Renderer, load_agent
 from core.config import TestConfig as cfg
-import pickle as pkl
-import glob
+from core.evaluation import evaluate_agent
+from core.recorder import EpisodeRecorder
 import os
 
 
-def main():
-
-    if cfg.EXPERIMENT_PATH:
-        q_tables = glob.glob(os.path.join(cfg.EXPERIMENT_PATH, "q_table_policy_*.pkl"))
-        if not q_tables:
-            raise FileNotFoundError("No q_table files found in the specified experiment path.")
-        elif len(q_tables) != 1 and len(q_tables) != 3:
-            raise ValueError("Expected either 1 or 3 Q-table files, found: {}".format(len(q_tables)))
-
-        q_tables = sorted(q_tables, key=lambda x: int(x.split('q_table_policy_')[1].split('.')[0]))
-        q_tables_loaded = [pkl.load(open(q_table, 'rb')) for q_table in q_tables]
-
-        if len(q_tables) == 1:
-            agent = Agent(q_table=q_tables_loaded[0])
-        elif len(q_tables) == 3:
-            agent = AgentV2(q_table=q_tables_loaded)
-
-
+def render_episodes(agent):
     env = DungeonEnv()
-    renderer = Renderer()
+    renderer = Renderer(env.grid_size, headless=cfg.HEADLESS)
+
+    recorder = None
+    if cfg.RECORD:
+        recorder = EpisodeRecorder(
+            os.path.join(cfg.EXPERIMENT_PATH, "recordings"),
+            format=cfg.RECORD_FORMAT,
+            frame_skip=cfg.FRAME_SKIP,
+            episodes=cfg.RECORD_EPISODES
+        )
 
-    while True:
+    for episode in range(cfg.RENDER_EPISODES):
         state = env.reset()
         done = False
         terminated = False
+        steps = 0
+
+        if recorder:
+            recorder.start_episode(episode)
+        # headless episodes that are not being recorded skip rendering entirely
+        render = not cfg.HEADLESS or (recorder and recorder.recording)
+
+        if render:
+            renderer.draw_grid(env.grid)
+            if recorder:
+                recorder.add_frame(renderer.frame())
 
-        while not done and not terminated:
+        while not done and not terminated and steps < cfg.MAX_STEPS:
             action = agent.choose_action(state)
             next_state, _, done, terminated, _ = env.step(action)
             state = next_state
-            renderer.draw_grid(env.grid)
+            steps += 1
+
+            if render:
+                renderer.draw_grid(env.grid)
+                if recorder:
+                    recorder.add_frame(renderer.frame())
+
+        if recorder:
+            recorder.end_episode()
+
+    if recorder:
+        recorder.close()
+
+
+def main():
+    agent = load_agent(cfg.EXPERIMENT_PATH)
+
+    result = evaluate_agent(agent, episodes=cfg.MAX_EPISODES, max_steps=cfg.MAX_STEPS,
+                            random_starts=cfg.RANDOM_STARTS, seed=cfg.EVAL_SEED)
+    print(f"Evaluated {result['episodes']} greedy episodes in {result['eval_time']:.3f}s "
+          f"({result['episodes_per_second']:,.0f} episodes/s)")
+    print(f"  success rate:       {result['success_rate']:.3f}")
+    print(f"  mean reward:        {result['mean_reward']:.2f}")
+    print(f"  timeout rate:       {result['timeout_rate']:.3f}")
+    if result["path_length_ratio"] is not None:
+        print(f"  path length ratio:  {result['path_length_ratio']:.3f} "
+              f"(mean {result['mean_length']:.1f} steps, shortest {result['mean_shortest_path']:.1f})")
+
+    if not cfg.HEADLESS or cfg.RECORD:
+        render_episodes(agent.freeze())
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,50 @@
+import pickle
+import pytest
+from core.agent import load_agent
+from core.config import EnvConfig, LearningConfig
+from core.evaluation import evaluate_agent
+from core.layout import get_layout
+from core.trainer import Trainer
+
+
+@pytest.mark.parametrize("agent_type", ["Agent", "AgentV2"])
+@pytest.mark.parametrize("storage", ["dict", "dense"])
+def test_pickled_run_on_generated_layout(tmp_path, monkeypatch, agent_type, storage):
+    monkeypatch.setattr(EnvConfig, "GENERATE_LAYOUT", True)
+    monkeypatch.setattr(EnvConfig, "GENERATED_GRID_SIZE", (15, 21))
+    monkeypatch.setattr(EnvConfig, "NUM_KEYS", 3)
+
+    class Config(LearningConfig):
+        AGENT_TYPE = agent_type
+        SEED = 0
+        MAX_EPISODES = 20
+        Q_TABLE_STORAGE = storage
+        Q_TABLE_FORMAT = "pickle"
+        CHECKPOINT_INTERVAL = 0
+        GENERATE_PLOTS = False
+        VISUALIZE_RESULTS = False
+
+    trainer = Trainer(Config, experiment_path=str(tmp_path), verbose=False)
+    trainer.run()
+    layout = get_layout()
+
+    loaded = load_agent(str(tmp_path))
+    assert evaluate_agent(loaded, layout=layout, episodes=4)["episodes"] == 4
+    assert (loaded.freeze().actions == trainer.agent.freeze().actions).all()
+
+
+def test_count_flag_pickle_is_remapped(tmp_path):
+    # before per-key flags, (x, y, 1, 0) meant "one key carried", whichever key it was
+    legacy = {(5, 2, 0, 0): [0.0, 1.0, 0.0, 0.0], (4, 2, 1, 0): [0.0, 0.0, 2.0, 0.0],
+              (3, 2, 1, 1): [0.0, 0.0, 0.0, 3.0]}
+    with open(tmp_path / "q_table.pkl", "wb") as f:
+        pickle.dump(legacy, f)
+
+    loaded = load_agent(str(tmp_path), storage="dense")
+    assert [loaded.greedy_action(state) for state in [(5, 2, 0, 0), (4, 2, 1, 0), (4, 2, 0, 1), (3, 2, 1, 1)]] \
+        == [1, 2, 2, 3]
+
+    # tables saved since then are read back as they are
+    loaded.policy.q_table[(4, 2, 0, 1)] = [0.0, 0.0, 0.0, 4.0]
+    loaded.save(str(tmp_path))
+    assert load_agent(str(tmp_path)).greedy_action((4, 2, 0, 1)) == 3